@@ -3,6 +3,14 @@
 echo "Setting up DB"
 python -c "from src.server.db import setup_db; setup_db()"
 
-# run gunicorn wsgi server with 2 worker processes on port 8000 in container
+if [ "$CONNECT_5_SERVER" = "asgi" ]; then
+    # run the asyncio app on the uvicorn asgi server, on port 8000
+    echo "Starting uvicorn asgi server."
+    exec uvicorn src.server.asgi:app --host 0.0.0.0 --port 8000
+fi
+
+# run gunicorn wsgi server with 2 worker processes on port 8000 in container,
+# with threads so requests held waiting for a game to change don't block, at
+# most CONNECT_5_MAX_HELD (default 24) of each worker's 32 threads are held
 echo "Starting gunicorn wsgi server."
-gunicorn src.server.app:app -w 2 -b :8000
+gunicorn src.server.app:app -w 2 --threads 32 -b :8000
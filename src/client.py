@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 """Client module for communicating with server and displaying game state."""
+import json
 import sys
 import time
 import signal
@@ -9,16 +10,22 @@ SERVER_URL = "http://127.0.0.1"
 GAME_URL = f"{SERVER_URL}/game"
 
 WAIT_INTERVAL = 2
-ACCEPTED_COLUMNS = [num for num in range(1, 10)]
+# seconds the server may hold a poll until the game changes
+LONG_POLL_WAIT = 20
 JOIN_GAME = "1"
 NEW_2P_GAME = "2"
 NEW_3P_GAME = "3"
-ACCEPTED_GAME_TYPES = (JOIN_GAME, NEW_2P_GAME, NEW_3P_GAME)
+NEW_COMPUTER_GAME = "4"
+ACCEPTED_GAME_TYPES = (JOIN_GAME, NEW_2P_GAME, NEW_3P_GAME, NEW_COMPUTER_GAME)
+COMPUTER = "computer"
 
 GAME_WON = "won"
 GAME_DISCONNECTED = "disconnected"
+EMPTY = "-"
 BOARD_ROWS = 6
 BOARD_COLS = 9
+BOARD_PARAMS = {"board_format": "compact"}
+BOARD_FORMAT_VERSION = "1"
 
 
 def prompt_user(message):
@@ -38,6 +45,7 @@ def connect():
         "1. Join existing game\n"
         "2. Create new two player game\n"
         "3. Create new three player game\n"
+        "4. Play against the computer\n"
         "Select game type: "
     )
 
@@ -45,7 +53,7 @@ def connect():
         game_type = prompt_user(message)
         if game_type in ACCEPTED_GAME_TYPES:
             break
-        message = "Invalid choice, please select 1, 2 or 3: "
+        message = "Invalid choice, please select 1, 2, 3 or 4: "
 
     if game_type == JOIN_GAME:
         while True:
@@ -59,11 +67,17 @@ def connect():
             else:
                 response.raise_for_status()
     else:
-        max_players = int(game_type)
-        body = {
-            "name": name,
-            "max_players": max_players,
-        }
+        if game_type == NEW_COMPUTER_GAME:
+            body = {
+                "name": name,
+                "max_players": 2,
+                "opponent": COMPUTER,
+            }
+        else:
+            body = {
+                "name": name,
+                "max_players": int(game_type),
+            }
         response = requests.post(GAME_URL, json=body)
         if response.status_code == requests.codes.created:
             game_id = response.json()["game_id"]
@@ -72,20 +86,43 @@ def connect():
             response.raise_for_status()
 
 
+def decode_board(data):
+    """Decode the server's compact "<version>:<rows>:<cells>" board."""
+    version, rows, cells = data.split(":", 2)
+    if version != BOARD_FORMAT_VERSION:
+        raise ValueError(f"Unknown board format version: {version}")
+    rows = int(rows)
+    return [list(cells[idx:idx + rows]) for idx in range(0, len(cells), rows)]
+
+
 def display_board(board):
     """Display the state of the board to the user."""
-    for row_idx in range(BOARD_ROWS):
-        row = " ".join(board[col_idx][row_idx]
-                       for col_idx in range(BOARD_COLS))
+    if isinstance(board, str):
+        board = decode_board(board)
+    for row_idx in range(len(board[0])):
+        row = " ".join(column[row_idx] for column in board)
         print(row)
 
 
+def drop_disc(board, column, disc):
+    """Drop the disc into the column (1 based) of the board."""
+    cells = board[column - 1]
+    row = len(cells) - 1 - cells[::-1].index(EMPTY)
+    cells[row] = disc
+
+
 class Client:
     """Class representing a connected player in game."""
 
     def __init__(self, player_name, game_id):
         self.name = player_name
         self.game_id = game_id
+        self.columns = BOARD_COLS
+        # keeps the connection to the server open between requests
+        self.session = requests.Session()
+        # the last game state polled and its ETag, to ask if it has changed
+        self.game_state = None
+        self.etag = None
 
     @property
     def client_game_url(self):
@@ -99,46 +136,82 @@ class Client:
             self.disconnect("Game over, could not process request.")
 
     def get_game_state(self):
-        """Poll server for current game state."""
-        response = requests.get(self.client_game_url)
-        response.raise_for_status()
-        response_data = response.json()
+        """Poll server for current game state.
+
+        The server answers 304 Not Modified, with no body, if the game hasn't
+        changed since the last poll. Once the game has a version (its ETag)
+        the server holds the poll until the game changes from it, or for up
+        to LONG_POLL_WAIT seconds, and the client doesn't sleep in between,
+        unless the server was too busy to hold it (it sent a Retry-After).
+        """
+        if self.etag:
+            headers = {"If-None-Match": self.etag}
+            # the ETag is "<version>-<board format>-<fields>"
+            version = self.etag.strip('"').split("-")[0]
+            params = dict(BOARD_PARAMS, wait=LONG_POLL_WAIT, since=version)
+        else:
+            headers = {}
+            params = BOARD_PARAMS
+        response = self.session.get(
+            self.client_game_url, params=params, headers=headers)
+        retry_after = response.headers.get("Retry-After")
+        if response.status_code == requests.codes.not_modified:
+            response_data = self.game_state
+        else:
+            response.raise_for_status()
+            response_data = response.json()
+            self.game_state = response_data
+            self.etag = response.headers.get("ETag")
         turn = response_data["turn"]
         game_status = response_data["game_status"]
         if game_status == GAME_WON:
-            board = response.json().get("board")
+            board = response_data.get("board")
             display_board(board)
             exit_game(f"Game over, {turn} has won.")
         elif game_status == GAME_DISCONNECTED:
             exit_game(f"Game over, other player disconnected.")
         elif turn == self.name:
-            display_board(response_data["board"])
+            board = response_data["board"]
+            if isinstance(board, str):
+                board = decode_board(board)
+            self.columns = len(board)
+            display_board(board)
             self.make_move()
         else:
             if turn is None:
                 print("Waiting for another player to join . . .")
             else:
                 print(f"Waiting on player {turn} . . .")
-            time.sleep(WAIT_INTERVAL)
+            if not self.etag:
+                time.sleep(WAIT_INTERVAL)
+            elif retry_after:
+                time.sleep(float(retry_after))
 
     def make_move(self):
         """Get valid move from player and communicate move to server."""
-        message = f"It's your turn {self.name}, please enter column (1 - 9): "
+        columns = f"(1 - {self.columns})"
+        message = (
+            f"It's your turn {self.name}, please enter column {columns}: ")
         while True:
             column = prompt_user(message)
             try:
                 column = int(column)
-                assert column in ACCEPTED_COLUMNS
+                assert 1 <= column <= self.columns
             except (AssertionError, ValueError):
-                message = "Invalid choice, please enter column (1 - 9): "
+                message = f"Invalid choice, please enter column {columns}: "
             else:
                 data = {
                     "column": column,
                     "name": self.name,
                 }
-                response = requests.patch(self.client_game_url, json=data)
+                response = self.session.patch(
+                    self.client_game_url, json=data, params=BOARD_PARAMS)
                 if response.status_code == requests.codes.bad_request:
                     message = f"Column {column} is full, please try another: "
+                elif response.status_code == requests.codes.conflict:
+                    # the game moved on, e.g. it's over, poll it again
+                    print(response.json().get("message"))
+                    break
                 elif response.status_code == requests.codes.ok:
                     board = response.json().get("board")
                     display_board(board)
@@ -149,6 +222,52 @@ class Client:
                 else:
                     response.raise_for_status()
 
+    def subscribe(self):
+        """Yield the game's (event, data) from the server as they happen.
+
+        The server pushes them as Server-Sent Events, over one connection
+        held open, until the game is over. While the server is too busy to
+        hold the stream it's asked for again, after its Retry-After.
+        """
+        while True:
+            response = self.session.get(
+                f"{self.client_game_url}/events", params=BOARD_PARAMS,
+                stream=True)
+            if response.status_code != \
+                    requests.codes.service_unavailable:
+                break
+            time.sleep(float(response.headers.get("Retry-After",
+                                                  WAIT_INTERVAL)))
+        response.raise_for_status()
+        event, data = None, []
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
+            elif not line and data:
+                yield event, json.loads("\n".join(data))
+                event, data = None, []
+
+    def spectate(self):
+        """Display the game as it's played, until it's over."""
+        board = None
+        for event, data in self.subscribe():
+            if event == "state":
+                board = data["board"]
+                if isinstance(board, str):
+                    board = decode_board(board)
+                display_board(board)
+            elif event == "move":
+                drop_disc(board, data["column"], data["disc"])
+                print(f"{data['name']} played column {data['column']}.")
+                display_board(board)
+            elif event == "status" and data["game_status"] == GAME_WON:
+                exit_game(f"Game over, {data['turn']} has won.")
+            elif event == "status" and \
+                    data["game_status"] == GAME_DISCONNECTED:
+                exit_game("Game over, a player disconnected.")
+
     def signal_handler(self, sig_num, frame):
         self.disconnect("Game over, you disconnected.")
 
@@ -165,12 +284,16 @@ class Client:
     def disconnect(self, message):
         """Connected client leaves the game, inform server to end game."""
         disconnected_body = {"game_status": GAME_DISCONNECTED}
-        requests.patch(self.client_game_url, json=disconnected_body)
+        self.session.patch(self.client_game_url, json=disconnected_body)
         exit_game(message)
 
 
 if __name__ == "__main__":
     try:
+        if len(sys.argv) == 3 and sys.argv[1] == "watch":
+            # spectate the game: client.py watch <game_id>
+            Client(None, sys.argv[2]).spectate()
+            exit_game("Stopped watching the game.")
         name, game_id = connect()
         client = Client(name, game_id)
         client.register_signal_handlers()
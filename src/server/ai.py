@@ -0,0 +1,252 @@
+"""Server module for searching for the computer opponent's move."""
+import os
+import random
+import time
+
+from collections import namedtuple
+from functools import lru_cache
+
+from src.server.bitboard import BitBoard
+from src.server.lines import get_winning_lines
+
+# Seconds the search may take before it must return its best move so far
+TIME_BUDGET = float(os.environ.get("CONNECT_5_AI_TIME_BUDGET", 1.0))
+# Maximum number of positions kept in the transposition table
+TABLE_SIZE = int(os.environ.get("CONNECT_5_AI_TABLE_SIZE", 100000))
+# Number of line masks evaluated between checks of the clock, the nodes
+# searched between checks are fewer on bigger boards, with more lines
+LINES_PER_CLOCK_CHECK = 16384
+
+WIN_SCORE = 1000000
+EXACT, LOWER_BOUND, UPPER_BOUND = range(3)
+
+SearchResult = namedtuple(
+    "SearchResult", ["column", "score", "depth", "nodes", "seconds"])
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search once the time budget has been used up."""
+
+
+@lru_cache(maxsize=16)
+def get_line_masks(cols, rows, winning_count):
+    """Return the bitboard mask of every winning line on this board size."""
+    bitboard = BitBoard(cols, rows, winning_count, ())
+    lines = {line for cell_lines in get_winning_lines(
+        cols, rows, winning_count).values() for line in cell_lines}
+    masks = []
+    for line in lines:
+        mask = 0
+        for column, row in line:
+            mask |= 1 << bitboard.position(column, row)
+        masks.append(mask)
+    return tuple(masks)
+
+
+@lru_cache(maxsize=16)
+def get_zobrist_keys(cols, rows, num_discs):
+    """Return a random 64 bit key for each disc, for each bit position."""
+    rand = random.Random(cols * 1000 + rows)
+    num_positions = cols * (rows + 1)
+    return tuple(tuple(rand.getrandbits(64) for _ in range(num_positions))
+                 for _ in range(num_discs))
+
+
+class Searcher:
+    """Negamax search with alpha-beta pruning and iterative deepening.
+
+    Positions already searched are kept in a transposition table keyed by a
+    Zobrist hash of the position, the table is bounded to table_size entries.
+    """
+
+    def __init__(self, bitboard, discs, time_budget=None, table_size=None):
+        self.bitboard = bitboard
+        self.discs = discs
+        self.time_budget = TIME_BUDGET if time_budget is None else \
+            time_budget
+        self.table_size = TABLE_SIZE if table_size is None else table_size
+        self.table = {}
+        self.nodes = 0
+        self.deadline = None
+        self.keys = dict(zip(discs, get_zobrist_keys(
+            bitboard.cols, bitboard.rows, len(discs))))
+        self.line_masks = get_line_masks(
+            bitboard.cols, bitboard.rows, bitboard.winning_count)
+        self.nodes_per_clock_check = max(
+            1, LINES_PER_CLOCK_CHECK // max(len(self.line_masks), 1))
+        # scores beyond this are wins (or losses) within the board's moves
+        self.win_threshold = WIN_SCORE - bitboard.cols * bitboard.rows - 1
+        # weight of a line holding this many discs of only one player
+        self.weights = [0] + [4 ** count
+                              for count in range(bitboard.winning_count)]
+        centre = (bitboard.cols - 1) / 2
+        self.column_order = sorted(range(bitboard.cols),
+                                   key=lambda column: abs(column - centre))
+        self.hash = 0
+        for disc in discs:
+            bits = bitboard.bits[disc]
+            for position, key in enumerate(self.keys[disc]):
+                if bits >> position & 1:
+                    self.hash ^= key
+
+    def search(self):
+        """Search deeper until out of time, return the best move found."""
+        start = time.monotonic()
+        self.deadline = start + self.time_budget
+        player, opponent = self.discs
+        bitboard = self.bitboard
+        start_position = (dict(bitboard.bits), list(bitboard.heights),
+                          self.hash)
+        empty_cells = sum(bitboard.rows - height
+                          for height in bitboard.heights)
+        best_column, best_score, depth_reached = None, 0, 0
+        for depth in range(1, empty_cells + 1):
+            try:
+                score, column = self.negamax(
+                    depth, -WIN_SCORE - 1, WIN_SCORE + 1, 0, player,
+                    opponent)
+            except SearchTimeout:
+                # put back the discs of the search that was cut short
+                bits, heights, self.hash = start_position
+                bitboard.bits.update(bits)
+                bitboard.heights[:] = heights
+                break
+            best_column, best_score, depth_reached = column, score, depth
+            if abs(score) > WIN_SCORE - depth - 1:
+                # the game is decided whatever the deeper search finds
+                break
+        if best_column is None:
+            # not even the first depth finished, play any legal move
+            best_column = next(iter(self.legal_columns(None)), None)
+        return SearchResult(best_column, best_score, depth_reached,
+                            self.nodes, time.monotonic() - start)
+
+    def legal_columns(self, first_column):
+        """Columns with space, the table's best move then centre out."""
+        heights = self.bitboard.heights
+        rows = self.bitboard.rows
+        columns = [column for column in self.column_order
+                   if heights[column] < rows and column != first_column]
+        if first_column is not None and heights[first_column] < rows:
+            columns.insert(0, first_column)
+        return columns
+
+    def evaluate(self, player, opponent):
+        """Score the position by counting the lines still open to each."""
+        player_bits = self.bitboard.bits[player]
+        opponent_bits = self.bitboard.bits[opponent]
+        weights = self.weights
+        score = 0
+        for mask in self.line_masks:
+            mine = player_bits & mask
+            theirs = opponent_bits & mask
+            if mine and not theirs:
+                score += weights[bin(mine).count("1")]
+            elif theirs and not mine:
+                score -= weights[bin(theirs).count("1")]
+        return score
+
+    def negamax(self, depth, alpha, beta, ply, player, opponent):
+        """Return (score, column) of the best move for player."""
+        self.nodes += 1
+        if self.nodes % self.nodes_per_clock_check == 0 and \
+                time.monotonic() > self.deadline:
+            raise SearchTimeout()
+
+        original_alpha = alpha
+        best_column = None
+        entry = self.table.get(self.hash)
+        if entry is not None:
+            entry_depth, entry_score, entry_flag, best_column = entry
+            entry_score = self.score_from_table(entry_score, ply)
+            if entry_depth >= depth:
+                if entry_flag == EXACT:
+                    return entry_score, best_column
+                elif entry_flag == LOWER_BOUND:
+                    alpha = max(alpha, entry_score)
+                else:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score, best_column
+
+        if depth == 0:
+            return self.evaluate(player, opponent), None
+
+        columns = self.legal_columns(best_column)
+        if not columns:
+            # board full, draw
+            return 0, None
+
+        bitboard = self.bitboard
+        best_score = -WIN_SCORE - 1
+        for column in columns:
+            key = self.keys[player][
+                column * bitboard.stride + bitboard.heights[column]]
+            row = bitboard.drop(column, player)
+            self.hash ^= key
+            if bitboard.has_won(player, column, row):
+                # prefer the quickest win
+                score = WIN_SCORE - ply
+            else:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1,
+                                      opponent, player)[0]
+            bitboard.undo(column, player)
+            self.hash ^= key
+            if score > best_score:
+                best_score, best_column = score, column
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.store(depth, self.score_to_table(best_score, ply), flag,
+                   best_column)
+        return best_score, best_column
+
+    def score_to_table(self, score, ply):
+        """Return the score counting wins from this position, not the root.
+
+        A win is scored WIN_SCORE - ply, ply counted from the root, so the
+        table keeps it as plies from the position, which may be reached again
+        at another ply.
+        """
+        if score > self.win_threshold:
+            return score + ply
+        if score < -self.win_threshold:
+            return score - ply
+        return score
+
+    def score_from_table(self, score, ply):
+        """Return the table's score counting wins from the root again."""
+        if score > self.win_threshold:
+            return score - ply
+        if score < -self.win_threshold:
+            return score + ply
+        return score
+
+    def store(self, depth, score, flag, column):
+        """Add the position to the table, evicting the oldest if it's full."""
+        if self.hash not in self.table and \
+                len(self.table) >= self.table_size:
+            del self.table[next(iter(self.table))]
+        self.table[self.hash] = (depth, score, flag, column)
+
+
+def find_move(board, rows, winning_count, disc, opponent_disc, empty,
+              time_budget=None):
+    """Search for disc's best move on the board, return a SearchResult.
+
+    The result's column is a 0 based index, or None if the board is full.
+    """
+    discs = (disc, opponent_disc)
+    bitboard = BitBoard.from_board(board, rows, winning_count, discs, empty)
+    result = Searcher(bitboard, discs, time_budget).search()
+    nodes_per_sec = result.nodes / max(result.seconds, 1e-6)
+    print(f"Searched {result.nodes} nodes to depth {result.depth} in "
+          f"{result.seconds:.3f}s ({nodes_per_sec:.0f} nodes/sec).")  # log
+    return result
@@ -1,74 +1,110 @@
-"""Server module containing application instance and RESTful API."""
-import json
+"""Server module containing application instance and RESTful API.
 
-from flask import request
+The requests are handled by views.py, their db calls made in the request's
+thread. Long polls and event streams hold their thread while they wait on the
+game, so only MAX_HELD of them are held at once, leaving threads for moves.
+Past that polls are answered at once and streams refused, with a Retry-After.
+"""
+import os
+import threading
+
+from flask import Response, request, stream_with_context
 from flask_api import FlaskAPI, status
 
-from src.server.game import Game
-from src.server.game_finder import get_game_finder
-from src.server.utils import DecimalEncoder
+from src.server import views
+from src.server.calls import run_stream, run_view
 
+# requests each process may hold waiting on games, fewer than its threads
+MAX_HELD = int(os.environ.get("CONNECT_5_MAX_HELD", 24))
+# seconds the client is asked to wait before polling again, when not held
+RETRY_AFTER = 2
 
 app = FlaskAPI(__name__)
-
-RESPONSE_HEADERS = {"Content-Type": "application/json"}
+held_requests = threading.BoundedSemaphore(MAX_HELD)
 
 
 @app.route("/game", methods=["POST"])
 def create_game():
     """Create a new game for the new player."""
-    name = request.json.get("name")
-    max_players = request.json.get("max_players")
-    game_id = Game.start_new_game(name, max_players)
-    return {"game_id": game_id}, status.HTTP_201_CREATED, RESPONSE_HEADERS
+    return run_view(views.create_game(request.json))
 
 
 @app.route("/game", methods=["PATCH"])
 def update_game_new_player():
     """Update an available game by adding the new player to it."""
-    name = request.json.get("name")
-    game_finder = get_game_finder()
-    game_id = game_finder.join_game(name)
-    if game_id is None:
-        status_code = status.HTTP_404_NOT_FOUND
-    else:
-        status_code = status.HTTP_200_OK
-    return {"game_id": game_id}, status_code, RESPONSE_HEADERS
+    return run_view(views.update_game_new_player(request.json))
 
 
 @app.route("/game/<game_id>", methods=["GET"])
 def get_game(game_id):
-    """Get the specified game."""
-    game = Game(game_id)
-    game.load_game()
-    response_body = json.dumps(game.game, cls=DecimalEncoder)
-    return response_body, status.HTTP_200_OK, RESPONSE_HEADERS
+    """Get the specified game, see views.get_game.
+
+    A long poll is answered at once if MAX_HELD requests are already held.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if "wait" not in request.args:
+        return run_view(views.get_game(game_id, request.args, if_none_match))
+    if not held_requests.acquire(blocking=False):
+        args = request.args.to_dict()
+        del args["wait"]
+        body, status_code, headers = run_view(
+            views.get_game(game_id, args, if_none_match))
+        return body, status_code, dict(headers, **{
+            "Retry-After": str(RETRY_AFTER)})
+    try:
+        return run_view(views.get_game(game_id, request.args, if_none_match))
+    finally:
+        held_requests.release()
+
+
+@app.route("/game/<game_id>/events", methods=["GET"])
+def get_game_events(game_id):
+    """Stream the game's changes as Server-Sent Events, see events.py.
+
+    The stream is refused (503) if MAX_HELD requests are already held.
+    """
+    if not held_requests.acquire(blocking=False):
+        message = "Service unavailable, too many requests waiting on games."
+        return {"message": message}, status.HTTP_503_SERVICE_UNAVAILABLE, \
+            dict(views.RESPONSE_HEADERS, **{"Retry-After": str(RETRY_AFTER)})
+    try:
+        messages, status_code, headers = run_view(
+            views.get_game_events(game_id, request.args))
+        response = Response(stream_with_context(run_stream(messages)),
+                            status=status_code, headers=headers)
+    except BaseException:
+        held_requests.release()
+        raise
+    # released once the stream has been sent, or the client has gone
+    response.call_on_close(held_requests.release)
+    return response
 
 
 @app.route("/game/<game_id>", methods=["PATCH"])
 def update_game(game_id):
     """Update the specified game (make a move or end a game)."""
-    game = Game(game_id)
-    game.load_game()
-    if request.json.get("game_status") == Game.DISCONNECTED:
-        game.game_over(won=False)
-        return {"message": "OK"}, status.HTTP_200_OK, RESPONSE_HEADERS
-
-    column = request.json["column"]
-    name = request.json["name"]
-    move_result = game.move(name, column)
-
-    if move_result is None:
-        message = "Bad request, column full."
-        status_code = status.HTTP_400_BAD_REQUEST
-    elif move_result is True:
-        message = Game.WON
-        status_code = status.HTTP_200_OK
-    else:
-        message = "OK"
-        status_code = status.HTTP_200_OK
-
-    response_data = {"message": message}
-    response_data.update(game.game)
-    response_body = json.dumps(response_data, cls=DecimalEncoder)
-    return response_body, status_code, RESPONSE_HEADERS
+    return run_view(views.update_game(game_id, request.args, request.json))
+
+
+@app.route("/game/<game_id>/hint", methods=["POST"])
+def request_hint(game_id):
+    """Queue a search for the player's best move, saved to the game."""
+    return run_view(views.request_hint(game_id, request.json))
+
+
+@app.route("/jobs", methods=["GET"])
+def get_job_stats():
+    """Get the search job queue depth and latencies."""
+    return run_view(views.get_job_stats())
+
+
+@app.route("/db", methods=["GET"])
+def get_db_stats():
+    """Get this server process's db connection pool size and use."""
+    return run_view(views.get_db_stats())
+
+
+@app.route("/cache", methods=["GET"])
+def get_cache_stats():
+    """Get this server process's game cache size and hit rate."""
+    return run_view(views.get_cache_stats())
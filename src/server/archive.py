@@ -0,0 +1,135 @@
+"""
+Archiver of finished games, streaming them from the db in batches to
+compressed, append-only files, to be kept once they expire from the db.
+
+Each batch is appended to the current segment (segment-000001.ndjson.gz, ...)
+as a gzip member of one game per JSON line, and a new segment is started once
+the current one reaches the segment size. index.ndjson gives each archived
+game's segment, the offset of its batch's gzip member and its line in the
+batch, and games already in the index are skipped when the archiver runs
+again. Run it more often than finished games expire.
+
+Usage: python -m src.server.archive [--dir archive] [--batch-size 500]
+"""
+import argparse
+import gzip
+import itertools
+import json
+import os
+import time
+
+from src.server.db import DB, get_db, iter_batches
+from src.server.utils import DecimalEncoder
+
+ARCHIVE_DIR = "archive"
+BATCH_SIZE = 500
+SEGMENT_SIZE = 64 * 1024 * 1024
+INDEX_FILE = "index.ndjson"
+SEGMENT_NAME = "segment-{:06d}.ndjson.gz"
+
+
+class Archive:
+    """Append-only archive of games in a directory, see the module doc."""
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+        self.index = {}
+        self.segment_number = 1
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.index[entry["game_id"]] = entry
+                    self.segment_number = max(
+                        self.segment_number,
+                        int(entry["segment"].split("-")[1].split(".")[0]))
+
+    def __contains__(self, game_id):
+        return game_id in self.index
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, segment)
+
+    def current_segment(self):
+        """Return the segment to append to, starting one if it's full."""
+        segment = SEGMENT_NAME.format(self.segment_number)
+        path = self.segment_path(segment)
+        if os.path.exists(path) and \
+                os.path.getsize(path) >= self.segment_size:
+            self.segment_number += 1
+            segment = SEGMENT_NAME.format(self.segment_number)
+        return segment
+
+    def append(self, games):
+        """Append a batch of games to the archive, as one gzip member.
+
+        The games are written before they're added to the index, a batch
+        cut short is archived again the next time.
+        """
+        if not games:
+            return
+        segment = self.current_segment()
+        lines = "".join(json.dumps(game, cls=DecimalEncoder) + "\n"
+                        for game in games)
+        with open(self.segment_path(segment), "ab") as f:
+            offset = f.tell()
+            f.write(gzip.compress(lines.encode("utf-8")))
+            f.flush()
+            os.fsync(f.fileno())
+        entries = [{"game_id": game["game_id"], "segment": segment,
+                    "offset": offset, "line": line}
+                   for line, game in enumerate(games)]
+        with open(os.path.join(self.directory, INDEX_FILE), "a") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+        self.index.update((entry["game_id"], entry) for entry in entries)
+
+    def read_game(self, game_id):
+        """Return the archived game, reading only its batch, or None."""
+        entry = self.index.get(game_id)
+        if entry is None:
+            return None
+        with open(self.segment_path(entry["segment"]), "rb") as f:
+            f.seek(entry["offset"])
+            with gzip.GzipFile(fileobj=f) as batch:
+                for line in itertools.islice(batch, entry["line"],
+                                             entry["line"] + 1):
+                    return json.loads(line)
+        return None
+
+
+def archive_games(games, archive, batch_size=BATCH_SIZE):
+    """Archive the finished games of a stream of games, batch by batch.
+
+    Yield the number of games archived from each batch.
+    """
+    finished = (game for game in games
+                if game.get("game_status") in DB.FINISHED_STATUSES and
+                game.get("game_id") not in archive)
+    for batch in iter_batches(finished, batch_size):
+        archive.append(batch)
+        yield len(batch)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--dir", default=ARCHIVE_DIR)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--segment-size", type=int, default=SEGMENT_SIZE,
+                        help="bytes a segment grows to before the next")
+    args = parser.parse_args(args)
+
+    start = time.monotonic()
+    archive = Archive(args.dir, args.segment_size)
+    archived = sum(archive_games(get_db().iter_games(), archive,
+                                 args.batch_size))
+    seconds = time.monotonic() - start
+    print(f"Archived {archived} games to {args.dir} in {seconds:.2f}s "
+          f"({archived / max(seconds, 1e-9):.0f} games/sec), "
+          f"{len(archive.index)} games in the archive.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Server module containing the asyncio (ASGI) application.
+
+The same RESTful API as app.py, for serving with an ASGI server (uvicorn).
+The requests are handled by views.py, their db calls made in an AsyncDB's
+threads (the game rules are Game's, run as they read and write the db).
+Requests waiting for a game to change (long polls and event streams) are held
+by the event loop, not by a thread or worker.
+"""
+import asyncio
+import json
+import re
+
+from flask_api import status
+from urllib.parse import parse_qs
+
+from src.server import views
+from src.server.async_db import AsyncDB
+from src.server.db import get_db
+from src.server.views import RESPONSE_HEADERS
+
+async_db = AsyncDB(get_db())
+
+
+class Request:
+    """The parts of an HTTP request the views use."""
+
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = {name: values[0] for name, values in parse_qs(
+            scope.get("query_string", b"").decode("latin-1")).items()}
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1")
+                        for name, value in scope.get("headers", [])}
+        self.json = json.loads(body) if body else {}
+
+
+ROUTES = [
+    (re.compile(path), methods) for path, methods in [
+        (r"/game", {
+            "POST": lambda request: views.create_game(request.json),
+            "PATCH": lambda request: views.update_game_new_player(
+                request.json),
+        }),
+        (r"/game/([^/]+)", {
+            "GET": lambda request, game_id: views.get_game(
+                game_id, request.args, request.headers.get("if-none-match")),
+            "PATCH": lambda request, game_id: views.update_game(
+                game_id, request.args, request.json),
+        }),
+        (r"/game/([^/]+)/events", {
+            "GET": lambda request, game_id: views.get_game_events(
+                game_id, request.args),
+        }),
+        (r"/game/([^/]+)/hint", {
+            "POST": lambda request, game_id: views.request_hint(
+                game_id, request.json),
+        }),
+        (r"/jobs", {"GET": lambda request: views.get_job_stats()}),
+        (r"/db", {"GET": lambda request: views.get_db_stats()}),
+        (r"/cache", {"GET": lambda request: views.get_cache_stats()}),
+    ]
+]
+
+
+async def dispatch(request):
+    """Return the (body, status, headers) of the request's view."""
+    for path, methods in ROUTES:
+        match = path.fullmatch(request.path)
+        if match is None:
+            continue
+        view = methods.get(request.method)
+        if view is None:
+            return {"message": "Method not allowed."}, \
+                status.HTTP_405_METHOD_NOT_ALLOWED, RESPONSE_HEADERS
+        return await async_db.run_view(view(request, *match.groups()))
+    return {"message": "Not found."}, status.HTTP_404_NOT_FOUND, \
+        RESPONSE_HEADERS
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_stream(send, receive, messages):
+    """Send the messages as they come, until they end or the client goes."""
+    disconnected = False
+
+    async def wait_for_disconnect():
+        nonlocal disconnected
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected = True
+
+    client = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        async for message in messages:
+            if disconnected:
+                break
+            await send({"type": "http.response.body",
+                        "body": message.encode("utf-8"), "more_body": True})
+        if not disconnected:
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        client.cancel()
+        await messages.aclose()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    request = Request(scope, await read_body(receive))
+    body, status_code, headers = await dispatch(request)
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers.items()],
+    })
+    if isinstance(body, dict):
+        body = views.serializer.dumps(body)
+    if isinstance(body, str):
+        await send({"type": "http.response.body",
+                    "body": body.encode("utf-8")})
+    else:
+        await send_stream(send, receive, async_db.run_stream(body))
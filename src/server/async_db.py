@@ -0,0 +1,110 @@
+"""Server module for the asyncio API to the db, used by the ASGI server.
+
+The db drivers block, so each call (or Game method using the db) is run in a
+pool of threads, as many as the db connection pool, keeping the event loop
+free for other requests. Waiting for a game to change holds no thread, the
+wait is woken through the event loop by the db's ChangeNotifier, or polls the
+game's version in between sleeps if the db has none. The calls of the views
+and event streams (see calls.py) are made the same way.
+"""
+import asyncio
+import functools
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from src.server import db as db_module
+from src.server.calls import Sleep, Wait
+from src.server.db import POOL_SIZE
+
+THREADS = int(os.environ.get("CONNECT_5_ASYNC_THREADS", POOL_SIZE))
+
+
+class AsyncDB:
+    """Async API to any DB, see the module doc."""
+
+    def __init__(self, db, threads=THREADS):
+        self.db = db
+        self.executor = ThreadPoolExecutor(threads)
+
+    async def run(self, function, *args, **kwargs):
+        """Return function(*args, **kwargs), called in the pool."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(function, *args, **kwargs))
+
+    async def get_version(self, game_id):
+        return await self.run(self.db.get_version, game_id)
+
+    async def get_game(self, game_id):
+        return await self.run(self.db.get_game, game_id)
+
+    async def get_versioned_game(self, game_id):
+        return await self.run(self.db.get_versioned_game, game_id)
+
+    async def wait_for_version(self, game_id, since, timeout):
+        """Wait up to timeout seconds for the game's version to move on.
+
+        Return the game's version, as DB.wait_for_version does.
+        """
+        deadline = time.monotonic() + timeout
+        notifier = self.db.get_change_notifier()
+        if notifier is None:
+            version = await self.get_version(game_id)
+            while version == since and version is not None and \
+                    time.monotonic() < deadline:
+                await asyncio.sleep(max(0, min(
+                    db_module.VERSION_POLL_INTERVAL,
+                    deadline - time.monotonic())))
+                version = await self.get_version(game_id)
+            return version
+        loop = asyncio.get_event_loop()
+        changed = asyncio.Event()
+        # listening before the version is read, so no change is missed
+        with notifier.listen(game_id,
+                             lambda: loop.call_soon_threadsafe(changed.set)):
+            version = await self.get_version(game_id)
+            while version == since and version is not None:
+                try:
+                    await asyncio.wait_for(changed.wait(),
+                                           deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    break
+                changed.clear()
+                version = await self.get_version(game_id)
+        return version
+
+    async def call(self, call):
+        """Make a call yielded by a view or stream, see calls.py."""
+        if isinstance(call, Wait):
+            return await self.wait_for_version(call.game.game_id, call.since,
+                                               call.timeout)
+        if isinstance(call, Sleep):
+            return await asyncio.sleep(call.seconds)
+        return await self.run(call)
+
+    async def run_view(self, view):
+        """Make the view's calls, return its response."""
+        result = None
+        try:
+            while True:
+                result = await self.call(view.send(result))
+        except StopIteration as stop:
+            return stop.value
+
+    async def run_stream(self, stream):
+        """Make the stream's calls, yield its messages."""
+        result = None
+        try:
+            while True:
+                item = stream.send(result)
+                result = None
+                if isinstance(item, str):
+                    yield item
+                else:
+                    result = await self.call(item)
+        except StopIteration:
+            return
+        finally:
+            stream.close()
@@ -0,0 +1,147 @@
+"""
+Benchmark of serializing game responses, in bytes/sec, before and after games
+are read without Decimals.
+
+"before" is the response as it was built: DynamoDB items with Decimal
+numbers, the state and board copied into the response and encoded with
+DecimalEncoder. Each serializer then encodes the same games read without
+Decimals, straight from get_state, and "<serializer> cached" is a game polled
+again at the same version, answered with the body serialized the first time.
+
+Usage: python -m src.server.benchmark [--games 1000] [--moves 30]
+"""
+import argparse
+import copy
+import json
+import random
+import time
+
+from decimal import Decimal
+
+from src.server.game import Game
+from src.server.serializers import SERIALIZERS
+from src.server.utils import (COMPACT_BOARD_FORMAT, DecimalEncoder,
+                              encode_board, replace_decimals)
+
+GAMES = 1000
+MOVES = 30
+REPEATS = 5
+BEFORE = "before"
+
+
+def new_item(number, num_moves, rand):
+    """Return a game as DynamoDB returns it, its numbers as Decimals."""
+    players = ["alice", "bob"]
+    heights = [0] * Game.BOARD_COLS
+    moves = []
+    while len(moves) < num_moves:
+        column = rand.randrange(Game.BOARD_COLS)
+        if heights[column] < Game.BOARD_ROWS:
+            heights[column] += 1
+            moves.append([Decimal(column + 1), players[len(moves) % 2],
+                          Decimal(len(moves) + 1)])
+    return {
+        "game_id": str(number), "moves": moves,
+        "heights": [Decimal(height) for height in heights],
+        "rows": Decimal(Game.BOARD_ROWS), "cols": Decimal(Game.BOARD_COLS),
+        "winning_count": Decimal(Game.WINNING_COUNT),
+        "players": players, "max_players": Decimal(2),
+        "turn": players[len(moves) % 2], "game_status": Game.PLAYING,
+        "opponent": None,
+    }
+
+
+def response_before(game):
+    """The PATCH /game/<id> response body as it was built, with a copy."""
+    state = {key: value for key, value in game.game.items()
+             if key != "moves"}
+    state["board"] = game.board
+    state = dict(state, board=encode_board(state["board"]))
+    response_data = {"message": "OK"}
+    response_data.update(state)
+    return json.dumps(response_data, cls=DecimalEncoder)
+
+
+def response_after(game, serializer):
+    """The PATCH /game/<id> response body, as app.update_game builds it."""
+    response_data = game.get_state(board_format=COMPACT_BOARD_FORMAT)
+    response_data["message"] = "OK"
+    return serializer.dumps(response_data)
+
+
+def load_games(items, decimals):
+    """Return Games for copies of the items, with their boards built."""
+    games = []
+    for item in items:
+        item = copy.deepcopy(item)
+        if not decimals:
+            replace_decimals(item)
+        game = Game.from_game(item)
+        game.board  # replayed from the moves before timing
+        games.append(game)
+    return games
+
+
+def measure(encode, games, repeats):
+    """Return (responses, bytes, seconds) encoding every game repeats times.
+    """
+    num_bytes = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for game in games:
+            num_bytes += len(encode(game).encode("utf-8"))
+    return len(games) * repeats, num_bytes, time.perf_counter() - start
+
+
+def get_serializers():
+    """Return the serializers that can be used here, by name."""
+    serializers = {}
+    for name, serializer_class in SERIALIZERS.items():
+        try:
+            serializers[name] = serializer_class()
+        except ImportError:
+            continue
+    return serializers
+
+
+def benchmark(num_games=GAMES, num_moves=MOVES, repeats=REPEATS, seed=7):
+    """Return {name: (responses, bytes, seconds)}, for each way measured."""
+    rand = random.Random(seed)
+    items = [new_item(number, num_moves, rand) for number in range(num_games)]
+    results = {BEFORE: measure(response_before, load_games(items, True),
+                               repeats)}
+    games = load_games(items, False)
+    for name, serializer in get_serializers().items():
+        results[name] = measure(
+            lambda game: response_after(game, serializer), games, repeats)
+        for game in games:
+            game._state_bodies = {}
+        results[f"{name} cached"] = measure(
+            lambda game: game.get_state_body(serializer,
+                                             COMPACT_BOARD_FORMAT),
+            games, repeats)
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--games", type=int, default=GAMES)
+    parser.add_argument("--moves", type=int, default=MOVES,
+                        help="moves made in each game")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    args = parser.parse_args(args)
+    if not 0 <= args.moves <= Game.BOARD_ROWS * Game.BOARD_COLS:
+        parser.error("moves must fit on the board")
+
+    results = benchmark(args.games, args.moves, args.repeats)
+    before = results[BEFORE]
+    before_rate = before[0] / max(before[2], 1e-9)
+    for name, (responses, num_bytes, seconds) in results.items():
+        seconds = max(seconds, 1e-9)
+        print(f"{name}: {num_bytes / seconds / 1e6:.1f} MB/sec, "
+              f"{responses / seconds:.0f} responses/sec "
+              f"({responses / seconds / before_rate:.1f}x before)")
+
+
+if __name__ == "__main__":
+    main()
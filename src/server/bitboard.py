@@ -0,0 +1,71 @@
+"""Server module for the bitboard representation of the game board."""
+
+
+class BitBoard:
+    """Board held as one integer per disc plus the height of each column.
+
+    Each column takes up rows + 1 bits, bit 0 being the bottom cell. The extra
+    bit at the top of each column is always empty, which stops a line of discs
+    wrapping around from one column into the next.
+    """
+
+    def __init__(self, cols, rows, winning_count, discs):
+        self.cols = cols
+        self.rows = rows
+        self.winning_count = winning_count
+        self.stride = rows + 1
+        self.bits = {disc: 0 for disc in discs}
+        self.heights = [0] * cols
+        # shift for a step: vertical, horizontal, diagonal "/", diagonal "\"
+        self.directions = (1, self.stride, self.stride + 1, self.stride - 1)
+
+    @classmethod
+    def from_board(cls, board, rows, winning_count, discs, empty):
+        """Build a bitboard from a list of lists board."""
+        bitboard = cls(len(board), rows, winning_count, discs)
+        for column, cells in enumerate(board):
+            for row, cell in enumerate(cells):
+                if cell == empty:
+                    continue
+                bitboard.bits[cell] |= 1 << bitboard.position(column, row)
+                height = rows - row
+                if height > bitboard.heights[column]:
+                    bitboard.heights[column] = height
+        return bitboard
+
+    def position(self, column, row):
+        """Return the bit index of the board coordinates (row 0 is the top)."""
+        return column * self.stride + self.rows - 1 - row
+
+    def drop(self, column, disc):
+        """Drop disc in column and return its row, or None if column full."""
+        height = self.heights[column]
+        if height == self.rows:
+            return None
+        self.bits[disc] |= 1 << (column * self.stride + height)
+        self.heights[column] = height + 1
+        return self.rows - 1 - height
+
+    def undo(self, column, disc):
+        """Take the top disc (belonging to disc) back out of the column."""
+        self.heights[column] -= 1
+        self.bits[disc] ^= 1 << (column * self.stride + self.heights[column])
+
+    def has_won(self, disc, column, row):
+        """Return True if there is a winning line through the coordinates."""
+        bits = self.bits[disc]
+        move = 1 << self.position(column, row)
+        for step in self.directions:
+            # leave only the bits which start a line of winning_count discs
+            starts = bits
+            for count in range(1, self.winning_count):
+                starts &= bits >> (count * step)
+            if not starts:
+                continue
+            # bits which would start a line passing through this move
+            move_starts = move
+            for count in range(1, self.winning_count):
+                move_starts |= move >> (count * step)
+            if starts & move_starts:
+                return True
+        return False
@@ -0,0 +1,56 @@
+"""Server module for the per process cache of decoded game state."""
+import os
+import threading
+
+from collections import OrderedDict
+
+CACHE_SIZE = int(os.environ.get("CONNECT_5_GAME_CACHE_SIZE", 1000))
+
+
+class GameCache:
+    """Bounded LRU cache of game state, each game kept at one version.
+
+    An entry is only returned for the version it was stored at, so a game
+    written since (by any process) is a miss and is read from the db again.
+    """
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, game_id, version):
+        """Return the game's cached entry if it's at this version, or None."""
+        with self.lock:
+            cached = self.entries.get(game_id)
+            if cached is None or cached[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(game_id)
+            self.hits += 1
+            return cached[1]
+
+    def put(self, game_id, version, entry):
+        """Cache the entry for the game at this version, replacing others."""
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            cached = self.entries.get(game_id)
+            # a slower request may have read an older version
+            if cached is not None and cached[0] > version:
+                return
+            self.entries[game_id] = (version, entry)
+            self.entries.move_to_end(game_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "max_size": self.max_size,
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,51 @@
+"""Server module for the blocking calls made by the request handlers.
+
+The handlers in views.py (and the event streams in events.py) don't call the
+db, they yield each call to the server running them and are sent back its
+result: a function of no arguments, called as it is, or a Wait or Sleep. The
+Flask app makes the calls in the request's thread, with run_view and
+run_stream here, the ASGI app in an AsyncDB's threads (see async_db.py).
+"""
+import time
+
+from collections import namedtuple
+
+
+class Wait(namedtuple("Wait", "game since timeout")):
+    """Wait for the game to change from version since, see Game."""
+
+    def __call__(self):
+        return self.game.wait_for_version(self.since, self.timeout)
+
+
+class Sleep(namedtuple("Sleep", "seconds")):
+
+    def __call__(self):
+        time.sleep(self.seconds)
+
+
+def run_view(view):
+    """Make the view's calls in this thread, return its response."""
+    result = None
+    try:
+        while True:
+            result = view.send(result)()
+    except StopIteration as stop:
+        return stop.value
+
+
+def run_stream(stream):
+    """Make the stream's calls in this thread, yield its messages."""
+    result = None
+    try:
+        while True:
+            item = stream.send(result)
+            result = None
+            if isinstance(item, str):
+                yield item
+            else:
+                result = item()
+    except StopIteration:
+        return
+    finally:
+        stream.close()
@@ -1,33 +1,229 @@
 """Module for handling DB connection and data serialization/deserialization."""
+import hashlib
+import itertools
 import os
 import json
+import sqlite3
+import threading
+import time
 import redis
 import boto3
 
+from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from contextlib import contextmanager
+
+from src.server.utils import encode_board, decode_board, replace_decimals
+
+# Maximum number of connections each process opens to the db
+POOL_SIZE = int(os.environ.get("CONNECT_5_DB_POOL_SIZE", 10))
+# Seconds to wait for a free connection when they're all in use
+POOL_TIMEOUT = float(os.environ.get("CONNECT_5_DB_POOL_TIMEOUT", 5))
+# Seconds to wait to connect to the db, or for it to reply
+SOCKET_TIMEOUT = float(os.environ.get("CONNECT_5_DB_SOCKET_TIMEOUT", 5))
+# Games read or written a round trip by get_games and save_games
+BATCH_SIZE = int(os.environ.get("CONNECT_5_DB_BATCH_SIZE", 100))
+# Seconds between reads of a game's version, waiting for it to change, in dbs
+# that don't say when a game has changed, no more often than the client polled
+# before it waited on games (client.WAIT_INTERVAL)
+VERSION_POLL_INTERVAL = 2
+# Seconds a finished game is kept after it was last written, 0 keeps it
+FINISHED_GAME_TTL = int(os.environ.get("CONNECT_5_FINISHED_GAME_TTL", 0))
+
+
+def iter_batches(items, batch_size):
+    """Yield lists of up to batch_size of the items, in order."""
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
+class StatsConnectionPool(redis.BlockingConnectionPool):
+    """Redis pool of at most max_connections, counting the waits for one.
+
+    Connections are made as they're needed, callers wait (up to timeout) for
+    a connection to be released once max_connections are in use.
+    """
+
+    def reset(self):
+        # also called by the pool in a forked child, which starts afresh
+        super().reset()
+        self.waits = 0
+
+    def get_connection(self, command_name, *keys, **options):
+        if self.pool.empty():
+            self.waits += 1
+        return super().get_connection(command_name, *keys, **options)
+
+    def get_stats(self):
+        idle = sum(connection is not None
+                   for connection in list(self.pool.queue))
+        created = len(self._connections)
+        return {
+            "max_size": self.max_connections,
+            "created": created,
+            "in_use": created - idle,
+            "waits": self.waits,
+        }
+
+
+class ChangeNotifier:
+    """Wakes the threads of this process waiting for a game to change.
+
+    Only the games being watched are tracked, each with its own condition.
+    Callbacks can listen for changes too, for waiters that aren't threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # game_id: [condition, watchers, changes seen]
+        self.games = {}
+        # game_id: [callbacks]
+        self.listeners = {}
+
+    @contextmanager
+    def watch(self, game_id):
+        """Watch the game while in the block, yield a wait function.
+
+        wait(timeout) waits for the next change to the game (or one since
+        the watch began, that hasn't been waited for) and returns whether
+        there was one.
+        """
+        with self.lock:
+            game = self.games.setdefault(
+                game_id, [threading.Condition(self.lock), 0, 0])
+            game[1] += 1
+            seen = game[2]
+
+        def wait(timeout):
+            nonlocal seen
+            with self.lock:
+                changed = game[0].wait_for(lambda: game[2] != seen, timeout)
+                seen = game[2]
+            return changed
+
+        try:
+            yield wait
+        finally:
+            with self.lock:
+                game[1] -= 1
+                if not game[1]:
+                    del self.games[game_id]
+
+    @contextmanager
+    def listen(self, game_id, callback):
+        """Call callback() when the game changes, while in the block.
+
+        The callback is called from the thread notifying, so must not block.
+        """
+        with self.lock:
+            self.listeners.setdefault(game_id, []).append(callback)
+        try:
+            yield
+        finally:
+            with self.lock:
+                callbacks = self.listeners[game_id]
+                callbacks.remove(callback)
+                if not callbacks:
+                    del self.listeners[game_id]
+
+    def notify(self, game_id):
+        """The game has changed, wake the threads watching it."""
+        with self.lock:
+            game = self.games.get(game_id)
+            if game is not None:
+                game[2] += 1
+                game[0].notify_all()
+            for callback in self.listeners.get(game_id, ()):
+                callback()
+
+    def notify_all(self):
+        """Any game may have changed (changes may have been missed)."""
+        with self.lock:
+            for game in self.games.values():
+                game[2] += 1
+                game[0].notify_all()
+            for callbacks in self.listeners.values():
+                for callback in callbacks:
+                    callback()
 
 
 class DB:
     """Base class for APIs to whatever underlying DB is used."""
 
+    # whether the db makes a whole move itself, with atomic_move
+    ATOMIC_MOVES = False
+    # statuses of finished games (Game.WON and Game.DISCONNECTED), which
+    # expire and are archived
+    FINISHED_STATUSES = ("won", "disconnected")
     _connection = None
+    _connection_pid = None
+    _connection_lock = threading.Lock()
     DB_HOST = 'db'  # 'db' is the hostname of the db conainer
 
     def __init__(self, db_name):
         self.name = db_name
-        self.connection = self.get_connection()
+
+    @property
+    def connection(self):
+        """This process's db connection (pool), made on first use."""
+        return self.get_connection()
 
     @classmethod
     def get_connection(cls):
-        """Singleton pattern to ensure only one db connection opened."""
-        if DB._connection is None:
-            DB._connection = cls._get_connection()
+        """Singleton pattern to ensure only one db connection opened.
+
+        The connection is made on first use, and made again in a forked
+        process, so workers forked by the wsgi server don't share sockets.
+        """
+        pid = os.getpid()
+        if DB._connection is None or DB._connection_pid != pid:
+            with DB._connection_lock:
+                if DB._connection is None or DB._connection_pid != pid:
+                    DB._connection = cls._get_connection()
+                    DB._connection_pid = pid
         return DB._connection
 
+    def get_pool_stats(self):
+        """Return the size and use of this process's connection pool."""
+        return {"max_size": POOL_SIZE}
+
     def setup_db(self):
         """Prior to running app, set up any DB dependencies required."""
         pass
 
+    @staticmethod
+    def encode_game(game):
+        """Return a copy of the game with its board in the compact format."""
+        if isinstance(game.get("board"), list):
+            game = dict(game, board=encode_board(game["board"]))
+        return game
+
+    @staticmethod
+    def decode_game(game):
+        """Decode a stored game, older games have a list of lists board."""
+        if isinstance(game.get("board"), str):
+            game["board"] = decode_board(game["board"])
+        return game
+
+    def dumps_game(self, game):
+        """Serialize the game document, its move log is saved separately."""
+        game = self.encode_game(game)
+        return json.dumps({key: value for key, value in game.items()
+                           if key != "moves"})
+
+    def loads_game(self, data, moves):
+        """Deserialize the game document and its move log."""
+        game = self.decode_game(json.loads(data))
+        # games saved before the move log have their board instead
+        if "board" not in game:
+            game["moves"] = [json.loads(move) for move in moves]
+        return game
+
     @classmethod
     def _get_connection(cls):
         """Make the db connection for the specific underlying db."""
@@ -41,10 +237,125 @@ class DB:
         """Persist the given game object using the given game id."""
         raise NotImplementedError()
 
+    def get_games(self, game_ids, batch_size=None):
+        """Return the games of the given ids, in the same order.
+
+        None is returned for the games that aren't found. Dbs that can read
+        batch_size games (default BATCH_SIZE) a round trip do so, otherwise
+        the games are read one at a time.
+        """
+        games = []
+        for game_id in game_ids:
+            try:
+                games.append(self.get_game(game_id))
+            except KeyError:
+                games.append(None)
+        return games
+
+    def save_games(self, items, batch_size=None):
+        """Persist the (game_id, game) pairs, as get_games reads them."""
+        for game_id, game in items:
+            self.save_game(game_id, game)
+
+    def save_fields(self, game_id, game, fields):
+        """Persist only the given fields of the game, where the db allows it.
+
+        Fields missing from the game are removed from the stored game.
+        """
+        self.save_game(game_id, game)
+
+    def save_fields_if_version(self, game_id, game, fields, version):
+        """Save the fields as save_fields does, unless the game was written
+        since it was at version (read before the game was).
+
+        Return whether or not they were saved. Dbs without versions save
+        them anyway.
+        """
+        self.save_fields(game_id, game, fields)
+        return True
+
+    def get_version(self, game_id):
+        """Return the game's version, counting the times it was written.
+
+        Return None if the db doesn't keep versions (or the game has none).
+        """
+        return None
+
+    def get_versioned_game(self, game_id):
+        """Return the game's version and the game, read together."""
+        return self.get_version(game_id), self.get_game(game_id)
+
+    def get_change_notifier(self):
+        """Return the ChangeNotifier woken by the db when a game changes.
+
+        Return None if the db doesn't say when a game has changed.
+        """
+        return None
+
+    def wait_for_version(self, game_id, since, timeout):
+        """Wait up to timeout seconds for the game's version to move on.
+
+        Return the game's version, which is since if it didn't change in
+        time, or None if the game has no version (nothing is waited for).
+        The version is polled if the db doesn't say when a game changes.
+        """
+        deadline = time.monotonic() + timeout
+        notifier = self.get_change_notifier()
+        if notifier is None:
+            version = self.get_version(game_id)
+            while version == since and version is not None and \
+                    time.monotonic() < deadline:
+                time.sleep(max(0, min(VERSION_POLL_INTERVAL,
+                                      deadline - time.monotonic())))
+                version = self.get_version(game_id)
+            return version
+        # watched before the version is read, so no change is missed
+        with notifier.watch(game_id) as wait:
+            version = self.get_version(game_id)
+            while version == since and version is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not wait(remaining):
+                    break
+                version = self.get_version(game_id)
+        return version
+
+    def get_fields(self, game_id, fields):
+        """Return only the given fields of the game, those it has."""
+        game = self.get_game(game_id)
+        return {field: game[field] for field in fields if field in game}
+
+    def append_move(self, game_id, game, move):
+        """Persist the game after a move, appending the move to its log.
+
+        Only the move log and the fields a move changes ("heights", "turn",
+        "game_status", "hint") are written, where the db allows it.
+        """
+        self.save_game(game_id, game)
+
+    def atomic_move(self, game_id, name, column):
+        """Make the player's move in one atomic step, as Game.move does.
+
+        Return (move result, game state after the move), or None if the db
+        can't make this game's moves.
+        """
+        raise NotImplementedError()
+
     def scan_games(self, *args):
         """Traverse through all the games in the database."""
         raise NotImplementedError()
 
+    def scan_open_games(self):
+        """Traverse through the ids of the open games, oldest first."""
+        raise NotImplementedError()
+
+    def remove_open_game(self, game_id):
+        """Drop a game found not to be open from the open games index."""
+        raise NotImplementedError()
+
+    def iter_games(self):
+        """Stream every stored game document, in no particular order."""
+        raise NotImplementedError()
+
     def begin_transaction(self, game_id):
         """Begin transaction while checking for available games to join."""
         raise NotImplementedError()
@@ -62,21 +373,194 @@ class RedisDB(DB):
 
     DB_PORT = 6379
     DB_NUMBER = 0
+    # keys other than games (job queue etc.) share this prefix
+    AUX_KEY_PREFIX = "connect5:"
+    # sorted set of the open games' ids, scored by when they were opened
+    OPEN_GAMES_KEY = f"{AUX_KEY_PREFIX}open_games"
+    OPEN_GAMES_PAGE_SIZE = 100
+    OPEN_STATUS = "open"  # Game.OPEN
+    # every write publishes the game's id to this channel
+    CHANGES_CHANNEL = f"{AUX_KEY_PREFIX}changes"
+    # seconds the listener waits for a change before checking it's connected
+    LISTEN_TIMEOUT = 1
+    _notifier = None
+    _notifier_pid = None
+    _notifier_lock = threading.Lock()
 
     @classmethod
     def _get_connection(cls):
-        return redis.StrictRedis(
+        pool = StatsConnectionPool(
+            max_connections=POOL_SIZE, timeout=POOL_TIMEOUT,
             host=cls.DB_HOST, port=cls.DB_PORT, db=cls.DB_NUMBER,
-            charset="utf-8", decode_responses=True)
+            socket_timeout=SOCKET_TIMEOUT,
+            socket_connect_timeout=SOCKET_TIMEOUT,
+            encoding="utf-8", decode_responses=True)
+        return redis.StrictRedis(connection_pool=pool)
+
+    def get_pool_stats(self):
+        return self.connection.connection_pool.get_stats()
+
+    def setup_db(self):
+        """Index the open games stored before the open games index."""
+        if not self.connection.exists(self.OPEN_GAMES_KEY):
+            self.rebuild_open_games_index()
+
+    def rebuild_open_games_index(self):
+        """Scan every game, adding the open ones to the index."""
+        pipeline = self.connection.pipeline()
+        for game in self.iter_games():
+            self.index_game(pipeline, game["game_id"], game)
+        pipeline.execute()
+
+    def index_game(self, pipeline, game_id, game):
+        """Queue adding the game to, or removing it from, the open index.
+
+        A game already in the index keeps its place.
+        """
+        if game.get("game_status") == self.OPEN_STATUS:
+            pipeline.zadd(self.OPEN_GAMES_KEY, {game_id: time.time()},
+                          nx=True)
+        else:
+            pipeline.zrem(self.OPEN_GAMES_KEY, game_id)
+
+    def expire_game(self, pipeline, game_id, game):
+        """Queue the expiry of a finished game's keys, if games expire.
+
+        Written again, the game is kept for the whole time from then on.
+        """
+        if FINISHED_GAME_TTL and \
+                game.get("game_status") in self.FINISHED_STATUSES:
+            for key in (game_id, self.get_moves_key(game_id),
+                        self.get_version_key(game_id)):
+                pipeline.expire(key, FINISHED_GAME_TTL)
+
+    def get_moves_key(self, game_id):
+        """Key of the list holding the game's move log."""
+        return f"{self.AUX_KEY_PREFIX}moves:{game_id}"
+
+    def get_version_key(self, game_id):
+        """Key of the counter incremented each time the game is written."""
+        return f"{self.AUX_KEY_PREFIX}version:{game_id}"
+
+    def bump_version(self, pipeline, game_id):
+        """Queue incrementing the game's version, with the write.
+
+        The game's id is published to the changes channel too.
+        """
+        pipeline.incr(self.get_version_key(game_id))
+        pipeline.publish(self.CHANGES_CHANNEL, game_id)
+
+    def get_change_notifier(self):
+        """This process's notifier, woken by a thread listening for changes.
+
+        The thread is started on first use, with its own connection.
+        """
+        pid = os.getpid()
+        if RedisDB._notifier is None or RedisDB._notifier_pid != pid:
+            with RedisDB._notifier_lock:
+                if RedisDB._notifier is None or \
+                        RedisDB._notifier_pid != pid:
+                    notifier = ChangeNotifier()
+                    threading.Thread(target=self.listen_for_changes,
+                                     args=(notifier,), daemon=True).start()
+                    RedisDB._notifier = notifier
+                    RedisDB._notifier_pid = pid
+        return RedisDB._notifier
+
+    def listen_for_changes(self, notifier):
+        """Wake the notifier's watchers with the changes published."""
+        while True:
+            try:
+                pubsub = self.connection.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANGES_CHANNEL)
+                # changes made while not subscribed were missed
+                notifier.notify_all()
+                while True:
+                    message = pubsub.get_message(timeout=self.LISTEN_TIMEOUT)
+                    if message is not None:
+                        notifier.notify(message["data"])
+            except redis.RedisError as exc:
+                print(f"Listening for changes failed: {exc!r}")  # log
+                time.sleep(self.LISTEN_TIMEOUT)
+
+    def get_version(self, game_id):
+        version = self.connection.get(self.get_version_key(game_id))
+        return None if version is None else int(version)
+
+    def get_versioned_game(self, game_id):
+        """Read the version and the game in one transaction."""
+        pipeline = self.connection.pipeline()
+        pipeline.get(self.get_version_key(game_id))
+        self.queue_get_game(pipeline, game_id)
+        version, *data = pipeline.execute()
+        return (None if version is None else int(version),
+                self.loads_game(*data))
+
+    def queue_get_game(self, pipeline, game_id):
+        """Queue the reads of the game and its move log (see loads_game)."""
+        pipeline.get(game_id)
+        pipeline.lrange(self.get_moves_key(game_id), 0, -1)
 
     def get_game(self, game_id):
-        return json.loads(self.connection.get(game_id))
+        pipeline = self.connection.pipeline(transaction=False)
+        self.queue_get_game(pipeline, game_id)
+        return self.loads_game(*pipeline.execute())
 
     def get_game_transaction(self, pipeline, game_id):
-        return json.loads(pipeline.get(game_id))
+        return self.decode_game(json.loads(pipeline.get(game_id)))
+
+    def get_games(self, game_ids, batch_size=None):
+        """MGET a batch of games and their move logs a round trip."""
+        games = []
+        for batch in iter_batches(game_ids, batch_size or BATCH_SIZE):
+            pipeline = self.connection.pipeline(transaction=False)
+            pipeline.mget(batch)
+            for game_id in batch:
+                pipeline.lrange(self.get_moves_key(game_id), 0, -1)
+            data, *moves = pipeline.execute()
+            games.extend(None if game is None else self.loads_game(
+                game, game_moves) for game, game_moves in zip(data, moves))
+        return games
 
     def save_game(self, game_id, game):
-        self.connection.set(game_id, json.dumps(game))
+        pipeline = self.connection.pipeline()
+        self.queue_save_game(pipeline, game_id, game)
+        pipeline.execute()
+
+    def save_games(self, items, batch_size=None):
+        """Save a batch of games a round trip, each batch a transaction."""
+        for batch in iter_batches(items, batch_size or BATCH_SIZE):
+            pipeline = self.connection.pipeline()
+            for game_id, game in batch:
+                self.queue_save_game(pipeline, game_id, game)
+            pipeline.execute()
+
+    def queue_save_game(self, pipeline, game_id, game):
+        """Queue the writes of the whole game, replacing its move log."""
+        pipeline.set(game_id, self.dumps_game(game))
+        self.index_game(pipeline, game_id, game)
+        self.bump_version(pipeline, game_id)
+        self.queue_save_moves(pipeline, game_id, game)
+        # after the move log is replaced, its DEL would drop the expiry
+        self.expire_game(pipeline, game_id, game)
+
+    def queue_save_moves(self, pipeline, game_id, game):
+        if "moves" in game:
+            moves_key = self.get_moves_key(game_id)
+            pipeline.delete(moves_key)
+            if game["moves"]:
+                pipeline.rpush(moves_key, *(json.dumps(move)
+                                            for move in game["moves"]))
+
+    def append_move(self, game_id, game, move):
+        """Append the move to the log, the document no longer has a board."""
+        pipeline = self.connection.pipeline()
+        pipeline.set(game_id, self.dumps_game(game))
+        pipeline.rpush(self.get_moves_key(game_id), json.dumps(move))
+        self.index_game(pipeline, game_id, game)
+        self.expire_game(pipeline, game_id, game)
+        self.bump_version(pipeline, game_id)
+        pipeline.execute()
 
     def save_game_transaction(self, pipeline, game_id, game):
         """Save game within a transaction.
@@ -85,7 +569,10 @@ class RedisDB(DB):
         Return whether or not the transaction executed successfully.
         """
         pipeline.multi()
-        pipeline.set(game_id, json.dumps(game))
+        pipeline.set(game_id, self.dumps_game(game))
+        self.index_game(pipeline, game_id, game)
+        self.expire_game(pipeline, game_id, game)
+        self.bump_version(pipeline, game_id)
         try:
             pipeline.execute()
         except redis.WatchError:
@@ -93,9 +580,68 @@ class RedisDB(DB):
             return False
         return True
 
+    def queue_save_fields(self, pipeline, game_id, game, fields):
+        """Queue the writes of the fields, the whole document here."""
+        pipeline.set(game_id, self.dumps_game(game))
+        self.index_game(pipeline, game_id, game)
+        self.expire_game(pipeline, game_id, game)
+        self.bump_version(pipeline, game_id)
+
+    def save_fields_if_version(self, game_id, game, fields, version):
+        """WATCH the game's version key while checking and writing it."""
+        version_key = self.get_version_key(game_id)
+        pipeline = self.connection.pipeline()
+        pipeline.watch(version_key)
+        current = pipeline.get(version_key)
+        if (None if current is None else int(current)) != version:
+            pipeline.reset()
+            return False
+        pipeline.multi()
+        self.queue_save_fields(pipeline, game_id, game, fields)
+        try:
+            pipeline.execute()
+        except redis.WatchError:
+            return False
+        return True
+
     def scan_games(self, *args):
         for game_id in self.connection.scan_iter():
-            yield game_id
+            if not game_id.startswith(self.AUX_KEY_PREFIX):
+                yield game_id
+
+    def scan_open_games(self):
+        """Read the open games index a page at a time, oldest first.
+
+        Each page starts from the last score (time opened) read, not an
+        offset, as the games read are removed from the index as they're
+        joined. Games read with that score are skipped.
+        """
+        last_score, seen = "-inf", set()
+        while True:
+            page = self.connection.zrangebyscore(
+                self.OPEN_GAMES_KEY, last_score, "+inf", start=0,
+                num=self.OPEN_GAMES_PAGE_SIZE, withscores=True)
+            new_games = [(game_id, score) for game_id, score in page
+                         if game_id not in seen]
+            for game_id, score in new_games:
+                if score != last_score:
+                    last_score, seen = score, set()
+                seen.add(game_id)
+                yield game_id
+            # a page of games all opened at the same time ends the scan too
+            if len(page) < self.OPEN_GAMES_PAGE_SIZE or not new_games:
+                break
+
+    def remove_open_game(self, game_id):
+        self.connection.zrem(self.OPEN_GAMES_KEY, game_id)
+
+    def iter_games(self):
+        """Read the scanned games a batch at a time."""
+        for batch in iter_batches(self.scan_games(), BATCH_SIZE):
+            for game in self.get_games(batch):
+                # the game may have been deleted since the scan found it
+                if game is not None:
+                    yield game
 
     def begin_transaction(self, game_id):
         """WATCH game_id for changes by other clients, while checking it."""
@@ -104,26 +650,272 @@ class RedisDB(DB):
         return pipeline
 
 
+class RedisHashDB(RedisDB):
+    """Redis storage keeping each game as a hash, one field per game field.
+
+    Each field's value is JSON, so a move only writes the fields it changes
+    and a client can read only the fields it needs. The move log is kept in
+    its own list, as in RedisDB.
+    """
+
+    # fields written by a move, the rest of the game is unchanged
+    MOVE_FIELDS = ("heights", "turn", "game_status", "hint")
+
+    def dumps_fields(self, game, fields=None):
+        """Serialize each of the game's fields (or the given ones)."""
+        game = self.encode_game(game)
+        if fields is None:
+            fields = [field for field in game if field != "moves"]
+        return {field: json.dumps(game[field]) for field in fields
+                if field in game}
+
+    def loads_game(self, data, moves):
+        """Deserialize the game's hash fields and its move log."""
+        game = self.decode_game({field: json.loads(value)
+                                 for field, value in data.items()})
+        # games saved before the move log have their board instead
+        if "board" not in game:
+            game["moves"] = [json.loads(move) for move in moves]
+        return game
+
+    def write_fields(self, pipeline, game_id, game, fields):
+        """Queue HSET of the given fields, HDEL of those the game lacks."""
+        values = self.dumps_fields(game, fields)
+        if values:
+            pipeline.hset(game_id, mapping=values)
+        missing = [field for field in fields if field not in values]
+        if missing:
+            pipeline.hdel(game_id, *missing)
+
+    def queue_get_game(self, pipeline, game_id):
+        pipeline.hgetall(game_id)
+        pipeline.lrange(self.get_moves_key(game_id), 0, -1)
+
+    def get_fields(self, game_id, fields):
+        """HMGET the fields, the move log is only read if it's asked for."""
+        hash_fields = [field for field in fields if field != "moves"]
+        pipeline = self.connection.pipeline(transaction=False)
+        if hash_fields:
+            pipeline.hmget(game_id, hash_fields)
+        if "moves" in fields:
+            pipeline.lrange(self.get_moves_key(game_id), 0, -1)
+        results = pipeline.execute()
+        game = {}
+        if hash_fields:
+            values = results.pop(0)
+            game.update((field, json.loads(value)) for field, value in
+                        zip(hash_fields, values) if value is not None)
+        game = self.decode_game(game)
+        if "moves" in fields and "board" not in game:
+            game["moves"] = [json.loads(move) for move in results.pop(0)]
+        return game
+
+    def get_game_transaction(self, pipeline, game_id):
+        return self.decode_game({
+            field: json.loads(value)
+            for field, value in pipeline.hgetall(game_id).items()})
+
+    def get_games(self, game_ids, batch_size=None):
+        """HGETALL a batch of games and their move logs a round trip."""
+        games = []
+        for batch in iter_batches(game_ids, batch_size or BATCH_SIZE):
+            pipeline = self.connection.pipeline(transaction=False)
+            for game_id in batch:
+                self.queue_get_game(pipeline, game_id)
+            results = pipeline.execute()
+            games.extend(self.loads_game(data, moves) if data else None
+                         for data, moves in zip(results[::2], results[1::2]))
+        return games
+
+    def queue_save_game(self, pipeline, game_id, game):
+        pipeline.delete(game_id)
+        pipeline.hset(game_id, mapping=self.dumps_fields(game))
+        self.index_game(pipeline, game_id, game)
+        self.bump_version(pipeline, game_id)
+        self.queue_save_moves(pipeline, game_id, game)
+        # after the move log is replaced, its DEL would drop the expiry
+        self.expire_game(pipeline, game_id, game)
+
+    def save_fields(self, game_id, game, fields):
+        pipeline = self.connection.pipeline()
+        self.queue_save_fields(pipeline, game_id, game, fields)
+        pipeline.execute()
+
+    def queue_save_fields(self, pipeline, game_id, game, fields):
+        """Queue HSET of only the fields (see write_fields)."""
+        self.write_fields(pipeline, game_id, game, fields)
+        if "game_status" in fields:
+            self.index_game(pipeline, game_id, game)
+            self.expire_game(pipeline, game_id, game)
+        self.bump_version(pipeline, game_id)
+
+    def append_move(self, game_id, game, move):
+        """Append the move to the log and HSET only the fields it changed."""
+        pipeline = self.connection.pipeline()
+        self.write_fields(pipeline, game_id, game, self.MOVE_FIELDS)
+        pipeline.rpush(self.get_moves_key(game_id), json.dumps(move))
+        self.index_game(pipeline, game_id, game)
+        self.expire_game(pipeline, game_id, game)
+        self.bump_version(pipeline, game_id)
+        pipeline.execute()
+
+    def save_game_transaction(self, pipeline, game_id, game):
+        """Save the game's fields within a transaction (see RedisDB)."""
+        pipeline.multi()
+        pipeline.hset(game_id, mapping=self.dumps_fields(game))
+        self.index_game(pipeline, game_id, game)
+        self.expire_game(pipeline, game_id, game)
+        self.bump_version(pipeline, game_id)
+        try:
+            pipeline.execute()
+        except redis.WatchError:
+            print("A watched key has changed, abort transaction.")
+            return False
+        return True
+
+
+def load_script(filename):
+    """Return the source of a Lua script in this package, and its sha."""
+    with open(os.path.join(os.path.dirname(__file__), filename)) as f:
+        source = f.read()
+    return source, hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+class RedisScriptDB(RedisHashDB):
+    """RedisHashDB making moves and joins in one round trip, with Lua scripts.
+
+    The move script (move.lua) checks the move, updates the game and its move
+    log and returns the new state, atomically, so racing moves can't be lost.
+    The join script (join.lua) claims a seat in the oldest open game, so
+    players joining at the same time don't abort each other's transactions.
+    It finds the games' keys itself, so needs a single Redis, not a Cluster.
+    """
+
+    ATOMIC_MOVES = True
+    MOVE_SCRIPT, MOVE_SCRIPT_SHA = load_script("move.lua")
+    MOVE_OUTCOMES = {"won": True, "moved": False, "invalid": None,
+                     "not_turn": "not_turn"}  # Game.NOT_TURN
+    JOIN_SCRIPT, JOIN_SCRIPT_SHA = load_script("join.lua")
+
+    def setup_db(self):
+        super().setup_db()
+        self.load_scripts()
+
+    def load_scripts(self):
+        """Load the scripts into Redis' script cache, to be run by sha."""
+        self.connection.script_load(self.MOVE_SCRIPT)
+        self.connection.script_load(self.JOIN_SCRIPT)
+
+    def run_script(self, sha, keys, args):
+        """Run a loaded script by its sha, return its result."""
+        try:
+            return self.connection.evalsha(sha, len(keys), *keys, *args)
+        except redis.exceptions.NoScriptError:
+            # e.g. Redis restarted since setup_db, load them again
+            self.load_scripts()
+            return self.connection.evalsha(sha, len(keys), *keys, *args)
+
+    def atomic_move(self, game_id, name, column):
+        keys = (game_id, self.get_moves_key(game_id), self.OPEN_GAMES_KEY,
+                self.get_version_key(game_id))
+        result = self.run_script(
+            self.MOVE_SCRIPT_SHA, keys,
+            (name, column, FINISHED_GAME_TTL, self.CHANGES_CHANNEL))
+        if result[0] not in self.MOVE_OUTCOMES:
+            return None
+        outcome, data, moves = result
+        data = dict(zip(data[::2], data[1::2]))
+        return self.MOVE_OUTCOMES[outcome], self.loads_game(data, moves)
+
+    def join_open_game(self, name):
+        """Add the player to the oldest open game they're not already in.
+
+        Return the game's id, or None if there's no game to join.
+        """
+        return self.run_script(
+            self.JOIN_SCRIPT_SHA, (self.OPEN_GAMES_KEY,),
+            (name, self.OPEN_GAMES_PAGE_SIZE, self.get_version_key(""),
+             self.CHANGES_CHANNEL))
+
+
 class DynamoDB(DB):
 
     DB_PORT = 8000
     DB_TABLE = "Game"
     LAST_EVALUATED_KEY = "LastEvaluatedKey"
+    # sparse index of the open games, only they have the "open_status" key
+    OPEN_GAMES_INDEX = "OpenGames"
+    OPEN_STATUS = "open"  # Game.OPEN
+    # finished games are deleted by Dynamo's TTL once this time has passed
+    EXPIRES_AT = "expires_at"
+    # counts the times the game was written, ADDed to by each write
+    VERSION = "version"
+    # attributes a game can lose, removed when the whole game is written
+    OPTIONAL_ATTRIBUTES = ("hint", "open_status", "open_since", EXPIRES_AT)
+    OPEN_GAMES_ATTRIBUTES = [
+        {
+            "AttributeName": "open_status",
+            "AttributeType": "S",
+        },
+        {
+            "AttributeName": "open_since",
+            "AttributeType": "N",
+        },
+    ]
+    # most keys a BatchGetItem reads
+    MAX_BATCH_GET = 100
+    # first wait (doubled each time) before retrying unprocessed items
+    RETRY_DELAY = 0.05
+    MAX_RETRY_DELAY = 1
+    THROUGHPUT = {
+        'ReadCapacityUnits': 100,  # throttle rate (requests per sec)
+        'WriteCapacityUnits': 100,
+    }
 
     @classmethod
     def _get_connection(cls):
+        # the client keeps up to POOL_SIZE connections open to the db
+        config = Config(max_pool_connections=POOL_SIZE,
+                        connect_timeout=SOCKET_TIMEOUT,
+                        read_timeout=SOCKET_TIMEOUT)
         dynamodb = boto3.resource(
-            'dynamodb', endpoint_url=f"http://{cls.DB_HOST}:{cls.DB_PORT}")
+            'dynamodb', endpoint_url=f"http://{cls.DB_HOST}:{cls.DB_PORT}",
+            config=config)
         return dynamodb
 
     def setup_db(self):
         """Create the Game table in dynamodb."""
         self.create_game_table()
+        if FINISHED_GAME_TTL:
+            self.enable_expiry()
+
+    def enable_expiry(self):
+        """Turn on the table's TTL, deleting games past their expires_at."""
+        client = self.connection.meta.client
+        ttl = client.describe_time_to_live(TableName=self.DB_TABLE)
+        if ttl["TimeToLiveDescription"]["TimeToLiveStatus"] in (
+                "ENABLED", "ENABLING"):
+            return
+        client.update_time_to_live(
+            TableName=self.DB_TABLE,
+            TimeToLiveSpecification={
+                "Enabled": True,
+                "AttributeName": self.EXPIRES_AT,
+            },
+        )
+
+    def get_expires_at(self, game):
+        """Return when the game expires (epoch seconds), None if it doesn't."""
+        if FINISHED_GAME_TTL and \
+                game.get("game_status") in self.FINISHED_STATUSES:
+            return int(time.time()) + FINISHED_GAME_TTL
+        return None
 
     def create_game_table(self):
         """Create the Game table if required."""
         tables = self.connection.meta.client.list_tables()["TableNames"]
         if self.DB_TABLE in tables:
+            self.create_open_games_index()
             return
         # Create the table schema and define the primary key
         table = self.connection.create_table(
@@ -139,61 +931,320 @@ class DynamoDB(DB):
                     "AttributeName": "game_id",
                     "AttributeType": "S",
                 },
-            ],
-            ProvisionedThroughput={
-                'ReadCapacityUnits': 100,  # throttle rate (requests per sec)
-                'WriteCapacityUnits': 100,
-            },
+            ] + self.OPEN_GAMES_ATTRIBUTES,
+            GlobalSecondaryIndexes=[self.get_open_games_index()],
+            ProvisionedThroughput=self.THROUGHPUT,
         )
         # create_table is async, wait until the table exists.
         table.meta.client.get_waiter('table_exists').wait(
             TableName=self.DB_TABLE)
 
+    def get_open_games_index(self):
+        """Index of the open games by when they were opened, oldest first."""
+        return {
+            "IndexName": self.OPEN_GAMES_INDEX,
+            "KeySchema": [
+                {
+                    "AttributeName": "open_status",
+                    "KeyType": "HASH",
+                },
+                {
+                    "AttributeName": "open_since",
+                    "KeyType": "RANGE",
+                },
+            ],
+            "Projection": {
+                "ProjectionType": "ALL",
+            },
+            "ProvisionedThroughput": self.THROUGHPUT,
+        }
+
+    def create_open_games_index(self):
+        """Add the open games index to a table created before it.
+
+        The open games already stored are saved again to index them.
+        """
+        table = self.get_game_table()
+        indexes = table.global_secondary_indexes or []
+        if any(index["IndexName"] == self.OPEN_GAMES_INDEX
+               for index in indexes):
+            return
+        table.update(
+            AttributeDefinitions=self.OPEN_GAMES_ATTRIBUTES,
+            GlobalSecondaryIndexUpdates=[
+                {"Create": self.get_open_games_index()},
+            ],
+        )
+        for game in self.scan_games("game_status", self.OPEN_STATUS):
+            self.save_game(game["game_id"], game)
+
     def get_game_table(self):
         return self.connection.Table(self.DB_TABLE)
 
-    def get_game(self, game_id):
-        table = self.get_game_table()
-        response = table.get_item(
+    def encode_game(self, game):
+        """Return the item to store, with its open games index keys.
+
+        An open game keeps the time it was first opened, the keys are left
+        out once it's no longer open so it drops out of the sparse index.
+        A finished game gets the time it expires, if games expire.
+        """
+        item = {key: value for key, value in DB.encode_game(game).items()
+                if key not in ("open_status", "open_since", self.EXPIRES_AT,
+                               self.VERSION)}
+        if game.get("game_status") == self.OPEN_STATUS:
+            item["open_status"] = self.OPEN_STATUS
+            item["open_since"] = game.get("open_since",
+                                          int(time.time() * 1000))
+        expires_at = self.get_expires_at(game)
+        if expires_at is not None:
+            item[self.EXPIRES_AT] = expires_at
+        return item
+
+    def decode_game(self, game):
+        """Decode a stored item, its numbers are read as Decimals."""
+        return DB.decode_game(replace_decimals(
+            {key: value for key, value in game.items()
+             if key != self.VERSION}))
+
+    def get_update(self, item, fields=None):
+        """Return the update_item arguments writing the item's fields and
+        adding one to its version.
+
+        The fields given that the item lacks are removed. By default all of
+        the item's fields are written and the optional ones it lacks
+        removed, as putting the item would (keeping its version).
+        """
+        if fields is None:
+            fields = [key for key in item if key != "game_id"] + [
+                key for key in self.OPTIONAL_ATTRIBUTES if key not in item]
+        saved = [field for field in fields if field in item]
+        removed = [field for field in fields if field not in item]
+        updates = []
+        if saved:
+            updates.append("SET " + ", ".join(
+                f"#{field} = :{field}" for field in saved))
+        if removed:
+            updates.append("REMOVE " + ", ".join(
+                f"#{field}" for field in removed))
+        updates.append(f"ADD #{self.VERSION} :one")
+        values = {f":{field}": item[field] for field in saved}
+        values[":one"] = 1
+        names = {f"#{field}": field for field in fields}
+        names[f"#{self.VERSION}"] = self.VERSION
+        return {
+            "UpdateExpression": " ".join(updates),
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": values,
+        }
+
+    def get_item(self, game_id, **kwargs):
+        response = self.get_game_table().get_item(
             Key={
                 "game_id": game_id,
-            }
+            },
+            **kwargs,
         )
-        game = response["Item"]
-        return game
+        return response.get("Item")
+
+    def get_game(self, game_id):
+        return self.get_versioned_game(game_id)[1]
+
+    def get_version(self, game_id):
+        item = self.get_item(
+            game_id, ProjectionExpression=f"#{self.VERSION}",
+            ExpressionAttributeNames={f"#{self.VERSION}": self.VERSION})
+        version = (item or {}).get(self.VERSION)
+        return None if version is None else int(version)
+
+    def get_versioned_game(self, game_id):
+        """Read the game item, its version is one of its attributes."""
+        item = self.get_item(game_id)
+        if item is None:
+            raise KeyError(game_id)
+        version = item.get(self.VERSION)
+        return (None if version is None else int(version),
+                self.decode_game(item))
 
     def save_game(self, game_id, game):
-        table = self.get_game_table()
-        table.put_item(
-            Item=game,
+        """Write the whole game, as an update adding to its version."""
+        self.get_game_table().update_item(
+            Key={
+                "game_id": game_id,
+            },
+            **self.get_update(self.encode_game(game)),
         )
 
-    def scan_games(self, status_key, status_value, player_key, player_value):
-        """Traverse through all the open games in the database."""
-        filter_exp = (
-            f"{status_key} = :status AND NOT contains ({player_key}, :name)"
+    def save_fields_if_version(self, game_id, game, fields, version):
+        """Update only the fields, on the condition the version is the same.
+
+        The whole game is written if its status is saved, for its open games
+        index and expiry.
+        """
+        update = self.get_update(
+            self.encode_game(game),
+            None if "game_status" in fields else fields)
+        if version is None:
+            update["ConditionExpression"] = \
+                f"attribute_not_exists(#{self.VERSION})"
+        else:
+            update["ConditionExpression"] = f"#{self.VERSION} = :version"
+            update["ExpressionAttributeValues"][":version"] = version
+        try:
+            self.get_game_table().update_item(
+                Key={
+                    "game_id": game_id,
+                },
+                **update,
+            )
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] != \
+                    "ConditionalCheckFailedException":
+                raise
+            return False
+        return True
+
+    def get_games(self, game_ids, batch_size=None):
+        """BatchGetItem the games, retrying the keys left unprocessed."""
+        game_ids = list(game_ids)
+        found = {}
+        batch_size = min(batch_size or BATCH_SIZE, self.MAX_BATCH_GET)
+        # a batch can't ask for the same key twice
+        for batch in iter_batches(dict.fromkeys(game_ids), batch_size):
+            request = {
+                self.DB_TABLE: {
+                    "Keys": [{"game_id": game_id} for game_id in batch],
+                },
+            }
+            for response in self.batch_request(
+                    self.connection.batch_get_item, request,
+                    "UnprocessedKeys"):
+                for game in response["Responses"].get(self.DB_TABLE, []):
+                    found[game["game_id"]] = self.decode_game(game)
+        return [found.get(game_id) for game_id in game_ids]
+
+    def batch_request(self, method, request, unprocessed_key):
+        """Make a batch request, then again for what Dynamo left unprocessed.
+
+        Yield each response. Retries wait longer each time, as Dynamo only
+        leaves items unprocessed when it's short of capacity.
+        """
+        delay = self.RETRY_DELAY
+        while True:
+            response = method(RequestItems=request)
+            yield response
+            request = response.get(unprocessed_key)
+            if not request:
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, self.MAX_RETRY_DELAY)
+
+    def append_move(self, game_id, game, move):
+        table = self.get_game_table()
+        values = {
+            ":move": [move],
+            ":heights": game["heights"],
+            ":turn": game["turn"],
+            ":status": game["game_status"],
+            ":one": 1,
+        }
+        expires_at = self.get_expires_at(game)
+        if expires_at is not None:
+            values[":expires_at"] = expires_at
+        table.update_item(
+            Key={
+                "game_id": game_id,
+            },
+            UpdateExpression=(
+                "SET moves = list_append(moves, :move), heights = :heights, "
+                "#turn = :turn, game_status = :status" +
+                ("" if expires_at is None
+                 else f", {self.EXPIRES_AT} = :expires_at") +
+                " REMOVE hint" +
+                ("" if game["game_status"] == self.OPEN_STATUS
+                 else ", open_status, open_since") +
+                f" ADD #{self.VERSION} :one"
+            ),
+            ExpressionAttributeNames={
+                "#turn": "turn",
+                f"#{self.VERSION}": self.VERSION,
+            },
+            ExpressionAttributeValues=values,
         )
+
+    def scan_games(self, status_key, status_value, player_key=None,
+                   player_value=None):
+        """Traverse through all the games with the status in the database.
+
+        If player_value is given, games player_value has joined are skipped.
+        This reads the whole table, joins use query_open_games instead.
+        """
+        filter_exp = f"{status_key} = :status"
         filter_exp_attr_values = {
             ":status": status_value,
-            ":name": player_value,
         }
-        response = self.connection.meta.client.scan(
-            TableName=self.DB_TABLE,
+        if player_value is not None:
+            filter_exp += f" AND NOT contains ({player_key}, :name)"
+            filter_exp_attr_values[":name"] = player_value
+        yield from self.paginate(
+            self.get_game_table().scan,
             FilterExpression=filter_exp,
             ExpressionAttributeValues=filter_exp_attr_values,
         )
-        games = response["Items"]
-        for game in games:
-            yield game
-
-        # If the scan results are greater than 1mb, dynamo will paginate
-        while self.LAST_EVALUATED_KEY in response:
-            table = self.get_game_table()
-            response = table.scan(
-                ExclusiveStartKey=response[self.LAST_EVALUATED_KEY])
-            games = response["Items"]
-            for game in games:
-                yield game
+
+    def query_open_games(self, name=None):
+        """Query the open games index, oldest first.
+
+        If name is given, games name has joined are skipped.
+        """
+        kwargs = {
+            "IndexName": self.OPEN_GAMES_INDEX,
+            "KeyConditionExpression": "open_status = :open",
+            "ExpressionAttributeValues": {
+                ":open": self.OPEN_STATUS,
+            },
+        }
+        if name is not None:
+            kwargs["FilterExpression"] = "NOT contains (players, :name)"
+            kwargs["ExpressionAttributeValues"][":name"] = name
+        yield from self.paginate(self.get_game_table().query, **kwargs)
+
+    def scan_open_games(self):
+        for game in self.query_open_games():
+            yield game["game_id"]
+
+    def remove_open_game(self, game_id):
+        self.get_game_table().update_item(
+            Key={
+                "game_id": game_id,
+            },
+            UpdateExpression="REMOVE open_status, open_since",
+        )
+
+    def paginate(self, method, **kwargs):
+        """Call the scan or query method page by page, yield the games.
+
+        Dynamo paginates results greater than 1mb, every page is read with
+        the same arguments.
+        """
+        response = method(**kwargs)
+        while True:
+            for game in response["Items"]:
+                yield self.decode_game(game)
+            if self.LAST_EVALUATED_KEY not in response:
+                break
+            response = method(
+                ExclusiveStartKey=response[self.LAST_EVALUATED_KEY],
+                **kwargs)
+
+    def iter_games(self):
+        yield from self.paginate(self.get_game_table().scan)
+
+    @staticmethod
+    def serialize(item):
+        """Return the item with its values in the low level typed format."""
+        serializer = TypeSerializer()
+        return {key: serializer.serialize(value)
+                for key, value in item.items()}
 
     def save_game_transaction(self, game, status_key, status_value):
         """Save game in a dynamodb transaction.
@@ -201,17 +1252,24 @@ class DynamoDB(DB):
         Use conditional check on game status and return whether or
         not transaction was successful.
         """
+        update = self.get_update(self.encode_game(game))
+        update["ExpressionAttributeValues"][":status"] = status_value
         try:
             self.connection.meta.client.transact_write_items(
                 TransactItems=[
                     {
-                        'Put': {
-                            'Item': game,
+                        'Update': {
+                            # the low level client takes typed attributes
+                            'Key': self.serialize({
+                                "game_id": game["game_id"],
+                            }),
                             'TableName': self.DB_TABLE,
+                            'UpdateExpression': update["UpdateExpression"],
                             'ConditionExpression': f'{status_key} = :status',
-                            'ExpressionAttributeValues': {
-                                ":status": status_value,
-                            }
+                            'ExpressionAttributeNames':
+                                update["ExpressionAttributeNames"],
+                            'ExpressionAttributeValues': self.serialize(
+                                update["ExpressionAttributeValues"]),
                         }
                     },
                 ]
@@ -222,9 +1280,333 @@ class DynamoDB(DB):
         return True
 
 
+class MemoryStore:
+    """The games held in a process's memory, for MemoryDB."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # documents and move logs, serialized as in RedisDB
+        self.games = {}
+        self.moves = {}
+        self.versions = {}
+        # ids of the open games, in the order they were opened
+        self.open_games = {}
+        self.notifier = ChangeNotifier()
+
+
+class MemoryDB(DB):
+    """Games kept in this process's memory, safe to use from its threads.
+
+    For tests, benchmarks and single process servers, each forked worker
+    starts with no games of its own. Games are stored serialized, so a
+    stored game can't be changed through a game returned by the db.
+    """
+
+    OPEN_STATUS = "open"  # Game.OPEN
+
+    @classmethod
+    def _get_connection(cls):
+        return MemoryStore()
+
+    def write_game(self, store, game_id, game):
+        """Write the game document and bump its version, holding the lock."""
+        store.games[game_id] = self.dumps_game(game)
+        store.versions[game_id] = store.versions.get(game_id, 0) + 1
+        store.notifier.notify(game_id)
+        if game.get("game_status") == self.OPEN_STATUS:
+            store.open_games.setdefault(game_id, None)
+        else:
+            store.open_games.pop(game_id, None)
+
+    def get_game(self, game_id):
+        return self.get_versioned_game(game_id)[1]
+
+    def get_version(self, game_id):
+        return self.connection.versions.get(game_id)
+
+    def get_change_notifier(self):
+        return self.connection.notifier
+
+    def get_versioned_game(self, game_id):
+        store = self.connection
+        with store.lock:
+            return store.versions.get(game_id), self.loads_game(
+                store.games[game_id], store.moves.get(game_id, []))
+
+    def get_games(self, game_ids, batch_size=None):
+        store = self.connection
+        with store.lock:
+            return [self.loads_game(store.games[game_id],
+                                    store.moves.get(game_id, []))
+                    if game_id in store.games else None
+                    for game_id in game_ids]
+
+    def save_game(self, game_id, game):
+        self.save_games([(game_id, game)])
+
+    def save_games(self, items, batch_size=None):
+        store = self.connection
+        with store.lock:
+            for game_id, game in items:
+                self.write_game(store, game_id, game)
+                if "moves" in game:
+                    store.moves[game_id] = [json.dumps(move)
+                                            for move in game["moves"]]
+
+    def append_move(self, game_id, game, move):
+        store = self.connection
+        with store.lock:
+            self.write_game(store, game_id, game)
+            store.moves.setdefault(game_id, []).append(json.dumps(move))
+
+    def scan_games(self, *args):
+        store = self.connection
+        with store.lock:
+            game_ids = list(store.games)
+        yield from game_ids
+
+    def scan_open_games(self):
+        store = self.connection
+        with store.lock:
+            game_ids = list(store.open_games)
+        yield from game_ids
+
+    def remove_open_game(self, game_id):
+        store = self.connection
+        with store.lock:
+            store.open_games.pop(game_id, None)
+
+    def iter_games(self):
+        for batch in iter_batches(self.scan_games(), BATCH_SIZE):
+            yield from self.get_games(batch)
+
+    def begin_transaction(self, game_id):
+        """Watch the game for changes, as RedisDB does with WATCH."""
+        return {"version": None}
+
+    def get_game_transaction(self, transaction, game_id):
+        transaction["version"], game = self.get_versioned_game(game_id)
+        return game
+
+    def save_game_transaction(self, transaction, game_id, game):
+        """Save the game unless it was written since it was read.
+
+        Return whether or not the game was saved.
+        """
+        store = self.connection
+        with store.lock:
+            if store.versions.get(game_id) != transaction["version"]:
+                print("The game has changed, abort transaction.")
+                return False
+            self.write_game(store, game_id, game)
+        return True
+
+    def save_fields_if_version(self, game_id, game, fields, version):
+        """Save the game unless it was written since it was at version."""
+        return self.save_game_transaction({"version": version}, game_id,
+                                          game)
+
+
+class SQLiteDB(DB):
+    """Games stored in a SQLite database file, for one node deployments.
+
+    The database is in WAL mode, so reads don't wait for a write, including
+    in the other server processes. Each game's document is stored as JSON,
+    as in RedisDB, with a row per move in the moves table. The statements
+    are constants, so they are prepared once and reused from the connection's
+    statement cache.
+    """
+
+    DB_PATH = os.environ.get("CONNECT_5_SQLITE_PATH", "connect5.db")
+    OPEN_STATUS = "open"  # Game.OPEN
+    STATEMENT_CACHE_SIZE = 64
+    # the process's threads share its connection, taking turns with the lock
+    _lock = threading.RLock()
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS games (game_id TEXT PRIMARY KEY, "
+        "game TEXT NOT NULL, game_status TEXT, opened_at REAL, "
+        "version INTEGER NOT NULL)",
+        # open games are found by status, oldest first
+        "CREATE INDEX IF NOT EXISTS games_status "
+        "ON games (game_status, opened_at)",
+        "CREATE TABLE IF NOT EXISTS moves (game_id TEXT, position INTEGER, "
+        "move TEXT NOT NULL, PRIMARY KEY (game_id, position)) WITHOUT ROWID",
+    )
+    # an open game keeps the time it was first opened
+    UPSERT_GAME = (
+        "INSERT INTO games (game_id, game, game_status, opened_at, version) "
+        "VALUES (?, ?, ?, ?, 1) ON CONFLICT (game_id) DO UPDATE SET "
+        "game = excluded.game, game_status = excluded.game_status, "
+        "opened_at = CASE WHEN excluded.opened_at IS NULL THEN NULL "
+        "ELSE coalesce(games.opened_at, excluded.opened_at) END, "
+        "version = games.version + 1")
+    UPDATE_GAME_AT_VERSION = (
+        "UPDATE games SET game = ?, game_status = ?, "
+        "opened_at = CASE WHEN ? IS NULL THEN NULL "
+        "ELSE coalesce(opened_at, ?) END, version = version + 1 "
+        "WHERE game_id = ? AND version = ?")
+    SELECT_GAME = "SELECT version, game FROM games WHERE game_id = ?"
+    SELECT_VERSION = "SELECT version FROM games WHERE game_id = ?"
+    SELECT_GAME_IDS = "SELECT game_id FROM games"
+    SELECT_OPEN_GAMES = (
+        "SELECT game_id FROM games WHERE game_status = ? ORDER BY opened_at")
+    SELECT_MOVES = "SELECT move FROM moves WHERE game_id = ? ORDER BY position"
+    DELETE_MOVES = "DELETE FROM moves WHERE game_id = ?"
+    INSERT_MOVE = (
+        "INSERT INTO moves (game_id, position, move) VALUES (?, ?, ?)")
+    APPEND_MOVE = (
+        "INSERT INTO moves (game_id, position, move) "
+        "SELECT ?, coalesce(max(position) + 1, 0), ? FROM moves "
+        "WHERE game_id = ?")
+
+    @classmethod
+    def _get_connection(cls):
+        connection = sqlite3.connect(
+            cls.DB_PATH, timeout=POOL_TIMEOUT, check_same_thread=False,
+            cached_statements=cls.STATEMENT_CACHE_SIZE)
+        connection.execute("PRAGMA journal_mode = WAL")
+        # durable once checkpointed, commits don't wait for the disk
+        connection.execute("PRAGMA synchronous = NORMAL")
+        # the tables are made on first use, so no setup is needed
+        for statement in cls.SCHEMA:
+            connection.execute(statement)
+        return connection
+
+    def get_pool_stats(self):
+        return {"max_size": 1}
+
+    def get_opened_at(self, game):
+        """Return the time to index an open game by, None if it's not open."""
+        if game.get("game_status") == self.OPEN_STATUS:
+            return time.time()
+        return None
+
+    def write_game(self, connection, game_id, game):
+        """Write the game document and bump its version, in a transaction."""
+        connection.execute(self.UPSERT_GAME, (
+            game_id, self.dumps_game(game), game.get("game_status"),
+            self.get_opened_at(game)))
+
+    def get_game(self, game_id):
+        return self.get_versioned_game(game_id)[1]
+
+    def get_version(self, game_id):
+        with self._lock:
+            row = self.connection.execute(
+                self.SELECT_VERSION, (game_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def read_game(self, connection, game_id):
+        """Return the game's version and the game, or None if there's none."""
+        row = connection.execute(self.SELECT_GAME, (game_id,)).fetchone()
+        if row is None:
+            return None
+        moves = [move for move, in connection.execute(
+            self.SELECT_MOVES, (game_id,))]
+        return row[0], self.loads_game(row[1], moves)
+
+    def get_versioned_game(self, game_id):
+        """Read the version and the game in one read transaction."""
+        with self._lock, self.connection as connection:
+            connection.execute("BEGIN")
+            versioned_game = self.read_game(connection, game_id)
+        if versioned_game is None:
+            raise KeyError(game_id)
+        return versioned_game
+
+    def get_games(self, game_ids, batch_size=None):
+        """Read a batch of games in each read transaction.
+
+        Each game is read with the same prepared statements, rather than a
+        statement for every number of games.
+        """
+        games = []
+        for batch in iter_batches(game_ids, batch_size or BATCH_SIZE):
+            with self._lock, self.connection as connection:
+                connection.execute("BEGIN")
+                for game_id in batch:
+                    versioned_game = self.read_game(connection, game_id)
+                    games.append(versioned_game and versioned_game[1])
+        return games
+
+    def save_game(self, game_id, game):
+        self.save_games([(game_id, game)])
+
+    def save_games(self, items, batch_size=None):
+        """Save a batch of games in each write transaction."""
+        for batch in iter_batches(items, batch_size or BATCH_SIZE):
+            with self._lock, self.connection as connection:
+                for game_id, game in batch:
+                    self.write_game(connection, game_id, game)
+                    if "moves" in game:
+                        connection.execute(self.DELETE_MOVES, (game_id,))
+                        connection.executemany(self.INSERT_MOVE, (
+                            (game_id, position, json.dumps(move))
+                            for position, move in enumerate(game["moves"])))
+
+    def append_move(self, game_id, game, move):
+        with self._lock, self.connection as connection:
+            self.write_game(connection, game_id, game)
+            connection.execute(self.APPEND_MOVE,
+                               (game_id, json.dumps(move), game_id))
+
+    def scan_games(self, *args):
+        with self._lock:
+            rows = self.connection.execute(self.SELECT_GAME_IDS).fetchall()
+        for game_id, in rows:
+            yield game_id
+
+    def scan_open_games(self):
+        with self._lock:
+            rows = self.connection.execute(
+                self.SELECT_OPEN_GAMES, (self.OPEN_STATUS,)).fetchall()
+        for game_id, in rows:
+            yield game_id
+
+    def remove_open_game(self, game_id):
+        # open games are found by their status, there's no index to update
+        pass
+
+    def iter_games(self):
+        for batch in iter_batches(self.scan_games(), BATCH_SIZE):
+            yield from self.get_games(batch)
+
+    def begin_transaction(self, game_id):
+        """Watch the game for changes, as RedisDB does with WATCH."""
+        return {"version": None}
+
+    def get_game_transaction(self, transaction, game_id):
+        transaction["version"], game = self.get_versioned_game(game_id)
+        return game
+
+    def save_game_transaction(self, transaction, game_id, game):
+        """Save the game unless it was written since it was read.
+
+        Return whether or not the game was saved.
+        """
+        opened_at = self.get_opened_at(game)
+        with self._lock, self.connection as connection:
+            cursor = connection.execute(self.UPDATE_GAME_AT_VERSION, (
+                self.dumps_game(game), game.get("game_status"), opened_at,
+                opened_at, game_id, transaction["version"]))
+        if cursor.rowcount == 0:
+            print("The game has changed, abort transaction.")
+            return False
+        return True
+
+    def save_fields_if_version(self, game_id, game, fields, version):
+        """Save the game unless it was written since it was at version."""
+        return self.save_game_transaction({"version": version}, game_id,
+                                          game)
+
+
 DB_OPTIONS = {
     "redis": RedisDB,
+    "redis_hash": RedisHashDB,
+    "redis_script": RedisScriptDB,
     "dynamodb": DynamoDB,
+    "memory": MemoryDB,
+    "sqlite": SQLiteDB,
 }
 
 
@@ -0,0 +1,98 @@
+"""Server module for streaming a game's changes as Server-Sent Events.
+
+The stream starts with a "state" event, the game state as GET /game/<id>
+returns it, then sends an event for each change: "move" (column, name, number
+and disc of each move made), "players" (a player joined), "turn" and
+"status" (the game status, and the winner's turn). Games stored without a move
+log send a new "state" instead of their moves. Each event's id is the game's
+version, when it has one, and the stream ends once the game is finished.
+"""
+import functools
+import os
+import time
+
+from src.server.calls import Sleep, Wait
+from src.server.db import DB
+from src.server.game import Game
+from src.server.serializers import get_serializer
+
+# seconds between comments sent to keep an idle stream open
+KEEP_ALIVE = float(os.environ.get("CONNECT_5_EVENTS_KEEP_ALIVE", 15))
+# seconds between reads of games that have no version
+POLL_INTERVAL = 2
+serializer = get_serializer()
+
+STATE = "state"
+MOVE = "move"
+PLAYERS = "players"
+TURN = "turn"
+STATUS = "status"
+
+
+def format_event(event, data, event_id=None):
+    """Return the event as a Server-Sent Events message."""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {serializer.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def get_events(game, before, get_state):
+    """Return the (event, data) of the changes to the game since before.
+
+    before is the game's state when the last events were sent, get_state()
+    returns the current state for clients, if it needs sending.
+    """
+    after = game.game
+    events = []
+    if "moves" in after:
+        for column, name, number in after["moves"][
+                len(before.get("moves", [])):]:
+            events.append((MOVE, {
+                "column": int(column), "name": name, "number": int(number),
+                "disc": game.get_player_disc_colour(name)}))
+    elif after != before:
+        events.append((STATE, get_state()))
+    if after.get("players") != before.get("players"):
+        events.append((PLAYERS, {"players": after.get("players")}))
+    if after.get("turn") != before.get("turn"):
+        events.append((TURN, {"turn": after.get("turn")}))
+    if after.get("game_status") != before.get("game_status"):
+        events.append((STATUS, {"game_status": after.get("game_status"),
+                                "turn": after.get("turn")}))
+    return events
+
+
+def stream_events(game_id, get_state, keep_alive=KEEP_ALIVE):
+    """Yield the game's events as Server-Sent Events messages.
+
+    The calls reading the game are yielded in between, to be made by the
+    server (see calls.py). The stream waits on the game's version, so is
+    woken by the db when the game changes, or reads the game every
+    POLL_INTERVAL if it has none. get_state(game) returns the state for
+    clients of the loaded game.
+    """
+    game = Game(game_id)
+    version = yield lambda: game.load_cached_game(game.get_version())
+    yield format_event(STATE, get_state(game), version)
+    sent_at = time.monotonic()
+    while game.game.get("game_status") not in DB.FINISHED_STATUSES:
+        before = game.game
+        if version is None:
+            yield Sleep(POLL_INTERVAL)
+        else:
+            new_version = yield Wait(game, version, keep_alive)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+        version = yield functools.partial(game.load_cached_game, version)
+        events = get_events(game, before, lambda: get_state(game))
+        for event, data in events:
+            yield format_event(event, data, version)
+        if events:
+            sent_at = time.monotonic()
+        elif time.monotonic() - sent_at >= keep_alive:
+            yield ": keep-alive\n\n"
+            sent_at = time.monotonic()
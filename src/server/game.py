@@ -1,11 +1,18 @@
 """Server module for holding connect 5 game logic."""
+import os
 import uuid
 
 from operator import add, sub
 
+from src.server import ai
+from src.server.bitboard import BitBoard
+from src.server.cache import GameCache
 from src.server.db import get_db
+from src.server.lines import get_winning_lines
+from src.server.utils import COMPACT_BOARD_FORMAT, encode_board
 
 db = get_db()
+game_cache = GameCache()
 
 
 class Game:
@@ -20,41 +27,283 @@ class Game:
     PLAYING = "playing"
     WON = "won"
     DISCONNECTED = "disconnected"
+    COMPUTER = "computer"
+    # play_move's result for a move out of turn, or once the game is over
+    NOT_TURN = "not_turn"
     WINNING_COUNT = 5
     MAX_COUNT = WINNING_COUNT - 1
     BOARD_ROWS = 6
     BOARD_COLS = 9
+    MAX_BOARD_SIZE = 25
+    BOARD_ENGINE = "board"
+    BITBOARD_ENGINE = "bitboard"
+    ENGINE = os.environ.get("CONNECT_5_ENGINE", BOARD_ENGINE)
+    # fields the board is replayed from, or stored in for older games
+    BOARD_FIELDS = ("board", "moves", "rows", "cols", "players")
 
     def __init__(self, game_id):
         self.game_id = game_id
         self.game = None
+        self._board = None
+        self._bitboard = None
+        self._new_move = None
+
+    @classmethod
+    def from_game(cls, game):
+        """Return a Game for an already loaded game document."""
+        instance = cls(game.get("game_id"))
+        instance.game = game
+        return instance
 
     @property
     def check_has_won_methods(self):
-        """Methods to check for a winning move."""
+        """Methods to check for a winning move, walking out from the move.
+
+        Only used as a reference for the default board geometry, has_won
+        checks the precomputed winning lines of the game's geometry instead.
+        """
         return [self.check_vertical, self.check_horizontal,
                 self.check_diagonal_1, self.check_diagonal_2]
 
+    @property
+    def rows(self):
+        return int(self.game.get("rows", self.BOARD_ROWS))
+
+    @property
+    def cols(self):
+        return int(self.game.get("cols", self.BOARD_COLS))
+
+    @property
+    def winning_count(self):
+        return int(self.game.get("winning_count", self.WINNING_COUNT))
+
+    @property
+    def board(self):
+        """The game's board, replayed from its moves on first use.
+
+        Games saved before the move log keep their board in the document.
+        """
+        if self._board is None:
+            if "moves" in self.game:
+                self._board = self.replay_board(self.game["moves"])
+            else:
+                self._board = self.game["board"]
+        return self._board
+
+    @property
+    def bitboard(self):
+        """Bitboard of the game's board, built on first use."""
+        if self._bitboard is None:
+            self._bitboard = BitBoard.from_board(
+                self.board, self.rows, self.winning_count,
+                self.player_discs, self.EMPTY)
+        return self._bitboard
+
     def load_game(self):
         """Load the game state from the db for this instance."""
-        self.game = db.get_game(self.game_id)
+        self.set_game(db.get_game(self.game_id))
+        self.set_heights()
+
+    def get_version(self):
+        """Return the game's version in the db, None if it has none."""
+        return db.get_version(self.game_id)
+
+    def wait_for_version(self, since, timeout):
+        """Wait up to timeout seconds for the game to change from since.
+
+        Return the game's version, since if it didn't change in time.
+        """
+        return db.wait_for_version(self.game_id, since, timeout)
+
+    def load_cached_game(self, version):
+        """Load the game state to read, from the cache if it's up to date.
+
+        version is the game's version, just read with get_version. Nothing is
+        read from the db if the cached state is at this version. The state
+        may be shared with other requests, so must not be changed. Return the
+        version of the state loaded.
+        """
+        cached = None if version is None else \
+            game_cache.get(self.game_id, version)
+        if cached is not None:
+            self.set_game(cached[0])
+            self._board = cached[1]
+            self._state_bodies = cached[2]
+            return version
+        version, game = db.get_versioned_game(self.game_id)
+        self.set_game(game)
+        self.set_heights()
+        if version is not None:
+            self._state_bodies = {}
+            game_cache.put(self.game_id, version,
+                           (self.game, self.board, self._state_bodies))
+        return version
+
+    def set_heights(self):
+        heights = self.game.get("heights")
+        if heights is None:
+            # older games were saved without the column heights
+            self.game["heights"] = self.get_heights(self.board)
+        else:
+            self.game["heights"] = [int(height) for height in heights]
+
+    def load_fields(self, fields):
+        """Load only the given fields of the game state from the db.
+
+        The fields the board is replayed from are loaded with "board".
+        """
+        fields = set(fields)
+        if "board" in fields:
+            fields.update(self.BOARD_FIELDS)
+        self.set_game(db.get_fields(self.game_id, sorted(fields)))
+
+    def set_game(self, game):
+        """Use the given game state, dropping what was built from the last."""
+        self.game = game
+        self._board = None
+        self._bitboard = None
+        self._new_move = None
+        # serialized states, by board format, shared through the cache
+        self._state_bodies = None
+
+    def save_game(self, fields=None):
+        """Save the game, only appending the new move if one was made.
+
+        If fields is given only those fields have changed.
+        """
+        if self._new_move is not None:
+            db.append_move(self.game_id, self.game, self._new_move)
+            self._new_move = None
+        elif fields is not None and "moves" in self.game:
+            db.save_fields(self.game_id, self.game, fields)
+        else:
+            # games saved before the move log also save their changed board
+            db.save_game(self.game_id, self.game)
+
+    def replay_board(self, moves):
+        """Return the board built by playing the moves, in order."""
+        board = [[self.EMPTY] * self.rows for _ in range(self.cols)]
+        heights = [0] * self.cols
+        for column, name, number in moves:
+            column = int(column) - 1
+            if heights[column] == self.rows:
+                raise ValueError(f"Move {number} is in a full column.")
+            heights[column] += 1
+            board[column][self.rows - heights[column]] = \
+                self.get_player_disc_colour(name)
+        return board
+
+    def get_state(self, fields=None, board_format=None):
+        """Return the game state for clients, with the board but no moves.
+
+        If fields is given only those fields are returned. The board is
+        encoded with encode_board if the board format is compact.
+        """
+        if fields is None:
+            state = {key: value for key, value in self.game.items()
+                     if key != "moves"}
+        else:
+            state = {field: self.game[field] for field in fields
+                     if field in self.game and field != "moves"}
+        if fields is None or "board" in fields:
+            state["board"] = encode_board(self.board) \
+                if board_format == COMPACT_BOARD_FORMAT else self.board
+        return state
+
+    def get_state_body(self, serializer, board_format=None):
+        """Return the serialized get_state() of the game.
+
+        A game loaded with load_cached_game is serialized once per version
+        and board format, in any request, and the body reused after that.
+        Any format but the compact one is the default, with one body.
+        """
+        if board_format != COMPACT_BOARD_FORMAT:
+            board_format = None
+        if self._state_bodies is None:
+            return serializer.dumps(self.get_state(board_format=board_format))
+        body = self._state_bodies.get((serializer.name, board_format))
+        if body is None:
+            body = serializer.dumps(self.get_state(board_format=board_format))
+            self._state_bodies[(serializer.name, board_format)] = body
+        return body
+
+    @classmethod
+    def get_heights(cls, board):
+        """Return the number of discs in each column of the board."""
+        heights = []
+        for cells in board:
+            for idx, cell in enumerate(cells):
+                if cell != cls.EMPTY:
+                    heights.append(len(cells) - idx)
+                    break
+            else:
+                heights.append(0)
+        return heights
 
     @classmethod
-    def start_new_game(cls, name, max_players):
-        """Create a new game id and new game state. Return new game ID."""
+    def is_valid_geometry(cls, rows, cols, winning_count):
+        """Return whether a new game can be played on this size of board."""
+        for value in (rows, cols, winning_count):
+            if not isinstance(value, int) or isinstance(value, bool):
+                return False
+        if not (0 < rows <= cls.MAX_BOARD_SIZE and
+                0 < cols <= cls.MAX_BOARD_SIZE):
+            return False
+        return 1 < winning_count <= max(rows, cols)
+
+    @classmethod
+    def is_valid_column(cls, column, cols=MAX_BOARD_SIZE):
+        """Return whether column (1 based) is on a board cols wide."""
+        if not isinstance(column, int) or isinstance(column, bool):
+            return False
+        return 1 <= column <= cols
+
+    @classmethod
+    def start_new_game(cls, name, max_players, rows=BOARD_ROWS,
+                       cols=BOARD_COLS, winning_count=WINNING_COUNT,
+                       opponent=None):
+        """Create a new game id and new game state. Return new game ID.
+
+        Against the computer the game is full and ready to play straight away.
+        """
         new_game_id = str(uuid.uuid4())
         new_game = {
             "game_id": new_game_id,
-            "board": [[cls.EMPTY for i in range(cls.BOARD_ROWS)]
-                      for j in range(cls.BOARD_COLS)],
+            "moves": [],
+            "heights": [0] * cols,
+            "rows": rows,
+            "cols": cols,
+            "winning_count": winning_count,
             "game_status": cls.OPEN,
             "players": [name],
             "turn": name,
             "max_players": max_players,
+            "opponent": opponent,
         }
+        if opponent == cls.COMPUTER:
+            new_game["players"].append(cls.COMPUTER)
+            new_game["max_players"] = 2
+            new_game["game_status"] = cls.PLAYING
         db.save_game(new_game_id, new_game)
         return new_game_id
 
+    def play_move(self, name, column):
+        """Load the game and play the user's turn, return as move().
+
+        A db with atomic moves makes the whole move itself, in one round trip,
+        and the game state it returns is loaded. It also rejects moves when
+        it isn't the user's turn or the game is over, returning NOT_TURN.
+        """
+        if db.ATOMIC_MOVES:
+            moved = db.atomic_move(self.game_id, name, column)
+            if moved is not None:
+                move_result, game = moved
+                self.set_game(game)
+                return move_result
+        # game the db can't move, e.g. saved before the move log
+        self.load_game()
+        return self.move(name, column)
+
     def move(self, name, column):
         """Play the users turn.
 
@@ -63,34 +312,89 @@ class Game:
         - True  : winning move
         - False : non winning move
         """
+        if not self.is_valid_column(column, self.cols):
+            return None
+        self.game.pop("hint", None)
         disc = self.get_player_disc_colour(name)
         coordinates = self.make_move(column, disc)
         if coordinates is None:
             return None
-        elif self.has_won(disc, coordinates):
+        self.log_move(name, column)
+        if self.has_won(disc, coordinates):
             self.game_over()
             return True
         else:
             self.toggle_turn(name)
             return False
 
+    def is_computer_turn(self):
+        """Return whether it's the computer opponent's turn to move."""
+        return (self.game.get("opponent") == self.COMPUTER and
+                self.game["game_status"] == self.PLAYING and
+                self.game["turn"] == self.COMPUTER)
+
+    def search_args(self, name):
+        """Return the arguments for ai.find_move to search for name's move.
+
+        Only two player games can be searched.
+        """
+        disc = self.get_player_disc_colour(name)
+        opponent_disc, = (self.get_player_disc_colour(player)
+                          for player in self.game["players"]
+                          if player != name)
+        return (self.board, self.rows, self.winning_count, disc,
+                opponent_disc, self.EMPTY)
+
+    def play_computer_turn(self, result=None):
+        """Play the computer's best move, searching for it if not given.
+
+        Return the result of the move, or None if the board is full.
+        """
+        if result is None:
+            result = ai.find_move(*self.search_args(self.COMPUTER))
+        if result.column is None:
+            return None
+        return self.move(self.COMPUTER, result.column + 1)
+
+    def save_hint(self, name, result, version):
+        """Save the best move found for the player, until the next move.
+
+        Nothing is saved if the game was written since it was at version,
+        read before the game was loaded. Return whether it was saved.
+        """
+        column = None if result.column is None else result.column + 1
+        self.game["hint"] = {"name": name, "column": column}
+        return db.save_fields_if_version(self.game_id, self.game, ["hint"],
+                                         version)
+
     def make_move(self, move, disc):
         """Make move on board and return coordinates of move."""
         column = move - 1
-        board = self.game["board"]
-        # Check if this row is already full
-        if board[column][0] != self.EMPTY:
+        board = self.board
+        heights = self.game["heights"]
+        if self.ENGINE == self.BITBOARD_ENGINE:
+            row = self.bitboard.drop(column, disc)
+        elif heights[column] == self.rows:
+            # This column is already full
+            row = None
+        else:
+            row = self.rows - 1 - heights[column]
+        if row is None:
             return None
         # Drop disc
-        for idx, cell in enumerate(board[column]):
-            if cell != self.EMPTY:
-                row = idx - 1
-                break
-        else:
-            row = idx
         board[column][row] = disc
+        heights[column] += 1
         return (column, row)
 
+    def log_move(self, name, move):
+        """Add the move to the game's move log, to be appended when saved."""
+        if "moves" not in self.game:
+            # game saved before the move log, its board is saved instead
+            return
+        moves = self.game["moves"]
+        self._new_move = [move, name, len(moves) + 1]
+        moves.append(self._new_move)
+
     def get_player_disc_colour(self, name):
         """Return the player's disc colour (Player 1 is always 'X')."""
         player_number = self.game["players"].index(name)
@@ -98,9 +402,13 @@ class Game:
 
     def has_won(self, disc, coordinates):
         """Returns True if move wins, otherwise returns False"""
-        board = self.game["board"]
-        for check_method in self.check_has_won_methods:
-            if check_method(board, disc, *coordinates) is True:
+        if self.ENGINE == self.BITBOARD_ENGINE:
+            return self.bitboard.has_won(disc, *coordinates)
+        board = self.board
+        winning_lines = get_winning_lines(
+            self.cols, self.rows, self.winning_count)
+        for line in winning_lines[coordinates]:
+            if all(board[column][row] == disc for column, row in line):
                 return True
         return False
 
@@ -214,7 +522,7 @@ class Game:
             else:
                 # other player has not joined yet
                 self.game["turn"] = None
-        db.save_game(self.game_id, self.game)
+        self.save_game(["turn"])
 
     def game_over(self, won=True):
         """Set state to a game over state (player won / player disconnected)"""
@@ -222,4 +530,4 @@ class Game:
             self.game["game_status"] = self.WON
         else:
             self.game["game_status"] = self.DISCONNECTED
-        db.save_game(self.game_id, self.game)
+        self.save_game(["game_status"])
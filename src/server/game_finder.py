@@ -39,8 +39,8 @@ class RedisGameFinder(GameFinder):
 
     @classmethod
     def join_game(cls, name):
-        """Use redis scan to search for an available game."""
-        for game_id in db.scan_games():
+        """Search the open games index for an available game."""
+        for game_id in db.scan_open_games():
             if cls._join_game(name, game_id):
                 return game_id
         else:
@@ -53,6 +53,7 @@ class RedisGameFinder(GameFinder):
         game = db.get_game_transaction(transaction, game_id)
 
         if game.get("game_status") != Game.OPEN:
+            db.remove_open_game(game_id)
             return False
         if name in game["players"]:
             return False
@@ -63,12 +64,23 @@ class RedisGameFinder(GameFinder):
         return db.save_game_transaction(transaction, game_id, game)
 
 
+class RedisScriptGameFinder(GameFinder):
+
+    @classmethod
+    def join_game(cls, name):
+        """Claim a seat in an open game in one step, with the join script.
+
+        The script makes the same change to the game as add_player.
+        """
+        return db.join_open_game(name)
+
+
 class DynamoGameFinder(GameFinder):
 
     @classmethod
     def join_game(cls, name):
-        """Use dynamo scan with filter to search for an available game."""
-        for game in db.scan_games("game_status", Game.OPEN, name):
+        """Query the open games index for an available game."""
+        for game in db.query_open_games(name):
             if cls._join_game(name, game):
                 return game["game_id"]
         else:
@@ -83,7 +95,12 @@ class DynamoGameFinder(GameFinder):
 
 GAME_FINDERS = {
     "redis": RedisGameFinder,
+    "redis_hash": RedisGameFinder,
+    "redis_script": RedisScriptGameFinder,
     "dynamodb": DynamoGameFinder,
+    # the memory and sqlite dbs watch a game for changes as Redis does
+    "memory": RedisGameFinder,
+    "sqlite": RedisGameFinder,
 }
 
 
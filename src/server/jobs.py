@@ -0,0 +1,235 @@
+"""
+Module for running move searches (computer turns and hints) away from the
+request workers. Searches are queued as jobs and their results are written
+back to the game once they finish.
+"""
+import json
+import os
+import threading
+import time
+
+import redis
+
+from concurrent.futures import ProcessPoolExecutor
+
+from src.server import ai
+from src.server.db import RedisDB
+from src.server.game import Game
+
+COMPUTER_TURN = "computer_turn"
+HINT = "hint"
+JOB_WORKERS = int(os.environ.get("CONNECT_5_JOB_WORKERS", 2))
+
+
+def new_job(job_type, game, name):
+    """Return a job to search for name's move in the game's position."""
+    return {
+        "type": job_type,
+        "game_id": game.game_id,
+        "name": name,
+        "heights": list(game.game["heights"]),
+        "queued_at": time.time(),
+    }
+
+
+def load_job_game(job):
+    """Return the job's game and its version, read before the game."""
+    game = Game(job["game_id"])
+    version = game.get_version()
+    game.load_game()
+    return game, version
+
+
+def finish_job(job, result, game=None, version=None):
+    """Write the search result back to the game, unless it has moved on.
+
+    The game and its version are loaded if game is None.
+    """
+    if game is None:
+        game, version = load_job_game(job)
+    if game.game["heights"] != job["heights"]:
+        print(f"Game {job['game_id']} has changed, drop {job['type']}.")
+        return
+    if job["type"] == COMPUTER_TURN:
+        if game.is_computer_turn():
+            game.play_computer_turn(result)
+    elif not game.save_hint(job["name"], result, version):
+        print(f"Game {job['game_id']} has changed, drop {job['type']}.")
+
+
+def run_job(job):
+    """Load the game, search for the move and write back the result."""
+    game, version = load_job_game(job)
+    result = ai.find_move(*game.search_args(job["name"]))
+    finish_job(job, result, game, version)
+
+
+class JobStats:
+    """Thread safe count and latency (queued to written back) of jobs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency, failed=False):
+        with self._lock:
+            self.completed += 1
+            self.failed += int(failed)
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def as_dict(self):
+        with self._lock:
+            average = self.total_latency / self.completed \
+                if self.completed else 0.0
+            return {
+                "completed": self.completed,
+                "failed": self.failed,
+                "average_latency": average,
+                "max_latency": self.max_latency,
+            }
+
+
+class JobQueue:
+    """Base class for queues of search jobs."""
+
+    def submit(self, job_type, game, name):
+        """Queue a search for name's move, return without waiting for it."""
+        raise NotImplementedError()
+
+    def get_stats(self):
+        """Return the queue depth and the latency of finished jobs."""
+        raise NotImplementedError()
+
+
+class ProcessPoolJobQueue(JobQueue):
+    """Search in a pool of worker processes, write back in this process."""
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.stats = JobStats()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._queued = 0
+
+    @property
+    def executor(self):
+        """Pool of search processes, started on first use (after fork)."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers)
+        return self._executor
+
+    def submit(self, job_type, game, name):
+        job = new_job(job_type, game, name)
+        search_args = game.search_args(name)
+        with self._lock:
+            self._queued += 1
+        future = self.executor.submit(ai.find_move, *search_args)
+        future.add_done_callback(lambda future: self._done(job, future))
+
+    def _done(self, job, future):
+        failed = False
+        try:
+            finish_job(job, future.result())
+        except Exception as exc:
+            failed = True
+            print(f"Job {job['type']} for game {job['game_id']} failed: "
+                  f"{exc!r}")  # log
+        finally:
+            with self._lock:
+                self._queued -= 1
+            self.stats.record(time.time() - job["queued_at"], failed)
+
+    def get_stats(self):
+        stats = self.stats.as_dict()
+        stats["queue_depth"] = self._queued
+        return stats
+
+
+class RedisJobQueue(JobQueue):
+    """Queue jobs on a Redis list, to be run by the worker service."""
+
+    QUEUE_KEY = f"{RedisDB.AUX_KEY_PREFIX}jobs"
+    STATS_KEY = f"{RedisDB.AUX_KEY_PREFIX}job_stats"
+    POP_TIMEOUT = 5
+
+    def __init__(self):
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = RedisDB._get_connection()
+        return self._connection
+
+    def submit(self, job_type, game, name):
+        job = new_job(job_type, game, name)
+        self.connection.lpush(self.QUEUE_KEY, json.dumps(job))
+
+    def get_stats(self):
+        stats = self.connection.hgetall(self.STATS_KEY)
+        completed = int(stats.get("completed", 0))
+        total_latency = float(stats.get("total_latency", 0))
+        return {
+            "completed": completed,
+            "failed": int(stats.get("failed", 0)),
+            "average_latency": total_latency / completed
+            if completed else 0.0,
+            "max_latency": float(stats.get("max_latency", 0)),
+            "queue_depth": self.connection.llen(self.QUEUE_KEY),
+        }
+
+    def record(self, latency, failed):
+        pipeline = self.connection.pipeline()
+        pipeline.hincrby(self.STATS_KEY, "completed", 1)
+        pipeline.hincrby(self.STATS_KEY, "failed", int(failed))
+        pipeline.hincrbyfloat(self.STATS_KEY, "total_latency", latency)
+        pipeline.execute()
+        max_latency = float(
+            self.connection.hget(self.STATS_KEY, "max_latency") or 0)
+        if latency > max_latency:
+            self.connection.hset(self.STATS_KEY, "max_latency", latency)
+
+    def work(self, max_jobs=None):
+        """Pop and run jobs until max_jobs have run (forever if None)."""
+        jobs_run = 0
+        while max_jobs is None or jobs_run < max_jobs:
+            try:
+                popped = self.connection.brpop(self.QUEUE_KEY,
+                                               self.POP_TIMEOUT)
+            except redis.TimeoutError:
+                # the socket timeout can run out before POP_TIMEOUT does
+                continue
+            if popped is None:
+                continue
+            job = json.loads(popped[1])
+            failed = False
+            try:
+                run_job(job)
+            except Exception as exc:
+                failed = True
+                print(f"Job {job['type']} for game {job['game_id']} failed: "
+                      f"{exc!r}")  # log
+            self.record(time.time() - job["queued_at"], failed)
+            jobs_run += 1
+
+
+JOB_QUEUES = {
+    "process": ProcessPoolJobQueue,
+    "redis": RedisJobQueue,
+}
+
+_job_queue = None
+
+
+def get_job_queue():
+    """Return this process's job queue, created on first use."""
+    global _job_queue
+    if _job_queue is None:
+        queue_name = os.environ.get("CONNECT_5_JOB_QUEUE", "process")
+        _job_queue = JOB_QUEUES[queue_name]()
+    return _job_queue
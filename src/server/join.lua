@@ -0,0 +1,65 @@
+-- Claim a seat in the oldest open game the player isn't already in, in one
+-- step, the same change to the game as GameFinder.add_player in
+-- game_finder.py, for RedisScriptGameFinder.
+--
+-- KEYS: the open games index
+-- ARGV: the player's name, the number of games read from the index at a time,
+--       the prefix of the games' version keys, the channel the game's id is
+--       published to once it's changed
+--
+-- The games found in the index are read and written too, their hash and
+-- version keys built here rather than declared in KEYS, so the script needs a
+-- single Redis instance (not Redis Cluster, where the keys a script touches
+-- must be declared and in one slot).
+--
+-- Returns the id of the game joined, or false if there's no game to join.
+local open_games_key = KEYS[1]
+local name, page_size = ARGV[1], tonumber(ARGV[2])
+local version_key_prefix = ARGV[3]
+local changes_channel = ARGV[4]
+
+local start = 0
+while true do
+    local game_ids = redis.call("ZRANGE", open_games_key, start,
+                                start + page_size - 1)
+    if #game_ids == 0 then
+        return false
+    end
+    local removed = 0
+    for _, game_id in ipairs(game_ids) do
+        local fields = redis.call("HMGET", game_id, "players", "max_players",
+                                  "turn", "game_status")
+        if not (fields[1] and fields[3] and fields[4]) or
+                cjson.decode(fields[4]) ~= "open" then
+            -- deleted, incomplete or no longer open, drop it from the index
+            redis.call("ZREM", open_games_key, game_id)
+            removed = removed + 1
+        else
+            local players = cjson.decode(fields[1])
+            local joined = false
+            for _, player in ipairs(players) do
+                if player == name then
+                    joined = true
+                end
+            end
+            if not joined then
+                players[#players + 1] = name
+                local turn = fields[3]
+                if cjson.decode(turn) == cjson.null then
+                    turn = cjson.encode(name)
+                end
+                local status = "open"
+                if #players == tonumber(fields[2]) then
+                    status = "playing"
+                    redis.call("ZREM", open_games_key, game_id)
+                end
+                redis.call("HSET", game_id, "players", cjson.encode(players),
+                           "turn", turn, "game_status", cjson.encode(status))
+                redis.call("INCR", version_key_prefix .. game_id)
+                redis.call("PUBLISH", changes_channel, game_id)
+                return game_id
+            end
+        end
+    end
+    start = start + #game_ids - removed
+end
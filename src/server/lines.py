@@ -0,0 +1,29 @@
+"""Server module for the precomputed winning lines of each board geometry."""
+from functools import lru_cache
+
+# Only the most recently used board geometries keep their tables in memory
+MAX_CACHED_GEOMETRIES = 16
+
+# Steps (column, row) for vertical, horizontal and both diagonal lines
+LINE_STEPS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+@lru_cache(maxsize=MAX_CACHED_GEOMETRIES)
+def get_winning_lines(cols, rows, winning_count):
+    """Return a map of each cell to the winning lines passing through it.
+
+    A line is a tuple of (column, row) coordinates, winning_count long.
+    """
+    lines = {(column, row): [] for column in range(cols)
+             for row in range(rows)}
+    for column, row in list(lines):
+        for col_step, row_step in LINE_STEPS:
+            end_column = column + col_step * (winning_count - 1)
+            end_row = row + row_step * (winning_count - 1)
+            if not (0 <= end_column < cols and 0 <= end_row < rows):
+                continue
+            line = tuple((column + col_step * idx, row + row_step * idx)
+                         for idx in range(winning_count))
+            for cell in line:
+                lines[cell].append(line)
+    return {cell: tuple(cell_lines) for cell, cell_lines in lines.items()}
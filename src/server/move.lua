@@ -0,0 +1,123 @@
+-- Make a player's move in one step, the same move as Game.move in game.py
+-- (which is the reference implementation), for RedisScriptDB.
+--
+-- KEYS: the game's hash, its move log, the open games index, its version
+-- ARGV: the player's name, the column (1 based), seconds a won game is kept
+-- (0 keeps it), the channel the game's id is published to once it's changed
+--
+-- Returns {outcome, game hash (field, value, ...), move log}, where outcome is
+-- "won", "moved", "not_turn" (not the player's turn, or the game is over) or
+-- "invalid" (no space in the column). Returns {"legacy"} for games the script can't move (saved
+-- before the move log), Game.move makes their moves instead.
+local game_key, moves_key, open_games_key = KEYS[1], KEYS[2], KEYS[3]
+local version_key = KEYS[4]
+local name, column = ARGV[1], tonumber(ARGV[2])
+local finished_game_ttl = tonumber(ARGV[3]) or 0
+local changes_channel = ARGV[4]
+
+local fields = redis.call(
+    "HMGET", game_key, "players", "max_players", "turn", "game_status",
+    "heights", "rows", "cols", "winning_count", "board")
+if not (fields[1] and fields[3] and fields[4] and fields[5] and fields[6] and
+        fields[7] and fields[8]) or fields[9] then
+    return {"legacy"}
+end
+
+local function state(outcome)
+    return {outcome, redis.call("HGETALL", game_key),
+            redis.call("LRANGE", moves_key, 0, -1)}
+end
+
+local players = cjson.decode(fields[1])
+local max_players = tonumber(fields[2])
+local turn = cjson.decode(fields[3])
+local status = cjson.decode(fields[4])
+local heights = cjson.decode(fields[5])
+local rows, cols = tonumber(fields[6]), tonumber(fields[7])
+local winning_count = tonumber(fields[8])
+
+if turn ~= name or (status ~= "open" and status ~= "playing") then
+    return state("not_turn")
+end
+if not column or column % 1 ~= 0 or column < 1 or column > cols or
+        heights[column] >= rows then
+    return state("invalid")
+end
+
+local player
+for index, player_name in ipairs(players) do
+    if player_name == name then
+        player = index
+    end
+end
+
+-- name of the player owning each cell, rows counted up from the bottom
+local moves = redis.call("LRANGE", moves_key, 0, -1)
+local owners, filled = {}, {}
+for c = 1, cols do
+    filled[c] = 0
+end
+for _, data in ipairs(moves) do
+    local move = cjson.decode(data)
+    local c = tonumber(move[1])
+    filled[c] = filled[c] + 1
+    owners[(c - 1) * rows + filled[c]] = move[2]
+end
+
+local function owner(c, y)
+    if c < 1 or c > cols or y < 1 or y > rows then
+        return nil
+    end
+    return owners[(c - 1) * rows + y]
+end
+
+-- drop the disc, then count the player's discs in a row through it
+local height = heights[column] + 1
+heights[column] = height
+owners[(column - 1) * rows + height] = name
+local won = false
+for _, step in ipairs({{1, 0}, {0, 1}, {1, 1}, {1, -1}}) do
+    local count = 1
+    for _, sign in ipairs({1, -1}) do
+        local c, y = column + sign * step[1], height + sign * step[2]
+        while owner(c, y) == name do
+            count = count + 1
+            c, y = c + sign * step[1], y + sign * step[2]
+        end
+    end
+    if count >= winning_count then
+        won = true
+    end
+end
+
+redis.call("RPUSH", moves_key, cjson.encode({column, name, #moves + 1}))
+if won then
+    status = "won"
+    redis.call("HSET", game_key, "heights", cjson.encode(heights),
+               "game_status", cjson.encode(status))
+else
+    -- as Game.toggle_turn, no one's turn until the next player has joined
+    local next_turn = "null"
+    if players[player + 1] then
+        next_turn = cjson.encode(players[player + 1])
+    elseif player + 1 > max_players then
+        next_turn = cjson.encode(players[1])
+    end
+    redis.call("HSET", game_key, "heights", cjson.encode(heights),
+               "turn", next_turn)
+end
+redis.call("HDEL", game_key, "hint")
+redis.call("INCR", version_key)
+redis.call("PUBLISH", changes_channel, game_key)
+if status ~= "open" then
+    redis.call("ZREM", open_games_key, game_key)
+end
+if won and finished_game_ttl > 0 then
+    for _, key in ipairs({game_key, moves_key, version_key}) do
+        redis.call("EXPIRE", key, finished_game_ttl)
+    end
+end
+if won then
+    return state("won")
+end
+return state("moved")
@@ -0,0 +1,159 @@
+"""
+Replays the move log of every stored game through the game engine, across a
+pool of processes, and checks the stored state against the replayed one.
+
+Games are streamed from the db and sent to the pool in chunks, with a bounded
+number of chunks in flight, so memory use doesn't grow with the number of
+games. Games whose stored state doesn't match the replay are printed as JSON
+lines.
+
+Usage: python -m src.server.replay [--processes 4] [--chunk-size 500]
+"""
+import argparse
+import json
+import multiprocessing
+import time
+
+from collections import Counter, deque
+
+from src.server.db import get_db, iter_batches
+from src.server.game import Game
+
+CHUNK_SIZE = 500
+# chunks sent to the pool ahead of the results read back, per process
+CHUNKS_IN_FLIGHT = 2
+
+NO_MOVE_LOG = "no move log"
+BAD_MOVE_NUMBERS = "move numbers out of sequence"
+MOVE_OUT_OF_TURN = "move out of turn"
+ILLEGAL_MOVE = "illegal move"
+MOVE_AFTER_WIN = "move after the game was won"
+HEIGHTS_MISMATCH = "heights differ from the replay"
+NOT_WON = "winning move but game not won"
+NO_WINNING_MOVE = "game won without a winning move"
+WRONG_WINNER = "turn is not the winner's"
+
+
+def replay_game(game):
+    """Replay the game's moves from an empty board, return a result dict.
+
+    Nothing is saved, the replay is done on a copy of the game.
+    """
+    if "moves" not in game:
+        return new_result(game, None, None, [NO_MOVE_LOG])
+    replay = Game.from_game({
+        key: game[key] for key in
+        ("game_id", "players", "max_players", "rows", "cols",
+         "winning_count") if key in game})
+    replay.game["moves"] = []
+    replay.game["heights"] = [0] * replay.cols
+    players = game["players"]
+    max_players = int(game["max_players"])
+
+    problems = []
+    winner = None
+    for index, (column, name, number) in enumerate(game["moves"]):
+        if int(number) != index + 1 and BAD_MOVE_NUMBERS not in problems:
+            problems.append(BAD_MOVE_NUMBERS)
+        if winner is not None:
+            problems.append(MOVE_AFTER_WIN)
+            break
+        player_index = index % max_players
+        if player_index >= len(players) or players[player_index] != name:
+            problems.append(MOVE_OUT_OF_TURN)
+            break
+        column = int(column)
+        if not 1 <= column <= replay.cols:
+            problems.append(ILLEGAL_MOVE)
+            break
+        disc = replay.get_player_disc_colour(name)
+        coordinates = replay.make_move(column, disc)
+        if coordinates is None:
+            problems.append(ILLEGAL_MOVE)
+            break
+        if replay.has_won(disc, coordinates):
+            winner = name
+
+    if not problems:
+        stored_heights = [int(height) for height in game.get("heights", [])]
+        if stored_heights != replay.game["heights"]:
+            problems.append(HEIGHTS_MISMATCH)
+        won = game.get("game_status") == Game.WON
+        if winner is not None and not won:
+            problems.append(NOT_WON)
+        elif winner is None and won:
+            problems.append(NO_WINNING_MOVE)
+        elif won and game.get("turn") != winner:
+            problems.append(WRONG_WINNER)
+    return new_result(game, winner, len(game["moves"]), problems)
+
+
+def replay_chunk(games):
+    """Replay a chunk of games in a pool process, return their results."""
+    return [replay_game(game) for game in games]
+
+
+def new_result(game, winner, num_moves, problems):
+    return {
+        "game_id": game.get("game_id"),
+        "game_status": game.get("game_status"),
+        "winner": winner,
+        "moves": num_moves,
+        "problems": problems,
+    }
+
+
+def replay_games(games, processes=None, chunk_size=CHUNK_SIZE):
+    """Replay a stream of games across a pool, yielding results in order.
+
+    At most CHUNKS_IN_FLIGHT chunks per process are read from the stream
+    before their results are yielded.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    max_in_flight = processes * CHUNKS_IN_FLIGHT
+    chunks = iter_batches(games, chunk_size)
+    with multiprocessing.Pool(processes) as pool:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(pool.apply_async(replay_chunk, (chunk,)))
+            if len(in_flight) >= max_in_flight:
+                yield from in_flight.popleft().get()
+        while in_flight:
+            yield from in_flight.popleft().get()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--processes", type=int,
+                        help="pool size (default: number of CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--verbose", action="store_true",
+                        help="print every game's result")
+    args = parser.parse_args(args)
+
+    start = time.monotonic()
+    totals = Counter()
+    for result in replay_games(get_db().iter_games(), args.processes,
+                               args.chunk_size):
+        totals["games"] += 1
+        if result["problems"] == [NO_MOVE_LOG]:
+            totals["skipped (no move log)"] += 1
+        else:
+            totals["replayed"] += 1
+            totals["moves"] += result["moves"]
+            totals["mismatches"] += bool(result["problems"])
+            totals.update(result["problems"])
+        if args.verbose or result["problems"] and \
+                result["problems"] != [NO_MOVE_LOG]:
+            print(json.dumps(result))
+    seconds = time.monotonic() - start
+    print(f"Replayed {totals['replayed']} of {totals['games']} games in "
+          f"{seconds:.2f}s ({totals['games'] / max(seconds, 1e-9):.0f} "
+          f"games/sec, {totals['moves'] / max(seconds, 1e-9):.0f} "
+          f"moves/sec).")
+    for name, count in sorted(totals.items()):
+        print(f"{name}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Server module for the JSON serializers of responses, chosen by config.
+
+CONNECT_5_SERIALIZER=json (the default) uses the standard library's encoder,
+CONNECT_5_SERIALIZER=orjson the faster orjson package, if it's installed.
+Games are read without Decimals, so neither falls back to Python code to
+encode their numbers.
+"""
+import os
+
+from src.server.utils import DecimalEncoder, decimal_to_number
+
+try:
+    import orjson
+except ImportError:  # optional, pip install orjson
+    orjson = None
+
+
+class JSONSerializer:
+    """Standard library json, Decimals are still encoded if there are any."""
+
+    name = "json"
+
+    def __init__(self):
+        self.encoder = DecimalEncoder()
+
+    def dumps(self, value):
+        return self.encoder.encode(value)
+
+
+class ORJSONSerializer:
+    """orjson, several times faster, its numbers must fit in 64 bits."""
+
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("CONNECT_5_SERIALIZER=orjson needs orjson, "
+                              "pip install orjson")
+
+    def dumps(self, value):
+        return orjson.dumps(value, default=decimal_to_number).decode("utf-8")
+
+
+SERIALIZERS = {
+    JSONSerializer.name: JSONSerializer,
+    ORJSONSerializer.name: ORJSONSerializer,
+}
+
+
+def get_serializer():
+    name = os.environ.get("CONNECT_5_SERIALIZER", JSONSerializer.name)
+    return SERIALIZERS[name]()
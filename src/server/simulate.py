@@ -0,0 +1,140 @@
+"""
+Self-play simulator, playing many games at once with NumPy to benchmark the
+rules and generate data sets of games.
+
+Usage: python -m src.server.simulate --games 1000000 [--players 3]
+"""
+import argparse
+import time
+
+from collections import namedtuple
+
+import numpy as np
+
+from src.server import vectorized
+from src.server.game import Game
+
+RANDOM_POLICY = "random"
+CENTRE_POLICY = "centre"
+POLICIES = (RANDOM_POLICY, CENTRE_POLICY)
+BATCH_SIZE = 100000
+
+# winners: disc (1 based player number) of each game's winner, 0 for a draw
+# lengths: number of moves played in each game
+# moves: (games, cols * rows) columns played (0 based), -1 after the game ended
+SimulationResult = namedtuple(
+    "SimulationResult", ["winners", "lengths", "moves", "seconds"])
+
+
+def column_weights(cols, policy):
+    """Return the log weight of picking each column under the policy."""
+    if policy == RANDOM_POLICY:
+        return np.zeros(cols)
+    # centre: a column is picked less often the further it is from the centre
+    centre = (cols - 1) / 2
+    return -np.abs(np.arange(cols) - centre) / max(centre, 1)
+
+
+def play_batch(num_games, num_players, cols, rows, winning_count, policy,
+               rng, record_moves):
+    """Play a batch of games to the end, return winners, lengths and moves."""
+    boards, heights = vectorized.new_boards(num_games, cols, rows)
+    line_index_table = vectorized.get_line_index_table(
+        cols, rows, winning_count)
+    weights = column_weights(cols, policy)
+    winners = np.zeros(num_games, dtype=np.int8)
+    lengths = np.zeros(num_games, dtype=np.int16)
+    moves = np.full((num_games, cols * rows), -1, dtype=np.int8) \
+        if record_moves else None
+
+    active = np.arange(num_games)
+    for turn in range(cols * rows):
+        if active.size == 0:
+            break
+        # turn passes to the next player in order, like Game.toggle_turn
+        disc = turn % num_players + 1
+        # pick a legal column at random, weighted by the policy (Gumbel-max)
+        scores = weights + rng.gumbel(size=(active.size, cols))
+        scores[heights[active] >= rows] = -np.inf
+        columns = scores.argmax(axis=1)
+        cells = vectorized.drop_discs(boards, heights, active, columns, disc,
+                                      rows)
+        if record_moves:
+            moves[active, turn] = columns
+        lengths[active] = turn + 1
+        won = vectorized.has_won(boards, active, cells, disc,
+                                 line_index_table)
+        winners[active[won]] = disc
+        active = active[~won]
+    return winners, lengths, moves
+
+
+def simulate(num_games, num_players=2, cols=Game.BOARD_COLS,
+             rows=Game.BOARD_ROWS, winning_count=Game.WINNING_COUNT,
+             policy=RANDOM_POLICY, seed=None, batch_size=BATCH_SIZE,
+             record_moves=False):
+    """Play num_games games in batches, return a SimulationResult."""
+    rng = np.random.default_rng(seed)
+    start = time.monotonic()
+    batches = [
+        play_batch(min(batch_size, num_games - first_game), num_players,
+                   cols, rows, winning_count, policy, rng, record_moves)
+        for first_game in range(0, max(num_games, 1), batch_size)]
+    winners, lengths, moves = zip(*batches)
+    return SimulationResult(
+        np.concatenate(winners), np.concatenate(lengths),
+        np.concatenate(moves) if record_moves else None,
+        time.monotonic() - start)
+
+
+def save_dataset(path, result, num_players, cols, rows, winning_count):
+    """Save the games' move sequences and outcomes to a compressed file."""
+    np.savez_compressed(
+        path, moves=result.moves, winners=result.winners,
+        lengths=result.lengths,
+        geometry=np.array([num_players, cols, rows, winning_count]))
+
+
+def report(result, num_players):
+    """Print the throughput and outcomes of the simulation."""
+    num_games = len(result.winners)
+    print(f"Played {num_games} games in {result.seconds:.2f}s "
+          f"({num_games / max(result.seconds, 1e-9):.0f} games/sec).")
+    for disc in range(1, num_players + 1):
+        wins = int((result.winners == disc).sum())
+        print(f"Player {disc} ({Game.player_discs[disc - 1]}) won {wins} "
+              f"({100 * wins / max(num_games, 1):.1f}%).")
+    draws = int((result.winners == 0).sum())
+    print(f"Draws: {draws} ({100 * draws / max(num_games, 1):.1f}%).")
+    if num_games:
+        print(f"Average game length: {result.lengths.mean():.1f} moves.")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--games", type=int, default=BATCH_SIZE)
+    parser.add_argument("--players", type=int, default=2, choices=(2, 3))
+    parser.add_argument("--cols", type=int, default=Game.BOARD_COLS)
+    parser.add_argument("--rows", type=int, default=Game.BOARD_ROWS)
+    parser.add_argument("--winning-count", type=int,
+                        default=Game.WINNING_COUNT)
+    parser.add_argument("--policy", choices=POLICIES, default=RANDOM_POLICY)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--output", help="save move sequences (.npz)")
+    args = parser.parse_args(args)
+    if not Game.is_valid_geometry(args.rows, args.cols, args.winning_count):
+        parser.error("invalid board size")
+
+    result = simulate(args.games, args.players, args.cols, args.rows,
+                      args.winning_count, args.policy, args.seed,
+                      args.batch_size, record_moves=bool(args.output))
+    report(result, args.players)
+    if args.output:
+        save_dataset(args.output, result, args.players, args.cols,
+                     args.rows, args.winning_count)
+        print(f"Saved move sequences to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,57 @@ class DecimalEncoder(json.JSONEncoder):
 
     def default(self, value):
         if isinstance(value, decimal.Decimal):
-            if value % 1 > 0:
-                return float(value)
-            else:
-                return int(value)
+            return decimal_to_number(value)
         return super(DecimalEncoder, self).default(value)
+
+
+def decimal_to_number(value):
+    """Return the Decimal as an int, or a float if it has a fraction."""
+    if value % 1 > 0:
+        return float(value)
+    return int(value)
+
+
+def replace_decimals(value):
+    """Return the DynamoDB item (or value) with its Decimals as numbers.
+
+    Lists and dicts are changed in place, the item is read from the db.
+    """
+    if isinstance(value, decimal.Decimal):
+        return decimal_to_number(value)
+    if isinstance(value, list):
+        for idx, item in enumerate(value):
+            if isinstance(item, (decimal.Decimal, list, dict)):
+                value[idx] = replace_decimals(item)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if isinstance(item, (decimal.Decimal, list, dict)):
+                value[key] = replace_decimals(item)
+    return value
+
+
+BOARD_FORMAT_VERSION = "1"
+# the board_format clients ask for to get the board encoded by encode_board
+COMPACT_BOARD_FORMAT = "compact"
+
+
+def encode_board(board):
+    """Encode a list of lists board as a compact versioned string.
+
+    Format is "<version>:<rows>:<cells>", with the cells listed column by
+    column, each column from top to bottom, e.g. a 9x6 board is 54 cells.
+    """
+    rows = len(board[0]) if board else 0
+    cells = "".join("".join(column) for column in board)
+    return f"{BOARD_FORMAT_VERSION}:{rows}:{cells}"
+
+
+def decode_board(data):
+    """Decode a compact board string back into a list of lists board."""
+    version, rows, cells = data.split(":", 2)
+    if version != BOARD_FORMAT_VERSION:
+        raise ValueError(f"Unknown board format version: {version}")
+    rows = int(rows)
+    if rows == 0:
+        return []
+    return [list(cells[idx:idx + rows]) for idx in range(0, len(cells), rows)]
@@ -0,0 +1,174 @@
+"""
+Bulk validator for stored games, checking many boards at once with NumPy.
+
+Reports which boards have a winning line for which disc, which could not have
+been reached by playing the game (floating discs, impossible disc counts) and
+which are full. Games with problems are printed as JSON lines.
+
+Usage: python -m src.server.validate [--chunk-size 10000] [--verbose]
+"""
+import argparse
+import json
+import time
+
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from src.server import vectorized
+from src.server.db import get_db, iter_batches
+from src.server.game import Game
+
+CHUNK_SIZE = 10000
+DISC_VALUES = {Game.EMPTY: vectorized.EMPTY}
+DISC_VALUES.update({disc: value for value, disc in
+                    enumerate(Game.player_discs, 1)})
+
+FLOATING_DISCS = "floating discs"
+BAD_DISC_COUNTS = "impossible disc counts"
+SEVERAL_WINNERS = "more than one winner"
+MALFORMED_BOARD = "malformed board"
+NOT_WON = "winning line but game not won"
+NO_WINNING_LINE = "game won without a winning line"
+
+
+def check_boards(boards, num_players, cols, rows, winning_count):
+    """Check a stack of boards of the same size, in one pass.
+
+    Return a dict of arrays: "winners" (games, num_players) whether each
+    player's disc has a winning line, and "floating", "bad_counts" and
+    "full" (games,) whether each board breaks that rule or is full.
+    """
+    cells = boards[:, :-1].reshape(-1, cols, rows)
+    # a disc can't have an empty cell below it (row 0 is the top)
+    floating = ((cells[:, :, :-1] != vectorized.EMPTY) &
+                (cells[:, :, 1:] == vectorized.EMPTY)).any(axis=(1, 2))
+    counts = np.stack([(cells == disc).sum(axis=(1, 2))
+                       for disc in range(1, num_players + 1)], axis=1)
+    unknown = ((cells < vectorized.EMPTY) |
+               (cells > num_players)).any(axis=(1, 2))
+    # players take turns in order, so no player can have more discs than the
+    # player before them, and the first player is at most one disc ahead
+    bad_counts = (unknown | (np.diff(counts, axis=1) > 0).any(axis=1) |
+                  (counts[:, 0] - counts[:, -1] > 1))
+    all_lines = vectorized.get_all_lines(cols, rows, winning_count)
+    return {
+        "winners": vectorized.winning_discs(boards, num_players, all_lines),
+        "floating": floating,
+        "bad_counts": bad_counts,
+        "full": (cells != vectorized.EMPTY).all(axis=(1, 2)),
+    }
+
+
+def get_board(game):
+    """Return the game's board, replayed from its moves if it has a log.
+
+    Return None if the moves can't be replayed.
+    """
+    try:
+        return Game.from_game(game).board
+    except (ValueError, IndexError, KeyError):
+        return None
+
+
+def board_key(game, board):
+    """Return (num_players, cols, rows, winning_count) for the game's board.
+
+    Return None if the board's columns are not all the same length, a cell
+    isn't a single character, or the game's sizes aren't ints.
+    """
+    if board is None:
+        return None
+    rows = len(board[0]) if board else 0
+    if not rows or any(len(column) != rows for column in board):
+        return None
+    if not all(isinstance(cell, str) and len(cell) == 1
+               for column in board for cell in column):
+        return None
+    max_players = game.get("max_players")
+    winning_count = game.get("winning_count", Game.WINNING_COUNT)
+    if not all(isinstance(value, int) and not isinstance(value, bool)
+               for value in (max_players, winning_count)):
+        return None
+    return max_players, len(board), rows, winning_count
+
+
+def validate_chunk(games):
+    """Validate a list of games, return a result dict for each, in order."""
+    results = [None] * len(games)
+    groups = defaultdict(list)
+    for position, game in enumerate(games):
+        board = get_board(game)
+        key = board_key(game, board)
+        if key is None:
+            results[position] = new_result(game, [], [MALFORMED_BOARD],
+                                           False)
+        else:
+            groups[key].append((position, game, board))
+
+    for (num_players, cols, rows, winning_count), group in groups.items():
+        boards = vectorized.boards_from_cells(
+            ["".join("".join(column) for column in board)
+             for _, _, board in group], DISC_VALUES)
+        checks = check_boards(boards, num_players, cols, rows, winning_count)
+        for idx, (position, game, _) in enumerate(group):
+            winners = [Game.player_discs[disc] for disc in
+                       np.flatnonzero(checks["winners"][idx])]
+            problems = []
+            if checks["floating"][idx]:
+                problems.append(FLOATING_DISCS)
+            if checks["bad_counts"][idx]:
+                problems.append(BAD_DISC_COUNTS)
+            if len(winners) > 1:
+                problems.append(SEVERAL_WINNERS)
+            if winners and game.get("game_status") != Game.WON:
+                problems.append(NOT_WON)
+            if not winners and game.get("game_status") == Game.WON:
+                problems.append(NO_WINNING_LINE)
+            results[position] = new_result(game, winners, problems,
+                                           bool(checks["full"][idx]))
+    return results
+
+
+def new_result(game, winners, problems, full):
+    return {
+        "game_id": game.get("game_id"),
+        "game_status": game.get("game_status"),
+        "winners": winners,
+        "full": full,
+        "problems": problems,
+    }
+
+
+def validate_games(games, chunk_size=CHUNK_SIZE):
+    """Validate a stream of games chunk by chunk, yielding each result."""
+    for chunk in iter_batches(games, chunk_size):
+        yield from validate_chunk(chunk)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--verbose", action="store_true",
+                        help="print every game's result")
+    args = parser.parse_args(args)
+
+    start = time.monotonic()
+    totals = Counter()
+    for result in validate_games(get_db().iter_games(), args.chunk_size):
+        totals["games"] += 1
+        totals["won"] += bool(result["winners"])
+        totals["drawn"] += result["full"] and not result["winners"]
+        totals["with problems"] += bool(result["problems"])
+        totals.update(result["problems"])
+        if args.verbose or result["problems"]:
+            print(json.dumps(result))
+    seconds = time.monotonic() - start
+    print(f"Validated {totals['games']} games in {seconds:.2f}s "
+          f"({totals['games'] / max(seconds, 1e-9):.0f} games/sec).")
+    for name, count in sorted(totals.items()):
+        print(f"{name}: {count}")
+
+
+if __name__ == "__main__":
+    main()
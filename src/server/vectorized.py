@@ -0,0 +1,99 @@
+"""
+Module for game rules vectorized with NumPy, to work on many boards at once.
+
+Boards are stacked in arrays of shape (games, cols * rows + 1), each board
+flattened column by column (cell = column * rows + row, row 0 is the top), the
+same layout as the list of lists board. The extra last cell is always empty and
+pads out the lines of the cells with fewer winning lines than others.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from src.server.lines import get_winning_lines
+
+# Disc values in the arrays, player n (1 based) has the disc value n
+EMPTY = 0
+
+
+@lru_cache(maxsize=16)
+def get_line_index_table(cols, rows, winning_count):
+    """Return the flat cell indexes of the winning lines through each cell.
+
+    Shape is (cols * rows, max lines through a cell, winning_count), padded
+    with the index of the always empty padding cell.
+    """
+    winning_lines = get_winning_lines(cols, rows, winning_count)
+    max_lines = max(len(lines) for lines in winning_lines.values())
+    padding = cols * rows
+    table = np.full((cols * rows, max(max_lines, 1), winning_count),
+                    padding, dtype=np.intp)
+    for (column, row), lines in winning_lines.items():
+        for idx, line in enumerate(lines):
+            table[column * rows + row, idx] = [
+                line_column * rows + line_row
+                for line_column, line_row in line]
+    return table
+
+
+@lru_cache(maxsize=16)
+def get_all_lines(cols, rows, winning_count):
+    """Return the flat cell indexes of every winning line on the board."""
+    lines = {line for cell_lines in get_winning_lines(
+        cols, rows, winning_count).values() for line in cell_lines}
+    return np.array(
+        sorted([column * rows + row for column, row in line]
+               for line in lines),
+        dtype=np.intp).reshape(len(lines), winning_count)
+
+
+def new_boards(num_games, cols, rows):
+    """Return empty flat boards and column heights for num_games games."""
+    boards = np.zeros((num_games, cols * rows + 1), dtype=np.int8)
+    heights = np.zeros((num_games, cols), dtype=np.int16)
+    return boards, heights
+
+
+def drop_discs(boards, heights, games, columns, discs, rows):
+    """Drop each game's disc in its column, return the flat cells filled.
+
+    The columns must have space, games is an array of indexes into boards.
+    """
+    cells = columns * rows + (rows - 1 - heights[games, columns])
+    boards[games, cells] = discs
+    heights[games, columns] += 1
+    return cells
+
+
+def has_won(boards, games, cells, discs, line_index_table):
+    """Return for each game whether its move at cell is a winning move."""
+    lines = line_index_table[cells]
+    values = boards[games[:, None, None], lines]
+    discs = np.broadcast_to(discs, games.shape)
+    return (values == discs[:, None, None]).all(axis=2).any(axis=1)
+
+
+def boards_from_cells(cells, disc_values):
+    """Stack boards given as strings of cells (as in the compact format).
+
+    disc_values maps each cell character to its value in the array, any other
+    character is given the value -1.
+    """
+    lookup = np.full(256, -1, dtype=np.int8)
+    for char, value in disc_values.items():
+        lookup[ord(char)] = value
+    num_boards = len(cells)
+    chars = np.frombuffer("".join(cells).encode("latin-1", "replace"),
+                          dtype=np.uint8)
+    boards = np.zeros((num_boards, chars.size // max(num_boards, 1) + 1),
+                      dtype=np.int8)
+    boards[:, :-1] = lookup[chars].reshape(num_boards, -1)
+    return boards
+
+
+def winning_discs(boards, num_discs, all_lines):
+    """Return a (games, num_discs) array of whether each disc has a line."""
+    values = boards[:, all_lines]
+    return np.stack(
+        [(values == disc).all(axis=2).any(axis=1)
+         for disc in range(1, num_discs + 1)], axis=1)
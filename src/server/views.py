@@ -0,0 +1,220 @@
+"""Server module handling the RESTful API's requests, for app.py and asgi.py.
+
+Each view is a generator, yielding the blocking calls it makes (see calls.py)
+and returning the response's (body, status, headers). The body is a dict, a
+serialized str, or for event streams a generator of messages and calls.
+"""
+import functools
+import os
+import zlib
+
+from flask_api import status
+
+from src.server.calls import Wait
+from src.server.db import get_db
+from src.server.events import stream_events
+from src.server.game import Game, game_cache
+from src.server.game_finder import get_game_finder
+from src.server.jobs import COMPUTER_TURN, HINT, get_job_queue
+from src.server.serializers import get_serializer
+from src.server.utils import COMPACT_BOARD_FORMAT
+
+RESPONSE_HEADERS = {"Content-Type": "application/json"}
+EVENTS_HEADERS = {"Content-Type": "text/event-stream",
+                  "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# longest a request for a game may wait for it to change, in seconds
+MAX_WAIT = float(os.environ.get("CONNECT_5_MAX_WAIT", 30))
+
+
+serializer = get_serializer()
+
+
+def board_format_requested(args):
+    """Return the board format the client asked for, None for the default.
+
+    Any format but the compact one is the default.
+    """
+    board_format = args.get("board_format")
+    return board_format if board_format == COMPACT_BOARD_FORMAT else None
+
+
+def get_etag(version, fields=None, board_format=None):
+    """Return the ETag of the game at version, as the client asked for it.
+
+    Each board format and set of ?fields= is a different response, with its
+    own tag, "<version>-<board format>-<hash of the fields>".
+    """
+    if board_format != COMPACT_BOARD_FORMAT:
+        board_format = "default"
+    fields_hash = "all" if not fields else \
+        f"{zlib.crc32(','.join(fields).encode('utf-8')):08x}"
+    return f"{version}-{board_format}-{fields_hash}"
+
+
+def etag_matches(if_none_match, tag):
+    """Return whether the If-None-Match header has the ETag."""
+    return any(etag.strip() in ("*", f'"{tag}"', f'W/"{tag}"')
+               for etag in (if_none_match or "").split(","))
+
+
+def version_headers(version, fields=None, board_format=None):
+    """Return the response headers, with the game's version in its ETag."""
+    if version is None:
+        return RESPONSE_HEADERS
+    headers = dict(RESPONSE_HEADERS)
+    headers["ETag"] = f'"{get_etag(version, fields, board_format)}"'
+    # clients check the game hasn't changed before reusing a response
+    headers["Cache-Control"] = "no-cache"
+    return headers
+
+
+def create_game(body):
+    """Create a new game for the new player."""
+    name = body.get("name")
+    max_players = body.get("max_players")
+    rows = body.get("rows", Game.BOARD_ROWS)
+    cols = body.get("cols", Game.BOARD_COLS)
+    winning_count = body.get("winning_count", Game.WINNING_COUNT)
+    if not Game.is_valid_geometry(rows, cols, winning_count):
+        message = "Bad request, invalid board size."
+        return {"message": message}, status.HTTP_400_BAD_REQUEST, \
+            RESPONSE_HEADERS
+    opponent = body.get("opponent")
+    if opponent == Game.COMPUTER and name == Game.COMPUTER:
+        message = "Bad request, name already taken by the computer."
+        return {"message": message}, status.HTTP_400_BAD_REQUEST, \
+            RESPONSE_HEADERS
+    game_id = yield functools.partial(
+        Game.start_new_game, name, max_players, rows, cols, winning_count,
+        opponent=opponent)
+    return {"game_id": game_id}, status.HTTP_201_CREATED, RESPONSE_HEADERS
+
+
+def update_game_new_player(body):
+    """Update an available game by adding the new player to it."""
+    name = body.get("name")
+    game_id = yield functools.partial(get_game_finder().join_game, name)
+    if game_id is None:
+        status_code = status.HTTP_404_NOT_FOUND
+    else:
+        status_code = status.HTTP_200_OK
+    return {"game_id": game_id}, status_code, RESPONSE_HEADERS
+
+
+def get_game(game_id, args, if_none_match):
+    """Get the specified game, or only the fields in ?fields=a,b.
+
+    If the client has the game at its current version, in the board format
+    and fields asked for (If-None-Match has its ETag), the response is an
+    empty 304, the game isn't read or serialized.
+
+    With ?wait=<seconds>&since=<version> the response is held until the
+    game's version is no longer since, or for up to wait seconds (at most
+    MAX_WAIT), instead of the client polling again.
+    """
+    try:
+        wait = min(float(args.get("wait", 0)), MAX_WAIT)
+        since = args.get("since")
+        since = None if since is None else int(since)
+    except ValueError:
+        message = "Bad request, wait and since must be numbers."
+        return {"message": message}, status.HTTP_400_BAD_REQUEST, \
+            RESPONSE_HEADERS
+    game = Game(game_id)
+    fields = args.get("fields")
+    fields = fields.split(",") if fields else None
+    board_format = board_format_requested(args)
+    # read before the game, so the ETag is never newer than the game
+    version = yield game.get_version
+    if wait > 0 and since is not None and version == since:
+        version = yield Wait(game, since, wait)
+    if version is not None and etag_matches(
+            if_none_match, get_etag(version, fields, board_format)):
+        return "", status.HTTP_304_NOT_MODIFIED, version_headers(
+            version, fields, board_format)
+    if fields:
+        yield functools.partial(game.load_fields, fields)
+        response_body = serializer.dumps(game.get_state(fields, board_format))
+    else:
+        version = yield functools.partial(game.load_cached_game, version)
+        response_body = game.get_state_body(serializer, board_format)
+    return response_body, status.HTTP_200_OK, version_headers(
+        version, fields, board_format)
+
+
+def get_game_events(game_id, args):
+    """Stream the game's changes as Server-Sent Events, see events.py."""
+    board_format = board_format_requested(args)
+    messages = stream_events(
+        game_id, lambda game: game.get_state(board_format=board_format))
+    return messages, status.HTTP_200_OK, EVENTS_HEADERS
+    yield  # the stream makes the calls
+
+
+def update_game(game_id, args, body):
+    """Update the specified game (make a move or end a game)."""
+    game = Game(game_id)
+    if body.get("game_status") == Game.DISCONNECTED:
+        yield game.load_game
+        yield functools.partial(game.game_over, won=False)
+        return {"message": "OK"}, status.HTTP_200_OK, RESPONSE_HEADERS
+
+    column = body["column"]
+    name = body["name"]
+    if not Game.is_valid_column(column):
+        message = "Bad request, invalid column."
+        return {"message": message}, status.HTTP_400_BAD_REQUEST, \
+            RESPONSE_HEADERS
+    move_result = yield functools.partial(game.play_move, name, column)
+    if move_result is False and game.is_computer_turn():
+        yield functools.partial(get_job_queue().submit, COMPUTER_TURN, game,
+                                Game.COMPUTER)
+
+    if move_result == Game.NOT_TURN:
+        message = "Conflict, not your turn."
+        status_code = status.HTTP_409_CONFLICT
+    elif move_result is None:
+        message = "Bad request, column full."
+        status_code = status.HTTP_400_BAD_REQUEST
+    elif move_result is True:
+        message = Game.WON
+        status_code = status.HTTP_200_OK
+    else:
+        message = "OK"
+        status_code = status.HTTP_200_OK
+
+    response_data = game.get_state(board_format=board_format_requested(args))
+    response_data["message"] = message
+    response_body = serializer.dumps(response_data)
+    return response_body, status_code, RESPONSE_HEADERS
+
+
+def request_hint(game_id, body):
+    """Queue a search for the player's best move, saved to the game."""
+    game = Game(game_id)
+    yield game.load_game
+    name = body.get("name")
+    if game.game["turn"] != name or len(game.game["players"]) != 2:
+        message = "Bad request, hints are for the player's turn (2 players)."
+        return {"message": message}, status.HTTP_400_BAD_REQUEST, \
+            RESPONSE_HEADERS
+    yield functools.partial(get_job_queue().submit, HINT, game, name)
+    return {"message": "Accepted"}, status.HTTP_202_ACCEPTED, RESPONSE_HEADERS
+
+
+def get_job_stats():
+    """Get the search job queue depth and latencies."""
+    stats = yield get_job_queue().get_stats
+    return stats, status.HTTP_200_OK, RESPONSE_HEADERS
+
+
+def get_db_stats():
+    """Get this server process's db connection pool size and use."""
+    stats = yield get_db().get_pool_stats
+    return stats, status.HTTP_200_OK, RESPONSE_HEADERS
+
+
+def get_cache_stats():
+    """Get this server process's game cache size and hit rate."""
+    stats = yield game_cache.get_stats
+    return stats, status.HTTP_200_OK, RESPONSE_HEADERS
@@ -0,0 +1,7 @@
+"""Worker service running the search jobs queued on Redis."""
+from src.server.jobs import RedisJobQueue
+
+
+if __name__ == "__main__":
+    print("Starting search job worker.")
+    RedisJobQueue().work()
@@ -0,0 +1,121 @@
+"""Stand-in for Redis running the server's Lua scripts, for the tests."""
+import json
+import threading
+
+from src.server.db import RedisScriptDB
+from src.server.game import Game
+
+try:
+    import lupa
+except ImportError:  # pragma: no cover
+    lupa = None
+
+
+class ScriptRedis:
+    """Run the Lua scripts against games held in Python dicts.
+
+    Scripts are run one at a time, as Redis does, and only the commands and
+    cjson functions the scripts use are provided. Stands in for the Redis
+    connection's evalsha and script_load.
+    """
+
+    def __init__(self):
+        self.lua = lupa.LuaRuntime()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.hashes = {}
+        self.lists = {}
+        self.sorted_sets = {}
+        self.strings = {}
+        self.expires = {}
+        self.published = []
+        self.null = self.lua.table()
+        self.redis = self.lua.table_from({"call": self.call})
+        self.cjson = self.lua.table_from({
+            "decode": lambda data: self.to_lua(json.loads(data)),
+            "encode": lambda value: json.dumps(self.to_python(value)),
+            "null": self.null,
+        })
+        self.scripts = {}
+        for script, sha in [
+                (RedisScriptDB.MOVE_SCRIPT, RedisScriptDB.MOVE_SCRIPT_SHA),
+                (RedisScriptDB.JOIN_SCRIPT, RedisScriptDB.JOIN_SCRIPT_SHA)]:
+            self.scripts[sha] = self.lua.eval(
+                f"function(KEYS, ARGV, redis, cjson) {script} end")
+
+    def to_lua(self, value):
+        if isinstance(value, list):
+            return self.lua.table_from([self.to_lua(item) for item in value])
+        if value is None:
+            return self.null
+        return value
+
+    def to_python(self, value):
+        if lupa.lua_type(value) == "table":
+            return [self.to_python(value[index])
+                    for index in range(1, len(value) + 1)]
+        # a script returning false is a nil reply
+        return None if value is False else value
+
+    def script_load(self, script):
+        pass
+
+    def evalsha(self, sha, num_keys, *keys_and_args):
+        keys = [str(key) for key in keys_and_args[:num_keys]]
+        args = [str(arg) for arg in keys_and_args[num_keys:]]
+        with self.lock:
+            return self.to_python(self.scripts[sha](
+                self.lua.table_from(keys), self.lua.table_from(args),
+                self.redis, self.cjson))
+
+    def call(self, command, key, *args):
+        self.calls += 1
+        if command == "HMGET":
+            game = self.hashes.get(key, {})
+            # missing fields are false in Lua
+            return self.to_lua([game.get(field, False) for field in args])
+        elif command == "HGETALL":
+            return self.to_lua([item for field_value in
+                                self.hashes.get(key, {}).items()
+                                for item in field_value])
+        elif command == "HSET":
+            self.hashes[key].update(zip(args[::2], args[1::2]))
+        elif command == "HDEL":
+            for field in args:
+                self.hashes[key].pop(field, None)
+        elif command == "LRANGE":
+            return self.to_lua(list(self.lists.get(key, [])))
+        elif command == "RPUSH":
+            self.lists.setdefault(key, []).extend(args)
+        elif command == "ZRANGE":
+            members = sorted(self.sorted_sets.get(key, {}).items(),
+                             key=lambda item: (item[1], item[0]))
+            start, stop = int(args[0]), int(args[1])
+            return self.to_lua([member for member, _ in
+                                members[start:stop + 1]])
+        elif command == "ZREM":
+            for member in args:
+                self.sorted_sets.get(key, {}).pop(member, None)
+        elif command == "EXPIRE":
+            self.expires[key] = int(args[0])
+        elif command == "INCR":
+            self.strings[key] = str(int(self.strings.get(key, 0)) + 1)
+            return int(self.strings[key])
+        elif command == "PUBLISH":
+            self.published.append((key, args[0]))
+            return 0
+        else:
+            raise ValueError(f"{command} not supported")
+
+    def save_game(self, db, game_id, game, opened_at=0):
+        """Store the game as RedisScriptDB.save_game does."""
+        self.hashes[game_id] = db.dumps_fields(game)
+        self.lists[db.get_moves_key(game_id)] = [
+            json.dumps(move) for move in game.get("moves", [])]
+        if game.get("game_status") == Game.OPEN:
+            self.sorted_sets.setdefault(db.OPEN_GAMES_KEY, {})[game_id] = \
+                opened_at
+
+    def load_game(self, db, game_id):
+        return db.loads_game(self.hashes[game_id],
+                             self.lists[db.get_moves_key(game_id)])
@@ -0,0 +1,107 @@
+import time
+
+from unittest import TestCase
+
+from src.server import ai
+from src.server.bitboard import BitBoard
+
+
+EMPTY = "-"
+
+
+def new_board(cols=9, rows=6):
+    return [[EMPTY] * rows for _ in range(cols)]
+
+
+class TestAI(TestCase):
+
+    def test_find_move_takes_win(self):
+        """4 Os stacked in column 3, the 5th wins."""
+        board = new_board()
+        board[3][2:] = ["o"] * 4
+        board[4][2:] = ["x"] * 4
+        board[5][5] = "x"
+        result = ai.find_move(board, 6, 5, "o", "x", EMPTY, time_budget=1)
+        self.assertEqual(3, result.column)
+        self.assertGreater(result.score, ai.WIN_SCORE - 10)
+
+    def test_find_move_blocks_loss(self):
+        """Xs would win along the bottom row in column 5, block it."""
+        board = new_board()
+        for column in range(1, 5):
+            board[column][5] = "x"
+        board[0][5] = board[8][5] = board[8][4] = "o"
+        result = ai.find_move(board, 6, 5, "o", "x", EMPTY, time_budget=1)
+        self.assertEqual(5, result.column)
+
+    def test_find_move_board_full(self):
+        board = [["x", "o"] * 3 for _ in range(9)]
+        result = ai.find_move(board, 6, 5, "o", "x", EMPTY, time_budget=1)
+        self.assertIsNone(result.column)
+
+    def test_find_move_within_time_budget(self):
+        """Empty 15x15 board can't be searched fully, stop on time."""
+        start = time.monotonic()
+        result = ai.find_move(new_board(15, 15), 15, 5, "o", "x", EMPTY,
+                              time_budget=0.2)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertGreater(result.nodes, 0)
+        self.assertGreaterEqual(result.depth, 1)
+        self.assertIsNotNone(result.column)
+
+    def test_transposition_table_bounded(self):
+        bitboard = BitBoard(9, 6, 5, ("o", "x"))
+        searcher = ai.Searcher(bitboard, ("o", "x"), time_budget=0.2,
+                               table_size=50)
+        searcher.search()
+        self.assertLessEqual(len(searcher.table), 50)
+
+    def test_search_leaves_bitboard_unchanged(self):
+        bitboard = BitBoard(9, 6, 5, ("o", "x"))
+        bitboard.drop(4, "x")
+        searcher = ai.Searcher(bitboard, ("o", "x"), time_budget=0.05)
+        start_hash = searcher.hash
+        searcher.search()
+        self.assertEqual(start_hash, searcher.hash)
+        self.assertEqual({"o": 0, "x": 1 << 28}, bitboard.bits)
+
+    def test_clock_checked_more_often_on_bigger_boards(self):
+        """Each node evaluates more lines, so fewer nodes between checks."""
+        small = ai.Searcher(BitBoard(9, 6, 5, ("o", "x")), ("o", "x"))
+        big = ai.Searcher(BitBoard(30, 30, 5, ("o", "x")), ("o", "x"))
+        self.assertLess(big.nodes_per_clock_check,
+                        small.nodes_per_clock_check)
+        self.assertLessEqual(
+            big.nodes_per_clock_check * len(big.line_masks),
+            ai.LINES_PER_CLOCK_CHECK)
+
+    def test_table_win_scores_relative_to_position(self):
+        searcher = ai.Searcher(BitBoard(9, 6, 5, ("o", "x")), ("o", "x"))
+        # a win 3 plies from the root, found at ply 2, is 1 ply from there
+        self.assertEqual(ai.WIN_SCORE - 1,
+                         searcher.score_to_table(ai.WIN_SCORE - 3, 2))
+        self.assertEqual(-ai.WIN_SCORE + 1,
+                         searcher.score_to_table(-ai.WIN_SCORE + 3, 2))
+        # and reached again at ply 4, it's 5 plies from the root
+        self.assertEqual(ai.WIN_SCORE - 5,
+                         searcher.score_from_table(ai.WIN_SCORE - 1, 4))
+        self.assertEqual(-ai.WIN_SCORE + 5,
+                         searcher.score_from_table(-ai.WIN_SCORE + 1, 4))
+        self.assertEqual(120, searcher.score_to_table(120, 2))
+        self.assertEqual(-120, searcher.score_from_table(-120, 4))
+
+    def test_table_win_read_at_another_ply(self):
+        """A win found at ply 2 is read back as a win at ply 0."""
+        bitboard = BitBoard(9, 6, 5, ("o", "x"))
+        for _ in range(4):
+            bitboard.drop(3, "o")
+        searcher = ai.Searcher(bitboard, ("o", "x"))
+        searcher.deadline = time.monotonic() + 1
+        score, column = searcher.negamax(
+            1, -ai.WIN_SCORE - 1, ai.WIN_SCORE + 1, 2, "o", "x")
+        self.assertEqual((ai.WIN_SCORE - 2, 3), (score, column))
+        self.assertEqual(ai.WIN_SCORE,
+                         searcher.table[searcher.hash][1])
+        score, column = searcher.negamax(
+            1, -ai.WIN_SCORE - 1, ai.WIN_SCORE + 1, 0, "o", "x")
+        self.assertEqual((ai.WIN_SCORE, 3), (score, column))
@@ -1,7 +1,10 @@
+import threading
+
 from unittest import TestCase
 from unittest.mock import patch
 
-from src.server import app
+from src.server import app, views
+from src.server.cache import GameCache
 
 
 class TestApp(TestCase):
@@ -16,6 +19,12 @@ class TestApp(TestCase):
         self.patcher = patch("src.server.game.db.get_game",
                              return_value=self.test_state)
         self.patcher.start()
+        # the db keeps no versions, so games are not cached
+        for name, value in [("get_version", None),
+                            ("get_versioned_game", (None, self.test_state))]:
+            patcher = patch(f"src.server.game.db.{name}", return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
     def tearDown(self):
         self.patcher.stop()
@@ -25,6 +34,259 @@ class TestApp(TestCase):
         self.assertEqual(200, response.status_code)
         self.assertEqual(self.test_state, response.json)
 
+    @patch("src.server.game.game_cache", new_callable=GameCache)
+    @patch("src.server.game.db.get_version", return_value=7)
+    def test_get_state_etag(self, mock_get_version, mock_cache):
+        with patch("src.server.game.db.get_versioned_game",
+                   return_value=(7, self.test_state)):
+            response = self.client.get("/game/2")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('"7-default-all"', response.headers["ETag"])
+        self.assertEqual("no-cache", response.headers["Cache-Control"])
+
+    @patch("src.server.game.db.get_version", return_value=7)
+    def test_get_state_not_modified(self, mock_get_version):
+        """Client has the current version, the game isn't read."""
+        with patch("src.server.game.db.get_versioned_game") as mock_get:
+            response = self.client.get(
+                "/game/2", headers={"If-None-Match": '"7-default-all"'})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b"", response.data)
+        self.assertEqual('"7-default-all"', response.headers["ETag"])
+        self.assertFalse(mock_get.called)
+
+    @patch("src.server.game.game_cache", new_callable=GameCache)
+    @patch("src.server.game.db.get_version", return_value=8)
+    def test_get_state_modified(self, mock_get_version, mock_cache):
+        with patch("src.server.game.db.get_versioned_game",
+                   return_value=(8, self.test_state)):
+            response = self.client.get(
+                "/game/2", headers={"If-None-Match": '"7-default-all"'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.test_state, response.json)
+        self.assertEqual('"8-default-all"', response.headers["ETag"])
+
+    @patch("src.server.game.game_cache", new_callable=GameCache)
+    @patch("src.server.game.db.wait_for_version", return_value=8)
+    @patch("src.server.game.db.get_version", return_value=7)
+    def test_get_state_long_poll(self, mock_get_version, mock_wait,
+                                 mock_cache):
+        """Held until the game moves past since, the wait is capped."""
+        with patch("src.server.game.db.get_versioned_game",
+                   return_value=(8, self.test_state)):
+            response = self.client.get(
+                "/game/2?wait=100&since=7",
+                headers={"If-None-Match": '"7-default-all"'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('"8-default-all"', response.headers["ETag"])
+        mock_wait.assert_called_once_with("2", 7, views.MAX_WAIT)
+
+    @patch("src.server.game.db.wait_for_version", return_value=7)
+    @patch("src.server.game.db.get_version", return_value=7)
+    def test_get_state_long_poll_timeout(self, mock_get_version, mock_wait):
+        response = self.client.get(
+            "/game/2?wait=5&since=7",
+            headers={"If-None-Match": '"7-default-all"'})
+        self.assertEqual(304, response.status_code)
+        mock_wait.assert_called_once_with("2", 7, 5)
+
+    @patch("src.server.game.db.wait_for_version")
+    @patch("src.server.game.db.get_version", return_value=8)
+    def test_get_state_long_poll_already_changed(self, mock_get_version,
+                                                 mock_wait):
+        with patch("src.server.game.db.get_versioned_game",
+                   return_value=(8, self.test_state)):
+            response = self.client.get("/game/2?wait=5&since=7")
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(mock_wait.called)
+
+    def test_get_state_long_poll_bad_request(self):
+        response = self.client.get("/game/2?wait=5&since=latest")
+        self.assertEqual(400, response.status_code)
+
+    @patch("src.server.app.held_requests", threading.BoundedSemaphore(1))
+    @patch("src.server.game.db.wait_for_version")
+    @patch("src.server.game.db.get_version", return_value=7)
+    def test_get_state_long_poll_not_held(self, mock_get_version, mock_wait):
+        """Past MAX_HELD a poll is answered at once, and told to retry."""
+        app.held_requests.acquire()
+        response = self.client.get(
+            "/game/2?wait=5&since=7",
+            headers={"If-None-Match": '"7-default-all"'})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(str(app.RETRY_AFTER),
+                         response.headers["Retry-After"])
+        self.assertFalse(mock_wait.called)
+
+    @patch("src.server.app.held_requests", threading.BoundedSemaphore(1))
+    @patch("src.server.game.db.wait_for_version", return_value=7)
+    @patch("src.server.game.db.get_version", return_value=7)
+    def test_get_state_long_poll_released(self, mock_get_version, mock_wait):
+        for _ in range(2):
+            response = self.client.get("/game/2?wait=5&since=7")
+            self.assertNotIn("Retry-After", response.headers)
+        self.assertEqual(2, mock_wait.call_count)
+
+    @patch("src.server.app.held_requests", threading.BoundedSemaphore(1))
+    def test_get_events_busy(self):
+        app.held_requests.acquire()
+        response = self.client.get("/game/2/events")
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(str(app.RETRY_AFTER),
+                         response.headers["Retry-After"])
+
+    @patch("src.server.app.held_requests", threading.BoundedSemaphore(1))
+    def test_get_events_released(self):
+        """The stream's thread is free to hold another once it's sent."""
+        self.test_state["game_status"] = "won"
+        for _ in range(2):
+            response = self.client.get("/game/2/events")
+            self.assertEqual(200, response.status_code)
+            response.close()
+
+    def test_get_events(self):
+        """The stream ends once the game is over."""
+        self.test_state["game_status"] = "won"
+        response = self.client.get("/game/2/events")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("text/event-stream", response.mimetype)
+        self.assertEqual(
+            'event: state\ndata: {"board": [], "game_status": "won", '
+            '"turn": "foo", "heights": []}\n\n',
+            response.get_data(as_text=True))
+
+    @patch("src.server.game.game_cache", new_callable=GameCache)
+    @patch("src.server.game.db.get_version", return_value=7)
+    def test_get_state_etag_per_representation(self, mock_get_version,
+                                               mock_cache):
+        """The ETag of one board format or set of fields isn't another's."""
+        with patch("src.server.game.db.get_versioned_game",
+                   return_value=(7, self.test_state)):
+            response = self.client.get(
+                "/game/2?board_format=compact",
+                headers={"If-None-Match": '"7-default-all"'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('"7-compact-all"', response.headers["ETag"])
+        with patch("src.server.game.db.get_fields",
+                   return_value={"turn": "foo"}):
+            response = self.client.get(
+                "/game/2?fields=turn",
+                headers={"If-None-Match": '"7-default-all"'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(f'"{views.get_etag(7, ["turn"])}"',
+                         response.headers["ETag"])
+        self.assertNotEqual(views.get_etag(7, ["turn"]),
+                            views.get_etag(7, ["turn", "board"]))
+
+    def test_get_state_no_version_no_etag(self):
+        response = self.client.get("/game/2", headers={"If-None-Match": "*"})
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn("ETag", response.headers)
+
+    @patch("src.server.game.db.get_fields",
+           return_value={"turn": "foo", "game_status": "playing"})
+    def test_get_state_fields(self, mock_get_fields):
+        """Only the fields asked for are read and returned."""
+        response = self.client.get("/game/2?fields=turn,game_status")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({"turn": "foo", "game_status": "playing"},
+                         response.json)
+        mock_get_fields.assert_called_once_with("2", ["game_status", "turn"])
+
+    @patch("src.server.views.get_db")
+    def test_get_db_stats(self, mock_get_db):
+        stats = {"max_size": 10, "created": 2, "in_use": 1, "waits": 0}
+        mock_get_db.return_value.get_pool_stats.return_value = stats
+        response = self.client.get("/db")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(stats, response.json)
+
+    @patch("src.server.views.game_cache")
+    def test_get_cache_stats(self, mock_game_cache):
+        stats = {"max_size": 1000, "size": 2, "hits": 5, "misses": 2}
+        mock_game_cache.get_stats.return_value = stats
+        response = self.client.get("/cache")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(stats, response.json)
+
+    @patch("src.server.game.Game.start_new_game", return_value="7")
+    def test_create_game_custom_geometry(self, mock_start):
+        test_payload = {"name": "foo", "max_players": 2, "rows": 15,
+                        "cols": 15, "winning_count": 5}
+        response = self.client.post("/game", json=test_payload)
+        self.assertEqual(201, response.status_code)
+        self.assertEqual({"game_id": "7"}, response.json)
+        mock_start.assert_called_once_with("foo", 2, 15, 15, 5, opponent=None)
+
+    @patch("src.server.game.Game.start_new_game")
+    def test_create_game_invalid_geometry(self, mock_start):
+        """Winning count longer than the board, return 400."""
+        test_payload = {"name": "foo", "max_players": 2, "winning_count": 10}
+        response = self.client.post("/game", json=test_payload)
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(mock_start.called)
+
+    @patch("src.server.game.Game.start_new_game")
+    def test_create_game_computer_name_taken(self, mock_start):
+        test_payload = {"name": "computer", "max_players": 2,
+                        "opponent": "computer"}
+        response = self.client.post("/game", json=test_payload)
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(mock_start.called)
+
+    @patch("src.server.views.get_job_queue")
+    @patch("src.server.game.Game.move", return_value=False)
+    def test_move_computer_turn_queued(self, mock_move, mock_get_queue):
+        """Against the computer, its move is queued, response not delayed."""
+        self.test_state.update({"opponent": "computer", "turn": "computer",
+                                "players": ["foo", "computer"]})
+        test_payload = {"name": "foo", "column": 1}
+        response = self.client.patch("/game/2", json=test_payload)
+        self.assertEqual(200, response.status_code)
+        (job_type, game, name), _ = \
+            mock_get_queue.return_value.submit.call_args
+        self.assertEqual(("computer_turn", "2", "computer"),
+                         (job_type, game.game_id, name))
+
+    @patch("src.server.views.get_job_queue")
+    @patch("src.server.game.Game.move", return_value=True)
+    def test_move_winning_move_computer_doesnt_play(self, mock_move,
+                                                    mock_get_queue):
+        self.test_state.update({"opponent": "computer", "turn": "foo",
+                                "players": ["foo", "computer"]})
+        test_payload = {"name": "foo", "column": 1}
+        self.client.patch("/game/2", json=test_payload)
+        self.assertFalse(mock_get_queue.return_value.submit.called)
+
+    @patch("src.server.views.get_job_queue")
+    def test_request_hint_queued(self, mock_get_queue):
+        self.test_state["players"] = ["foo", "bar"]
+        response = self.client.post("/game/2/hint", json={"name": "foo"})
+        self.assertEqual(202, response.status_code)
+        mock_get_queue.return_value.submit.assert_called_once()
+
+    @patch("src.server.views.get_job_queue")
+    def test_request_hint_not_players_turn(self, mock_get_queue):
+        self.test_state["players"] = ["foo", "bar"]
+        response = self.client.post("/game/2/hint", json={"name": "bar"})
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(mock_get_queue.return_value.submit.called)
+
+    @patch("src.server.views.get_job_queue")
+    def test_get_job_stats(self, mock_get_queue):
+        mock_get_queue.return_value.get_stats.return_value = {
+            "queue_depth": 3}
+        response = self.client.get("/jobs")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({"queue_depth": 3}, response.json)
+
+    def test_get_state_compact_board(self):
+        """Client asked for the compact board format."""
+        self.test_state["board"] = [["-", "x"], ["-", "-"]]
+        response = self.client.get("/game/2?board_format=compact")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("1:2:-x--", response.json["board"])
+
     @patch("src.server.game.Game.move", return_value=None)
     def test_move_column_full(self, mock_move):
         """Column full, return 400"""
@@ -39,6 +301,28 @@ class TestApp(TestCase):
         self.assertDictEqual(self.test_state, response.json)
         mock_move.assert_called_once_with("foo", 1)
 
+    @patch("src.server.game.db.ATOMIC_MOVES", True)
+    def test_move_not_turn(self):
+        """The atomic move was out of turn, or the game is over, 409."""
+        with patch("src.server.game.db.atomic_move",
+                   return_value=("not_turn", self.test_state)):
+            response = self.client.patch("/game/2",
+                                         json={"name": "foo", "column": 1})
+        self.assertEqual(409, response.status_code)
+        self.assertEqual("Conflict, not your turn.",
+                         response.json["message"])
+
+    @patch("src.server.game.Game.play_move")
+    def test_move_invalid_column(self, mock_play_move):
+        """Column not a whole number from 1, return 400"""
+        for column in (0, "3", 2.5, True, None):
+            response = self.client.patch(
+                "/game/2", json={"name": "foo", "column": column})
+            self.assertEqual(400, response.status_code)
+            self.assertEqual("Bad request, invalid column.",
+                             response.json["message"])
+        self.assertFalse(mock_play_move.called)
+
     @patch("src.server.game.Game.move", return_value=True)
     def test_move_winning_move(self, mock_move):
         """Winning move, inform client with response."""
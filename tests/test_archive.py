@@ -0,0 +1,60 @@
+import gzip
+import json
+import os
+import tempfile
+
+from decimal import Decimal
+from unittest import TestCase
+
+from src.server import archive
+from src.server.game import Game
+
+
+def new_game(game_id, game_status=Game.WON):
+    return {"game_id": game_id, "game_status": game_status,
+            "moves": [[1, "a", 1]], "max_players": Decimal("2")}
+
+
+class TestArchive(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_only_finished_games_archived(self):
+        games = [new_game("1"), new_game("2", Game.PLAYING),
+                 new_game("3", Game.DISCONNECTED), new_game("4", Game.OPEN)]
+        game_archive = archive.Archive(self.directory)
+        self.assertListEqual(
+            [2], list(archive.archive_games(games, game_archive)))
+        self.assertEqual(
+            {"game_id": "3", "game_status": Game.DISCONNECTED,
+             "moves": [[1, "a", 1]], "max_players": 2},
+            game_archive.read_game("3"))
+        self.assertIsNone(game_archive.read_game("2"))
+
+    def test_archived_games_skipped_next_time(self):
+        archive.Archive(self.directory).append([new_game("1")])
+        game_archive = archive.Archive(self.directory)
+        self.assertIn("1", game_archive)
+        self.assertListEqual([1], list(archive.archive_games(
+            [new_game("1"), new_game("2")], game_archive)))
+
+    def test_batches_appended_to_segments(self):
+        """Each batch is a gzip member, segments roll over once full."""
+        game_archive = archive.Archive(self.directory, segment_size=1)
+        games = [new_game(str(number)) for number in range(5)]
+        self.assertListEqual([2, 2, 1], list(archive.archive_games(
+            games, game_archive, batch_size=2)))
+        segments = sorted(name for name in os.listdir(self.directory)
+                          if name.startswith("segment-"))
+        self.assertEqual(3, len(segments))
+        with gzip.open(os.path.join(self.directory, segments[0])) as f:
+            self.assertListEqual(["0", "1"], [json.loads(line)["game_id"]
+                                              for line in f])
+        for number in range(5):
+            self.assertEqual(str(number),
+                             game_archive.read_game(str(number))["game_id"])
+        # the next run carries on in the last segment
+        self.assertEqual(3, archive.Archive(self.directory).segment_number)
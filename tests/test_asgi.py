@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+import threading
+
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from src.server import asgi
+from src.server.async_db import AsyncDB
+from src.server.cache import GameCache
+from src.server.calls import Wait
+from src.server.db import DB, MemoryDB
+from src.server.game import Game
+
+
+class TestAsgiApp(TestCase):
+    """Requests to the ASGI app, on the memory db."""
+
+    def setUp(self):
+        DB._connection = None
+        self.db = MemoryDB("memory")
+        for target, value in [
+                ("src.server.game.db", self.db),
+                ("src.server.game_finder.db", self.db),
+                ("src.server.game.game_cache", GameCache()),
+                ("src.server.asgi.async_db", AsyncDB(self.db, threads=4))]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.dict(os.environ, {"CONNECT_5_DB_TYPE": "memory"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def request(self, method, path, body=None, query="", headers=()):
+        """Return the response's status, headers and body."""
+        scope = {
+            "type": "http", "method": method, "path": path,
+            "query_string": query.encode(),
+            "headers": [(name.encode(), value.encode())
+                        for name, value in headers],
+        }
+        requests = [{"type": "http.request",
+                     "body": json.dumps(body).encode() if body else b""}]
+        sent = []
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            # the client stays connected
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        self.loop.run_until_complete(asgi.app(scope, receive, send))
+        response_headers = {name.decode(): value.decode()
+                            for name, value in sent[0]["headers"]}
+        body = b"".join(message.get("body", b"") for message in sent[1:])
+        return sent[0]["status"], response_headers, body.decode()
+
+    def new_game(self):
+        status, _, body = self.request(
+            "POST", "/game", {"name": "a", "max_players": 2})
+        self.assertEqual(201, status)
+        game_id = json.loads(body)["game_id"]
+        status, _, body = self.request("PATCH", "/game", {"name": "b"})
+        self.assertEqual((200, game_id), (status, json.loads(body)["game_id"]))
+        return game_id
+
+    def play(self, game_id, *moves):
+        for name, column in moves:
+            game = Game(game_id)
+            game.load_game()
+            game.play_move(name, column)
+
+    def test_play_game(self):
+        game_id = self.new_game()
+        status, _, body = self.request(
+            "PATCH", f"/game/{game_id}", {"name": "a", "column": 1})
+        self.assertEqual((200, "OK"), (status, json.loads(body)["message"]))
+        status, headers, body = self.request(
+            "GET", f"/game/{game_id}", query="board_format=compact")
+        self.assertEqual(200, status)
+        self.assertEqual('"3-compact-all"', headers["etag"])
+        self.assertEqual("b", json.loads(body)["turn"])
+        self.assertTrue(json.loads(body)["board"].startswith("1:6:"))
+
+    def test_not_modified(self):
+        game_id = self.new_game()
+        status, headers, body = self.request(
+            "GET", f"/game/{game_id}",
+            headers=[("If-None-Match", '"2-default-all"')])
+        self.assertEqual((304, '"2-default-all"', ""),
+                         (status, headers["etag"], body))
+
+    def test_long_poll(self):
+        """Held until the other player moves."""
+        game_id = self.new_game()
+        player = threading.Timer(0.05, self.play, (game_id, ("a", 1)))
+        player.start()
+        status, headers, _ = self.request(
+            "GET", f"/game/{game_id}", query="wait=10&since=2",
+            headers=[("If-None-Match", '"2-default-all"')])
+        player.join()
+        self.assertEqual((200, '"3-default-all"'), (status, headers["etag"]))
+
+    def test_long_poll_timeout(self):
+        game_id = self.new_game()
+        status, _, _ = self.request(
+            "GET", f"/game/{game_id}", query="wait=0.05&since=2",
+            headers=[("If-None-Match", '"2-default-all"')])
+        self.assertEqual(304, status)
+
+    def test_bad_request(self):
+        status, _, _ = self.request("GET", "/game/1", query="wait=soon")
+        self.assertEqual(400, status)
+        game_id = self.new_game()
+        for column in (0, 10, "3"):
+            status, _, _ = self.request(
+                "PATCH", f"/game/{game_id}", {"name": "a", "column": column})
+            self.assertEqual(400, status)
+
+    def test_not_found_and_not_allowed(self):
+        self.assertEqual(404, self.request("GET", "/games")[0])
+        self.assertEqual(405, self.request("DELETE", "/game/1")[0])
+
+    def test_events(self):
+        """Moves are streamed as they're made, until the game is won."""
+        game_id = self.new_game()
+        player = threading.Timer(0.05, self.play, [game_id] + [
+            ("a", 1), ("b", 1), ("a", 2), ("b", 2), ("a", 3), ("b", 3),
+            ("a", 4), ("b", 4), ("a", 5)])
+        player.start()
+        status, headers, body = self.request(
+            "GET", f"/game/{game_id}/events")
+        player.join()
+        self.assertEqual(200, status)
+        self.assertEqual("text/event-stream", headers["content-type"])
+        self.assertTrue(body.startswith("event: state\nid: 2\n"))
+        self.assertEqual(9, body.count("event: move\n"))
+        self.assertTrue(body.endswith(
+            'event: status\nid: 11\ndata: {"game_status": "won", '
+            '"turn": "a"}\n\n'))
+
+    def test_stats(self):
+        status, _, body = self.request("GET", "/cache")
+        self.assertEqual(200, status)
+        self.assertIn("hits", json.loads(body))
+
+    @patch("src.server.views.get_job_queue")
+    def test_job_stats_off_the_event_loop(self, mock_get_queue):
+        """The queue is read in the AsyncDB's threads, not the loop's."""
+        threads = []
+        mock_get_queue.return_value.get_stats.side_effect = \
+            lambda: threads.append(threading.current_thread()) or {}
+        status, _, _ = self.request("GET", "/jobs")
+        self.assertEqual(200, status)
+        self.assertIsNot(threading.main_thread(), threads[0])
+
+
+class TestAsyncDB(TestCase):
+
+    def setUp(self):
+        DB._connection = None
+        self.db = MemoryDB("memory")
+        self.db.save_game("1", {"moves": [], "turn": "a"})
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def wait_for_version(self, since, timeout):
+        writer = threading.Timer(
+            0.05, self.db.save_game, ("1", {"moves": [], "turn": "b"}))
+        writer.start()
+        version = self.loop.run_until_complete(
+            AsyncDB(self.db).wait_for_version("1", since, timeout))
+        writer.join()
+        return version
+
+    def test_wait_for_version(self):
+        self.assertEqual(2, self.wait_for_version(1, 10))
+
+    @patch("src.server.db.VERSION_POLL_INTERVAL", 0.01)
+    @patch("src.server.db.MemoryDB.get_change_notifier", return_value=None)
+    def test_wait_for_version_polled(self, mock_get_change_notifier):
+        self.assertEqual(2, self.wait_for_version(1, 10))
+
+    def test_wait_for_version_timeout(self):
+        self.assertEqual(1, self.wait_for_version(1, 0.01))
+
+    def test_run_view(self):
+        """Waits are held by the loop, the other calls run in the pool."""
+        def view():
+            version = yield Wait(Mock(game_id="1"), 1, 0.01)
+            return version, (yield threading.current_thread)
+
+        version, thread = self.loop.run_until_complete(
+            AsyncDB(self.db).run_view(view()))
+        self.assertEqual(1, version)
+        self.assertIsNot(threading.main_thread(), thread)
@@ -0,0 +1,31 @@
+import json
+import random
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.server import benchmark
+
+
+@patch("src.server.game.db")
+class TestBenchmark(TestCase):
+
+    def test_same_responses(self, mock_db):
+        """Every serializer gives the response as it was before."""
+        items = [benchmark.new_item(number, 20, random.Random(3))
+                 for number in range(5)]
+        before = [json.loads(benchmark.response_before(game))
+                  for game in benchmark.load_games(items, True)]
+        games = benchmark.load_games(items, False)
+        for serializer in benchmark.get_serializers().values():
+            self.assertListEqual(before, [
+                json.loads(benchmark.response_after(game, serializer))
+                for game in games])
+
+    def test_benchmark(self, mock_db):
+        results = benchmark.benchmark(num_games=10, num_moves=5, repeats=2)
+        self.assertIn(benchmark.BEFORE, results)
+        self.assertIn("json cached", results)
+        for responses, num_bytes, seconds in results.values():
+            self.assertEqual(20, responses)
+            self.assertGreater(num_bytes, 0)
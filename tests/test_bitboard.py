@@ -0,0 +1,87 @@
+import random
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.server.bitboard import BitBoard
+from src.server.game import Game
+
+
+def new_board():
+    return [[Game.EMPTY for i in range(Game.BOARD_ROWS)]
+            for j in range(Game.BOARD_COLS)]
+
+
+def new_game_state(players):
+    return {"board": new_board(), "heights": [0] * Game.BOARD_COLS,
+            "players": players, "turn": players[0],
+            "max_players": len(players)}
+
+
+class TestBitBoard(TestCase):
+
+    def setUp(self):
+        self.bitboard = BitBoard(Game.BOARD_COLS, Game.BOARD_ROWS,
+                                 Game.WINNING_COUNT, Game.player_discs)
+
+    def test_drop_returns_row_from_bottom_up(self):
+        """First disc lands on the bottom row, the next one on top of it."""
+        self.assertEqual(5, self.bitboard.drop(0, Game.Xs))
+        self.assertEqual(4, self.bitboard.drop(0, Game.Os))
+        self.assertEqual([2, 0, 0, 0, 0, 0, 0, 0, 0], self.bitboard.heights)
+
+    def test_drop_column_full(self):
+        """Column full, return None."""
+        for _ in range(Game.BOARD_ROWS):
+            self.bitboard.drop(3, Game.Xs)
+        self.assertIsNone(self.bitboard.drop(3, Game.Os))
+
+    def test_has_won_vertical_doesnt_wrap_into_next_column(self):
+        """Xs at the top of column 0 and bottom of column 1 is not a win."""
+        board = new_board()
+        board[0] = [Game.Xs, Game.Xs, Game.Xs, Game.Os, Game.Os, Game.Os]
+        board[1][5] = Game.Xs
+        board[1][4] = Game.Xs
+        bitboard = BitBoard.from_board(board, Game.BOARD_ROWS,
+                                       Game.WINNING_COUNT, Game.player_discs,
+                                       Game.EMPTY)
+        self.assertFalse(bitboard.has_won(Game.Xs, 1, 4))
+
+    def test_has_won_only_lines_through_move(self):
+        """A line elsewhere on the board doesn't make this move a win."""
+        board = new_board()
+        for column in range(Game.WINNING_COUNT):
+            board[column][5] = Game.Os
+        board[8][5] = Game.Os
+        bitboard = BitBoard.from_board(board, Game.BOARD_ROWS,
+                                       Game.WINNING_COUNT, Game.player_discs,
+                                       Game.EMPTY)
+        self.assertTrue(bitboard.has_won(Game.Os, 2, 5))
+        self.assertFalse(bitboard.has_won(Game.Os, 8, 5))
+
+    @patch("src.server.game.db")
+    def _play_random_games(self, num_players, mock_db):
+        """Play the same random games through both engines, compare them."""
+        rand = random.Random(num_players)
+        for _ in range(300):
+            players = [str(num) for num in range(num_players)]
+            list_game = Game("list")
+            list_game.game = new_game_state(players)
+            bit_game = Game("bit")
+            bit_game.game = new_game_state(players)
+            bit_game.ENGINE = Game.BITBOARD_ENGINE
+            for _ in range(Game.BOARD_ROWS * Game.BOARD_COLS + 5):
+                turn = list_game.game["turn"]
+                column = rand.randint(1, Game.BOARD_COLS)
+                list_result = list_game.move(turn, column)
+                bit_result = bit_game.move(turn, column)
+                self.assertEqual(list_result, bit_result)
+                self.assertEqual(list_game.game, bit_game.game)
+                if list_result is True:
+                    break
+
+    def test_same_results_as_list_engine_2_players(self):
+        self._play_random_games(2)
+
+    def test_same_results_as_list_engine_3_players(self):
+        self._play_random_games(3)
@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+from src.server.cache import GameCache
+
+
+class TestGameCache(TestCase):
+
+    def test_hit_at_same_version_only(self):
+        cache = GameCache()
+        cache.put("1", 2, "game")
+        self.assertEqual("game", cache.get("1", 2))
+        self.assertIsNone(cache.get("1", 3))
+        self.assertIsNone(cache.get("2", 2))
+        self.assertDictEqual(
+            {"max_size": 1000, "size": 1, "hits": 1, "misses": 2},
+            cache.get_stats())
+
+    def test_least_recently_used_evicted(self):
+        cache = GameCache(max_size=2)
+        cache.put("1", 1, "one")
+        cache.put("2", 1, "two")
+        cache.get("1", 1)
+        cache.put("3", 1, "three")
+        self.assertIsNone(cache.get("2", 1))
+        self.assertEqual("one", cache.get("1", 1))
+        self.assertEqual("three", cache.get("3", 1))
+
+    def test_older_version_not_cached(self):
+        """A slow request doesn't replace a newer version of the game."""
+        cache = GameCache()
+        cache.put("1", 5, "new")
+        cache.put("1", 4, "old")
+        self.assertEqual("new", cache.get("1", 5))
+
+    def test_disabled(self):
+        cache = GameCache(max_size=0)
+        cache.put("1", 1, "game")
+        self.assertIsNone(cache.get("1", 1))
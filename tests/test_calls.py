@@ -0,0 +1,43 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from src.server.calls import Sleep, Wait, run_stream, run_view
+
+
+def view():
+    first = yield lambda: 1
+    second = yield lambda: first + 1
+    return first, second
+
+
+def stream():
+    yield "a"
+    value = yield lambda: "b"
+    yield value
+    yield Sleep(5)
+
+
+class TestCalls(TestCase):
+
+    def test_run_view(self):
+        self.assertEqual((1, 2), run_view(view()))
+
+    @patch("src.server.calls.time.sleep")
+    def test_run_stream(self, mock_sleep):
+        self.assertListEqual(["a", "b"], list(run_stream(stream())))
+        mock_sleep.assert_called_once_with(5)
+
+    def test_run_stream_closed(self):
+        """The stream is closed when its messages are no longer read."""
+        messages = stream()
+        run = run_stream(messages)
+        next(run)
+        run.close()
+        with self.assertRaises(StopIteration):
+            next(messages)
+
+    def test_wait(self):
+        game = Mock()
+        game.wait_for_version.return_value = 4
+        self.assertEqual(4, Wait(game, 3, 10)())
+        game.wait_for_version.assert_called_once_with(3, 10)
@@ -7,7 +7,28 @@ from src import client
 board_fixture = [["-"] * client.BOARD_ROWS] * client.BOARD_COLS
 
 
-@patch("src.client.requests.get")
+class TestClientDisplayBoard(TestCase):
+
+    @patch("builtins.print")
+    def test_display_compact_board(self, mock_print):
+        """Compact board from the server displayed the same as a list one."""
+        client.display_board("1:6:" + "-----x" + "-" * 47 + "o")
+        expected_calls = [call("- - - - - - - - -")] * 5 + \
+            [call("x - - - - - - - o")]
+        self.assertListEqual(expected_calls, mock_print.call_args_list)
+
+    @patch("builtins.print")
+    def test_display_board_custom_geometry(self, mock_print):
+        client.display_board([["-", "x"], ["o", "x"], ["-", "-"]])
+        self.assertListEqual([call("- o -"), call("x x -")],
+                             mock_print.call_args_list)
+
+    def test_decode_board_unknown_version(self):
+        with self.assertRaises(ValueError):
+            client.decode_board("2:2:-xoo")
+
+
+@patch("src.client.requests.Session.get")
 class TestClientGetRequests(TestCase):
 
     @patch("src.client.exit_game")
@@ -22,7 +43,9 @@ class TestClientGetRequests(TestCase):
         mock_get.return_value = mock_response
         test_client = client.Client("bar", "123")
         test_client.get_game_state()
-        mock_get.assert_called_once_with('http://127.0.0.1/game/123')
+        mock_get.assert_called_once_with(
+            'http://127.0.0.1/game/123', params=client.BOARD_PARAMS,
+            headers={})
         mock_exit.assert_called_once_with("Game over, foo has won.")
 
     @patch("src.client.exit_game")
@@ -37,7 +60,9 @@ class TestClientGetRequests(TestCase):
         mock_get.return_value = mock_response
         test_client = client.Client("bar", "123")
         test_client.get_game_state()
-        mock_get.assert_called_once_with('http://127.0.0.1/game/123')
+        mock_get.assert_called_once_with(
+            'http://127.0.0.1/game/123', params=client.BOARD_PARAMS,
+            headers={})
         mock_exit.assert_called_once_with(
             "Game over, other player disconnected.")
 
@@ -53,7 +78,9 @@ class TestClientGetRequests(TestCase):
         mock_get.return_value = mock_response
         test_client = client.Client("bar", "123")
         test_client.get_game_state()
-        mock_get.assert_called_once_with('http://127.0.0.1/game/123')
+        mock_get.assert_called_once_with(
+            'http://127.0.0.1/game/123', params=client.BOARD_PARAMS,
+            headers={})
         mock_move.assert_called_once_with()
 
     @patch("src.client.time.sleep")
@@ -64,11 +91,13 @@ class TestClientGetRequests(TestCase):
             "game_status": "playing",
             "board": board_fixture,
         }
-        mock_response = Mock(json=lambda: mock_response_body)
+        mock_response = Mock(json=lambda: mock_response_body, headers={})
         mock_get.return_value = mock_response
         test_client = client.Client("bar", "123")
         test_client.get_game_state()
-        mock_get.assert_called_once_with('http://127.0.0.1/game/123')
+        mock_get.assert_called_once_with(
+            'http://127.0.0.1/game/123', params=client.BOARD_PARAMS,
+            headers={})
         mock_sleep.assert_called_once_with(2)
 
     @patch("src.client.time.sleep")
@@ -79,15 +108,84 @@ class TestClientGetRequests(TestCase):
             "game_status": "playing",
             "board": board_fixture,
         }
-        mock_response = Mock(json=lambda: mock_response_body)
+        mock_response = Mock(json=lambda: mock_response_body, headers={})
         mock_get.return_value = mock_response
         test_client = client.Client("bar", "123")
         test_client.get_game_state()
-        mock_get.assert_called_once_with('http://127.0.0.1/game/123')
+        mock_get.assert_called_once_with(
+            'http://127.0.0.1/game/123', params=client.BOARD_PARAMS,
+            headers={})
         mock_sleep.assert_called_once_with(2)
 
+    @patch("src.client.time.sleep")
+    def test_get_game_state_not_modified(self, mock_sleep, mock_get):
+        """Game unchanged since the last long poll, the last state is used."""
+        mock_response_body = {
+            "turn": "foo",
+            "game_status": "playing",
+            "board": board_fixture,
+        }
+        mock_get.side_effect = [
+            Mock(status_code=200, json=lambda: mock_response_body,
+                 headers={"ETag": '"4-compact-all"'}),
+            Mock(status_code=304, headers={"ETag": '"4-compact-all"'})]
+        test_client = client.Client("bar", "123")
+        test_client.get_game_state()
+        test_client.get_game_state()
+        self.assertEqual(
+            call('http://127.0.0.1/game/123',
+                 params=dict(client.BOARD_PARAMS, wait=20, since="4"),
+                 headers={"If-None-Match": '"4-compact-all"'}),
+            mock_get.call_args_list[1])
+        # the server held the polls, the client didn't sleep
+        mock_sleep.assert_not_called()
+
+    @patch("src.client.time.sleep")
+    def test_get_game_state_not_held(self, mock_sleep, mock_get):
+        """The server was too busy to hold the poll, sleep as it asks."""
+        mock_get.return_value = Mock(status_code=304, headers={
+            "ETag": '"4-compact-all"', "Retry-After": "2"})
+        test_client = client.Client("bar", "123")
+        test_client.etag = '"4-compact-all"'
+        test_client.game_state = {"turn": "foo", "game_status": "playing"}
+        test_client.get_game_state()
+        mock_sleep.assert_called_once_with(2.0)
+
+    @patch("src.client.exit_game")
+    @patch("src.client.time.sleep")
+    def test_spectate_retried_when_busy(self, mock_sleep, mock_exit,
+                                        mock_get):
+        mock_get.side_effect = [
+            Mock(status_code=503, headers={"Retry-After": "2"}),
+            Mock(status_code=200, iter_lines=lambda decode_unicode: iter([
+                "event: status",
+                'data: {"game_status": "disconnected", "turn": "a"}', ""]))]
+        client.Client(None, "123").spectate()
+        self.assertEqual(2, mock_get.call_count)
+        mock_sleep.assert_called_once_with(2.0)
+        mock_exit.assert_called_once_with("Game over, a player disconnected.")
+
+    @patch("src.client.exit_game")
+    @patch("src.client.display_board")
+    def test_spectate(self, mock_display, mock_exit, mock_get):
+        """Events pushed by the server are shown until the game is won."""
+        mock_get.return_value = Mock(iter_lines=lambda decode_unicode: iter([
+            "event: state", "id: 1",
+            'data: {"board": "1:2:----", "turn": "a"}', "",
+            ": keep-alive", "",
+            "event: move", "id: 2",
+            'data: {"column": 2, "name": "a", "number": 1, "disc": "x"}', "",
+            "event: status", "id: 2",
+            'data: {"game_status": "won", "turn": "a"}', ""]))
+        client.Client(None, "123").spectate()
+        mock_get.assert_called_once_with(
+            'http://127.0.0.1/game/123/events', params=client.BOARD_PARAMS,
+            stream=True)
+        mock_display.assert_called_with([["-", "-"], ["-", "x"]])
+        mock_exit.assert_called_once_with("Game over, a has won.")
+
 
-@patch("src.client.requests.patch")
+@patch("src.client.requests.Session.patch")
 class TestClientPatchRequests(TestCase):
 
     @patch("src.client.display_board")
@@ -105,7 +203,7 @@ class TestClientPatchRequests(TestCase):
         }
         expected_url = "http://127.0.0.1/game/123"
         mock_patch.assert_called_once_with(
-            expected_url, json=expected_payload)
+            expected_url, json=expected_payload, params=client.BOARD_PARAMS)
         mock_display.assert_called_once()
 
     @patch("src.client.display_board")
@@ -132,9 +230,33 @@ class TestClientPatchRequests(TestCase):
         }
         expected_url = "http://127.0.0.1/game/456"
         mock_patch.assert_called_once_with(
-            expected_url, json=expected_payload)
+            expected_url, json=expected_payload, params=client.BOARD_PARAMS)
         mock_display.assert_called_once()
 
+    @patch("src.client.display_board")
+    @patch("src.client.prompt_user", side_effect=['12', '3'])
+    def test_make_move_custom_board_columns(self, mock_prompt, mock_display,
+                                            mock_patch):
+        """Board has 15 columns, column 12 is accepted."""
+        mock_patch.return_value = Mock(status_code=200)
+        test_client = client.Client("foo", "123")
+        test_client.columns = 15
+        test_client.make_move()
+        mock_prompt.assert_called_once_with(
+            "It's your turn foo, please enter column (1 - 15): ")
+
+    @patch("builtins.print")
+    @patch("src.client.prompt_user", return_value='2')
+    def test_make_move_not_turn(self, mock_prompt, mock_print, mock_patch):
+        """The game moved on before the move, go back to polling it."""
+        mock_patch.return_value = Mock(
+            status_code=409, json=lambda: {"message": "Conflict, not your "
+                                                      "turn."})
+        client.Client("lola", "789").make_move()
+        mock_prompt.assert_called_once()
+        mock_patch.assert_called_once()
+        mock_print.assert_called_once_with("Conflict, not your turn.")
+
     @patch("src.client.display_board")
     @patch("src.client.prompt_user", side_effect=['2', '3'])
     def test_make_move_column_full(self, mock_prompt, mock_display,
@@ -156,8 +278,10 @@ class TestClientPatchRequests(TestCase):
         self.assertListEqual(mock_prompt.call_args_list, expected_prompts)
         expected_url = "http://127.0.0.1/game/789"
         expected_calls = [
-            call(expected_url, json={'column': 2, 'name': 'lola'}),
-            call(expected_url, json={'column': 3, 'name': 'lola'})]
+            call(expected_url, json={'column': 2, 'name': 'lola'},
+                 params=client.BOARD_PARAMS),
+            call(expected_url, json={'column': 3, 'name': 'lola'},
+                 params=client.BOARD_PARAMS)]
         self.assertListEqual(mock_patch.call_args_list,
                              expected_calls)
         mock_display.assert_called_once()
@@ -176,3 +300,15 @@ class TestClientPostRequests(TestCase):
         self.assertFalse(mock_exit.called)
         mock_post.assert_called_once_with(
             'http://127.0.0.1/game', json={'name': 'eric', 'max_players': 2})
+
+    @patch("src.client.prompt_user", side_effect=["eric", "5", "4"])
+    def test_connect_play_against_computer(self, mock_prompt, mock_post):
+        json = {"game_id": "123"}
+        mock_post.return_value = Mock(status_code=201, json=lambda: json)
+        self.assertEqual(client.connect(), ("eric", "123"))
+        self.assertEqual(
+            call("Invalid choice, please select 1, 2, 3 or 4: "),
+            mock_prompt.call_args_list[-1])
+        mock_post.assert_called_once_with(
+            'http://127.0.0.1/game',
+            json={'name': 'eric', 'max_players': 2, 'opponent': 'computer'})
@@ -1,8 +1,32 @@
+import json
+import os
+import redis
+import tempfile
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from decimal import Decimal
 from redis import WatchError
 from unittest import TestCase
 from unittest.mock import Mock, patch
 
-from src.server.db import DB, RedisDB, get_db, DynamoDB
+from src.server.db import (
+    DB, RedisDB, RedisHashDB, RedisScriptDB, StatsConnectionPool, get_db,
+    ChangeNotifier, DynamoDB, MemoryDB, SQLiteDB)
+
+
+class FakeConnection:
+    """Redis connection that doesn't connect, for testing the pool."""
+
+    def __init__(self, **kwargs):
+        self.pid = os.getpid()
+
+    def connect(self):
+        pass
+
+    def can_read(self):
+        return False
 
 
 class TestDB(TestCase):
@@ -12,6 +36,76 @@ class TestDB(TestCase):
         DB._connection = None
 
 
+class TestChangeNotifier(TestCase):
+
+    def test_change_before_wait_not_missed(self):
+        notifier = ChangeNotifier()
+        with notifier.watch("1") as wait:
+            notifier.notify("1")
+            notifier.notify("2")
+            self.assertTrue(wait(0))
+            self.assertFalse(wait(0))
+        self.assertDictEqual({}, notifier.games)
+
+    def test_listen(self):
+        notifier = ChangeNotifier()
+        calls = []
+        with notifier.listen("1", lambda: calls.append("1")):
+            notifier.notify("1")
+            notifier.notify("2")
+            notifier.notify_all()
+        notifier.notify("1")
+        self.assertListEqual(["1", "1"], calls)
+        self.assertDictEqual({}, notifier.listeners)
+
+    def test_notify_all(self):
+        notifier = ChangeNotifier()
+        with notifier.watch("1") as wait:
+            threading.Timer(0.05, notifier.notify_all).start()
+            self.assertTrue(wait(5))
+
+
+class TestConnection(TestDB):
+
+    @patch("src.server.db.RedisDB._get_connection")
+    def test_connection_made_on_first_use(self, mock_get_redis_connection):
+        db = RedisDB("redis")
+        self.assertFalse(mock_get_redis_connection.called)
+        db.connection.get("1")
+        db.connection.get("2")
+        self.assertEqual(1, mock_get_redis_connection.call_count)
+
+    @patch("src.server.db.os.getpid")
+    @patch("src.server.db.RedisDB._get_connection")
+    def test_connection_made_again_after_fork(self, mock_get_redis_connection,
+                                              mock_getpid):
+        db = RedisDB("redis")
+        mock_getpid.return_value = 100
+        db.connection.get("1")
+        mock_getpid.return_value = 101
+        db.connection.get("1")
+        self.assertEqual(2, mock_get_redis_connection.call_count)
+
+    def test_redis_pool_sized(self):
+        connection = RedisDB._get_connection()
+        pool = connection.connection_pool
+        self.assertIsInstance(pool, StatsConnectionPool)
+        self.assertEqual(10, pool.max_connections)
+        self.assertEqual(5, pool.connection_kwargs["socket_timeout"])
+
+    def test_pool_stats(self):
+        pool = StatsConnectionPool(max_connections=2, timeout=0.01,
+                                   connection_class=FakeConnection)
+        connection = pool.get_connection("GET")
+        pool.get_connection("GET")
+        with self.assertRaises(redis.ConnectionError):
+            pool.get_connection("GET")
+        pool.release(connection)
+        self.assertDictEqual(
+            {"max_size": 2, "created": 2, "in_use": 1, "waits": 1},
+            pool.get_stats())
+
+
 @patch("src.server.db.RedisDB._get_connection")
 class TestRedisDB(TestDB):
 
@@ -36,6 +130,249 @@ class TestRedisDB(TestDB):
         mock_pipeline.set.assert_called_once_with("1", '{"turn": "me"}')
         mock_pipeline.execute.assert_called_once_with()
 
+    def test_save_fields_if_version_watches_version(
+            self, mock_get_redis_connection):
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.get.return_value = "3"
+        self.assertTrue(RedisDB("redis").save_fields_if_version(
+            "1", {"turn": "me"}, ["hint"], 3))
+        mock_pipeline.watch.assert_called_once_with("connect5:version:1")
+        mock_pipeline.set.assert_called_once_with("1", '{"turn": "me"}')
+        mock_pipeline.incr.assert_called_once_with("connect5:version:1")
+
+    def test_save_fields_if_version_moved(self, mock_get_redis_connection):
+        """Nothing written if the game was written since."""
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.get.return_value = "4"
+        self.assertFalse(RedisDB("redis").save_fields_if_version(
+            "1", {"turn": "me"}, ["hint"], 3))
+        self.assertFalse(mock_pipeline.multi.called)
+        self.assertFalse(mock_pipeline.set.called)
+        mock_pipeline.get.return_value = "3"
+        mock_pipeline.execute.side_effect = WatchError
+        self.assertFalse(RedisDB("redis").save_fields_if_version(
+            "1", {"turn": "me"}, ["hint"], 3))
+
+    def test_save_game_board_encoded(self, mock_get_redis_connection):
+        """Board stored in the compact format, caller's game not changed."""
+        game = {"board": [["-", "x"], ["-", "-"]]}
+        RedisDB("redis").save_game("1", game)
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.set.assert_called_once_with(
+            "1", '{"board": "1:2:-x--"}')
+        self.assertFalse(mock_pipeline.rpush.called)
+        self.assertListEqual([["-", "x"], ["-", "-"]], game["board"])
+
+    def test_save_game_move_log(self, mock_get_redis_connection):
+        """Moves saved to their own list, not the game document."""
+        game = {"moves": [[1, "a", 1], [2, "b", 2]], "turn": "a"}
+        RedisDB("redis").save_game("1", game)
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.set.assert_called_once_with("1", '{"turn": "a"}')
+        mock_pipeline.delete.assert_called_once_with("connect5:moves:1")
+        mock_pipeline.rpush.assert_called_once_with(
+            "connect5:moves:1", '[1, "a", 1]', '[2, "b", 2]')
+
+    def test_append_move(self, mock_get_redis_connection):
+        game = {"moves": [[1, "a", 1], [2, "b", 2]], "turn": "a"}
+        RedisDB("redis").append_move("1", game, [2, "b", 2])
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.set.assert_called_once_with("1", '{"turn": "a"}')
+        mock_pipeline.rpush.assert_called_once_with(
+            "connect5:moves:1", '[2, "b", 2]')
+        mock_pipeline.execute.assert_called_once_with()
+
+    def test_get_game_move_log(self, mock_get_redis_connection):
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.execute.return_value = [
+            '{"turn": "a"}', ['[1, "a", 1]', '[2, "b", 2]']]
+        game = RedisDB("redis").get_game("1")
+        self.assertDictEqual(
+            {"turn": "a", "moves": [[1, "a", 1], [2, "b", 2]]}, game)
+
+    def test_get_game_board_decoded(self, mock_get_redis_connection):
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.execute.return_value = ['{"board": "1:2:-x--"}', []]
+        game = RedisDB("redis").get_game("1")
+        self.assertListEqual([["-", "x"], ["-", "-"]], game["board"])
+        self.assertNotIn("moves", game)
+
+    def test_get_game_old_board_format(self, mock_get_redis_connection):
+        """Games stored before the compact format are still loaded."""
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.execute.return_value = [
+            '{"board": [["-", "x"], ["-", "-"]]}', []]
+        game = RedisDB("redis").get_game("1")
+        self.assertListEqual([["-", "x"], ["-", "-"]], game["board"])
+
+    def test_writes_bump_version(self, mock_get_redis_connection):
+        """Version incremented in the same pipeline as the write."""
+        db = RedisDB("redis")
+        db.save_game("1", {"moves": [], "turn": "a"})
+        db.append_move("1", {"moves": [[1, "a", 1]], "turn": "b"},
+                       [1, "a", 1])
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        self.assertEqual(2, mock_pipeline.incr.call_count)
+        mock_pipeline.incr.assert_called_with("connect5:version:1")
+
+    def test_get_versioned_game(self, mock_get_redis_connection):
+        connection = mock_get_redis_connection.return_value
+        connection.pipeline().execute.return_value = [
+            "3", '{"turn": "a"}', ['[1, "a", 1]']]
+        self.assertEqual(
+            (3, {"turn": "a", "moves": [[1, "a", 1]]}),
+            RedisDB("redis").get_versioned_game("1"))
+        connection.pipeline().get.assert_any_call("connect5:version:1")
+
+    def test_get_version_never_written(self, mock_get_redis_connection):
+        mock_get_redis_connection.return_value.get.return_value = None
+        self.assertIsNone(RedisDB("redis").get_version("1"))
+
+    def test_writes_published(self, mock_get_redis_connection):
+        RedisDB("redis").save_game("1", {"moves": [], "turn": "a"})
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.publish.assert_called_once_with("connect5:changes", "1")
+
+    def test_listen_for_changes(self, mock_get_redis_connection):
+        """Published ids wake their watchers, reconnecting wakes them all."""
+        pubsub = mock_get_redis_connection.return_value.pubsub.return_value
+        pubsub.get_message.side_effect = [
+            {"data": "1"}, None, redis.ConnectionError(), {"data": "2"},
+            SystemExit()]
+        notifier = Mock()
+        with patch("src.server.db.time.sleep"), self.assertRaises(SystemExit):
+            RedisDB("redis").listen_for_changes(notifier)
+        pubsub.subscribe.assert_called_with("connect5:changes")
+        self.assertEqual(2, notifier.notify_all.call_count)
+        self.assertListEqual([(("1",),), (("2",),)],
+                             notifier.notify.call_args_list)
+
+    @patch("src.server.db.FINISHED_GAME_TTL", 60)
+    def test_finished_game_expires(self, mock_get_redis_connection):
+        """The game, its move log and its version expire together."""
+        RedisDB("redis").save_game("1", {"moves": [], "game_status": "won"})
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        self.assertListEqual(
+            [(("1", 60),), (("connect5:moves:1", 60),),
+             (("connect5:version:1", 60),)],
+            mock_pipeline.expire.call_args_list)
+
+    @patch("src.server.db.FINISHED_GAME_TTL", 60)
+    def test_move_log_expires_after_rewrite(self, mock_get_redis_connection):
+        """The move log is deleted and pushed again, then expired."""
+        RedisDB("redis").save_game(
+            "1", {"moves": [[1, "a", 1]], "game_status": "won"})
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        names = [name for name, *_ in mock_pipeline.method_calls]
+        self.assertLess(names.index("rpush"), names.index("expire"))
+        mock_pipeline.expire.assert_any_call("connect5:moves:1", 60)
+
+    @patch("src.server.db.FINISHED_GAME_TTL", 60)
+    def test_game_being_played_doesnt_expire(self,
+                                             mock_get_redis_connection):
+        RedisDB("redis").save_game("1", {"game_status": "playing"})
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        self.assertFalse(mock_pipeline.expire.called)
+
+    def test_finished_games_kept_by_default(self, mock_get_redis_connection):
+        RedisDB("redis").save_game("1", {"game_status": "won"})
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        self.assertFalse(mock_pipeline.expire.called)
+
+    def test_get_games_in_order(self, mock_get_redis_connection):
+        """A round trip a batch, None for the games not found."""
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.execute.side_effect = [
+            [['{"turn": "b"}', None], ['[1, "a", 1]'], []],
+            [['{"turn": "a"}'], []]]
+        games = RedisDB("redis").get_games(["2", "9", "1"], batch_size=2)
+        self.assertListEqual(
+            [{"turn": "b", "moves": [[1, "a", 1]]}, None,
+             {"turn": "a", "moves": []}], games)
+        self.assertListEqual([(["2", "9"],), (["1"],)],
+                             [call.args for call in
+                              mock_pipeline.mget.call_args_list])
+
+    def test_save_games_pipeline_per_batch(self, mock_get_redis_connection):
+        RedisDB("redis").save_games(
+            [(str(number), {"turn": "a"}) for number in range(5)],
+            batch_size=2)
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        self.assertEqual(5, mock_pipeline.set.call_count)
+        self.assertEqual(3, mock_pipeline.execute.call_count)
+
+    def test_scan_games_skips_other_keys(self, mock_get_redis_connection):
+        mock_get_redis_connection.return_value.scan_iter.return_value = [
+            "1", "connect5:jobs", "2"]
+        self.assertListEqual(["1", "2"], list(RedisDB("redis").scan_games()))
+
+    def test_iter_games_skips_deleted(self, mock_get_redis_connection):
+        """Game deleted between the scan and the get is skipped."""
+        connection = mock_get_redis_connection.return_value
+        connection.scan_iter.return_value = ["1", "2"]
+        connection.pipeline().execute.return_value = [
+            [None, '{"game_id": "2"}'], [], []]
+        self.assertListEqual([{"game_id": "2", "moves": []}],
+                             list(RedisDB("redis").iter_games()))
+        connection.pipeline().mget.assert_called_once_with(["1", "2"])
+
+    def test_save_game_open_game_indexed(self, mock_get_redis_connection):
+        """Open game added to the index, keeping its place if already in."""
+        RedisDB("redis").save_game("1", {"game_status": "open"})
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        (key, mapping), kwargs = mock_pipeline.zadd.call_args
+        self.assertEqual("connect5:open_games", key)
+        self.assertListEqual(["1"], list(mapping))
+        self.assertEqual({"nx": True}, kwargs)
+        self.assertFalse(mock_pipeline.zrem.called)
+
+    def test_save_game_transaction_full_game_unindexed(
+            self, mock_get_redis_connection):
+        mock_pipeline = Mock()
+        RedisDB("redis").save_game_transaction(
+            mock_pipeline, "1", {"game_status": "playing"})
+        mock_pipeline.zrem.assert_called_once_with("connect5:open_games", "1")
+        self.assertFalse(mock_pipeline.zadd.called)
+
+    def test_scan_open_games_paged(self, mock_get_redis_connection):
+        connection = mock_get_redis_connection.return_value
+        connection.zrangebyscore.side_effect = [
+            [("1", 1.0), ("2", 2.0)], [("3", 3.0)]]
+        db = RedisDB("redis")
+        db.OPEN_GAMES_PAGE_SIZE = 2
+        self.assertListEqual(["1", "2", "3"], list(db.scan_open_games()))
+        connection.zrangebyscore.assert_called_with(
+            "connect5:open_games", 2.0, "+inf", start=0, num=2,
+            withscores=True)
+        self.assertFalse(connection.scan_iter.called)
+
+    def test_scan_open_games_while_joined(self, mock_get_redis_connection):
+        """Games removed from the index as they're read don't skip others.
+        """
+        connection = mock_get_redis_connection.return_value
+        # 1 and 2 were joined and removed, the next page starts from 2's time
+        connection.zrangebyscore.side_effect = [
+            [("1", 1.0), ("2", 2.0)], [("3", 2.0), ("4", 4.0)], [("4", 4.0)]]
+        db = RedisDB("redis")
+        db.OPEN_GAMES_PAGE_SIZE = 2
+        self.assertListEqual(["1", "2", "3", "4"],
+                             list(db.scan_open_games()))
+        self.assertEqual(3, connection.zrangebyscore.call_count)
+
+    def test_setup_db_rebuilds_missing_index(self, mock_get_redis_connection):
+        connection = mock_get_redis_connection.return_value
+        connection.exists.return_value = 0
+        connection.scan_iter.return_value = ["1", "2"]
+        connection.pipeline().execute.side_effect = [
+            [['{"game_id": "1", "game_status": "open"}',
+              '{"game_id": "2", "game_status": "won"}'], [], []],
+            []]
+        RedisDB("redis").setup_db()
+        (_, mapping), _ = connection.pipeline().zadd.call_args
+        self.assertListEqual(["1"], list(mapping))
+        connection.pipeline().zrem.assert_called_once_with(
+            "connect5:open_games", "2")
+
     def test_get_db_singleton(self, mock_get_redis_connection):
         """Ensure that only one db connection is created with multiple calls"""
         redis1 = get_db()
@@ -44,6 +381,156 @@ class TestRedisDB(TestDB):
         self.assertEqual(1, mock_get_redis_connection.call_count)
 
 
+@patch("src.server.db.RedisHashDB._get_connection")
+class TestRedisHashDB(TestDB):
+
+    def test_save_game_one_field_each(self, mock_get_redis_connection):
+        game = {"board": [["-", "x"], ["-", "-"]], "turn": "a",
+                "players": ["a", "b"]}
+        RedisHashDB("redis_hash").save_game("1", game)
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.delete.assert_called_once_with("1")
+        mock_pipeline.hset.assert_called_once_with("1", mapping={
+            "board": '"1:2:-x--"', "turn": '"a"',
+            "players": '["a", "b"]'})
+
+    def test_append_move_changed_fields_only(self, mock_get_redis_connection):
+        """Board, players etc. are not written, the hint is removed."""
+        game = {"moves": [[1, "a", 1]], "heights": [1, 0], "turn": "b",
+                "game_status": "playing", "players": ["a", "b"]}
+        RedisHashDB("redis_hash").append_move("1", game, [1, "a", 1])
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.hset.assert_called_once_with("1", mapping={
+            "heights": "[1, 0]", "turn": '"b"', "game_status": '"playing"'})
+        mock_pipeline.hdel.assert_called_once_with("1", "hint")
+        mock_pipeline.zrem.assert_called_once_with("connect5:open_games", "1")
+        mock_pipeline.rpush.assert_called_once_with(
+            "connect5:moves:1", '[1, "a", 1]')
+        mock_pipeline.execute.assert_called_once_with()
+
+    def test_save_fields(self, mock_get_redis_connection):
+        game = {"moves": [], "turn": "b", "players": ["a", "b"]}
+        RedisHashDB("redis_hash").save_fields("1", game, ["turn"])
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.hset.assert_called_once_with("1",
+                                                   mapping={"turn": '"b"'})
+        self.assertFalse(mock_pipeline.hdel.called)
+
+    def test_get_game(self, mock_get_redis_connection):
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.execute.return_value = [
+            {"turn": '"a"', "max_players": "2"}, ['[1, "a", 1]']]
+        game = RedisHashDB("redis_hash").get_game("1")
+        self.assertDictEqual(
+            {"turn": "a", "max_players": 2, "moves": [[1, "a", 1]]}, game)
+
+    def test_save_fields_bumps_version(self, mock_get_redis_connection):
+        RedisHashDB("redis_hash").save_fields(
+            "1", {"moves": [], "turn": "b"}, ["turn"])
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.incr.assert_called_once_with("connect5:version:1")
+
+    def test_save_fields_if_version_hsets_fields(
+            self, mock_get_redis_connection):
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.get.return_value = "3"
+        hint = {"name": "a", "column": 2}
+        self.assertTrue(RedisHashDB("redis_hash").save_fields_if_version(
+            "1", {"moves": [], "turn": "a", "hint": hint}, ["hint"], 3))
+        mock_pipeline.hset.assert_called_once_with(
+            "1", mapping={"hint": json.dumps(hint)})
+
+    @patch("src.server.db.FINISHED_GAME_TTL", 60)
+    def test_disconnected_game_expires(self, mock_get_redis_connection):
+        RedisHashDB("redis_hash").save_fields(
+            "1", {"moves": [], "game_status": "disconnected"},
+            ["game_status"])
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.expire.assert_any_call("1", 60)
+
+    @patch("src.server.db.FINISHED_GAME_TTL", 60)
+    def test_move_log_expires_after_rewrite(self, mock_get_redis_connection):
+        RedisHashDB("redis_hash").save_game(
+            "1", {"moves": [[1, "a", 1]], "game_status": "won"})
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        names = [name for name, *_ in mock_pipeline.method_calls]
+        self.assertLess(names.index("rpush"), names.index("expire"))
+        mock_pipeline.expire.assert_any_call("connect5:moves:1", 60)
+
+    def test_get_versioned_game(self, mock_get_redis_connection):
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.execute.return_value = [
+            "2", {"turn": '"a"'}, ['[1, "a", 1]']]
+        self.assertEqual(
+            (2, {"turn": "a", "moves": [[1, "a", 1]]}),
+            RedisHashDB("redis_hash").get_versioned_game("1"))
+        mock_pipeline.hgetall.assert_called_once_with("1")
+
+    def test_get_games(self, mock_get_redis_connection):
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.execute.return_value = [
+            {}, [], {"turn": '"a"'}, ['[1, "a", 1]']]
+        self.assertListEqual(
+            [None, {"turn": "a", "moves": [[1, "a", 1]]}],
+            RedisHashDB("redis_hash").get_games(["9", "1"]))
+
+    def test_get_fields_hmget(self, mock_get_redis_connection):
+        """Missing fields left out, the move log isn't read unless asked."""
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.execute.return_value = [['"a"', None]]
+        game = RedisHashDB("redis_hash").get_fields("1", ["turn", "hint"])
+        self.assertDictEqual({"turn": "a"}, game)
+        mock_pipeline.hmget.assert_called_once_with("1", ["turn", "hint"])
+        self.assertFalse(mock_pipeline.lrange.called)
+
+    def test_get_fields_moves(self, mock_get_redis_connection):
+        mock_pipeline = mock_get_redis_connection.return_value.pipeline()
+        mock_pipeline.execute.return_value = [['"a"'], ['[1, "a", 1]']]
+        game = RedisHashDB("redis_hash").get_fields("1", ["moves", "turn"])
+        self.assertDictEqual({"turn": "a", "moves": [[1, "a", 1]]}, game)
+
+
+@patch("src.server.db.RedisScriptDB._get_connection")
+class TestRedisScriptDB(TestDB):
+
+    def test_atomic_move(self, mock_get_redis_connection):
+        connection = mock_get_redis_connection.return_value
+        connection.evalsha.return_value = [
+            "won", ["turn", '"a"', "game_status", '"won"'], ['[1, "a", 1]']]
+        result = RedisScriptDB("redis_script").atomic_move("1", "a", 1)
+        self.assertEqual(
+            (True, {"turn": "a", "game_status": "won",
+                    "moves": [[1, "a", 1]]}), result)
+        connection.evalsha.assert_called_once_with(
+            RedisScriptDB.MOVE_SCRIPT_SHA, 4, "1", "connect5:moves:1",
+            "connect5:open_games", "connect5:version:1", "a", 1, 0,
+            "connect5:changes")
+
+    def test_atomic_move_script_reloaded(self, mock_get_redis_connection):
+        """Script no longer cached by Redis, load it and run it again."""
+        connection = mock_get_redis_connection.return_value
+        connection.evalsha.side_effect = [
+            redis.exceptions.NoScriptError(), ["invalid", [], []]]
+        result = RedisScriptDB("redis_script").atomic_move("1", "a", 1)
+        self.assertEqual((None, {"moves": []}), result)
+        connection.script_load.assert_any_call(RedisScriptDB.MOVE_SCRIPT)
+
+    def test_join_open_game(self, mock_get_redis_connection):
+        connection = mock_get_redis_connection.return_value
+        connection.evalsha.return_value = "7"
+        self.assertEqual("7",
+                         RedisScriptDB("redis_script").join_open_game("a"))
+        connection.evalsha.assert_called_once_with(
+            RedisScriptDB.JOIN_SCRIPT_SHA, 1, "connect5:open_games", "a", 100,
+            "connect5:version:", "connect5:changes")
+
+    def test_atomic_move_legacy_game(self, mock_get_redis_connection):
+        connection = mock_get_redis_connection.return_value
+        connection.evalsha.return_value = ["legacy"]
+        self.assertIsNone(
+            RedisScriptDB("redis_script").atomic_move("1", "a", 1))
+
+
 @patch.dict("src.server.db.os.environ", {"CONNECT_5_DB_TYPE": "dynamodb"})
 @patch("src.server.db.DynamoDB._get_connection")
 class TestDynamoDB(TestDB):
@@ -59,42 +546,92 @@ class TestDynamoDB(TestDB):
         mock_connection = Mock()
         mock_connection.meta.client.list_tables.return_value = \
             {"TableNames": ["Game"]}
+        mock_connection.Table.return_value.global_secondary_indexes = [
+            {"IndexName": "OpenGames"}]
         mock_get_connection.return_value = mock_connection
         db = get_db()
         db.create_game_table()
         self.assertFalse(mock_connection.create_table.called)
+        self.assertFalse(mock_connection.Table.return_value.update.called)
+
+    def test_create_table_adds_open_games_index(self, mock_get_connection):
+        """Table created before the index, add it and index open games."""
+        mock_connection = mock_get_connection.return_value
+        mock_connection.meta.client.list_tables.return_value = \
+            {"TableNames": ["Game"]}
+        mock_table = mock_connection.Table.return_value
+        mock_table.global_secondary_indexes = None
+        mock_table.scan.return_value = {
+            "Items": [{"game_id": "1", "game_status": "open"}]}
+        DynamoDB("dynamodb").create_game_table()
+        _, kwargs = mock_table.update.call_args
+        index, = kwargs["GlobalSecondaryIndexUpdates"]
+        self.assertEqual("OpenGames", index["Create"]["IndexName"])
+        _, kwargs = mock_table.update_item.call_args
+        self.assertEqual("open",
+                         kwargs["ExpressionAttributeValues"][":open_status"])
+
+    def test_encode_game_open_game_indexed(self, mock_get_connection):
+        """Open game has the index keys, keeping the time it was opened."""
+        item = DynamoDB("dynamodb").encode_game(
+            {"game_id": "1", "game_status": "open", "open_since": 5})
+        self.assertEqual("open", item["open_status"])
+        self.assertEqual(5, item["open_since"])
+
+    def test_encode_game_full_game_unindexed(self, mock_get_connection):
+        game = {"game_id": "1", "game_status": "playing",
+                "open_status": "open", "open_since": 5}
+        item = DynamoDB("dynamodb").encode_game(game)
+        self.assertDictEqual({"game_id": "1", "game_status": "playing"},
+                             item)
 
     def test_save_game_transaction_successful(self, mock_get_connection):
         mock_dyno = Mock()
         mock_get_connection.return_value = mock_dyno
         dynamodb = DynamoDB("redis")
-        mock_game = {"foo": "bar"}
+        mock_game = {"game_id": "1", "players": ["a", "b"]}
         self.assertTrue(dynamodb.save_game_transaction(mock_game,
                                                        "game_status", "open"))
         mock_dyno.meta.client.transact_write_items.assert_called_once_with(
             TransactItems=[
                 {
-                    'Put': {
-                        'Item': {"foo": "bar"},
+                    'Update': {
+                        'Key': {"game_id": {"S": "1"}},
                         'TableName': "Game",
+                        'UpdateExpression': (
+                            "SET #players = :players REMOVE #hint, "
+                            "#open_status, #open_since, #expires_at "
+                            "ADD #version :one"),
                         'ConditionExpression': 'game_status = :status',
+                        'ExpressionAttributeNames': {
+                            "#players": "players", "#hint": "hint",
+                            "#open_status": "open_status",
+                            "#open_since": "open_since",
+                            "#expires_at": "expires_at",
+                            "#version": "version",
+                        },
                         'ExpressionAttributeValues': {
-                            ":status": "open",
+                            ":players": {"L": [{"S": "a"}, {"S": "b"}]},
+                            ":one": {"N": "1"},
+                            ":status": {"S": "open"},
                         }
                     }
                 },
             ]
         )
 
-    def test_scan_games(self, mock_get_connection):
-        mock_dyno = Mock()
-        mock_dyno.meta.client.scan.return_value = {"Items": []}
-        mock_get_connection.return_value = mock_dyno
+    def test_scan_games_filter_on_every_page(self, mock_get_connection):
+        mock_table = mock_get_connection.return_value.Table.return_value
+        mock_table.scan.side_effect = [
+            {"Items": [{"game_id": "1"}], "LastEvaluatedKey": "1"},
+            {"Items": [{"game_id": "2"}]},
+        ]
         dynamodb = DynamoDB("redis")
-        for _ in dynamodb.scan_games("game_status", "open", "players", "lola"):
-            pass
-        mock_dyno.meta.client.scan.assert_called_once_with(
-            TableName="Game",
+        games = list(dynamodb.scan_games("game_status", "open", "players",
+                                         "lola"))
+        self.assertListEqual([{"game_id": "1"}, {"game_id": "2"}], games)
+        mock_table.scan.assert_called_with(
+            ExclusiveStartKey="1",
             FilterExpression=(
                 "game_status = :status AND NOT contains (players, :name)"
             ),
@@ -103,3 +640,327 @@ class TestDynamoDB(TestDB):
                 ":name": "lola",
             }
         )
+
+    def test_query_open_games(self, mock_get_connection):
+        mock_table = mock_get_connection.return_value.Table.return_value
+        mock_table.query.side_effect = [
+            {"Items": [{"game_id": "1"}], "LastEvaluatedKey": "1"},
+            {"Items": [{"game_id": "2"}]},
+        ]
+        games = list(DynamoDB("dynamodb").query_open_games("lola"))
+        self.assertListEqual([{"game_id": "1"}, {"game_id": "2"}], games)
+        mock_table.query.assert_called_with(
+            ExclusiveStartKey="1",
+            IndexName="OpenGames",
+            KeyConditionExpression="open_status = :open",
+            FilterExpression="NOT contains (players, :name)",
+            ExpressionAttributeValues={
+                ":open": "open",
+                ":name": "lola",
+            }
+        )
+        self.assertFalse(mock_table.scan.called)
+
+    def test_iter_games_paginated(self, mock_get_connection):
+        mock_table = mock_get_connection.return_value.Table.return_value
+        mock_table.scan.side_effect = [
+            {"Items": [{"game_id": "1"}], "LastEvaluatedKey": "1"},
+            {"Items": [{"game_id": "2"}]},
+        ]
+        games = list(DynamoDB("dynamodb").iter_games())
+        self.assertListEqual([{"game_id": "1"}, {"game_id": "2"}], games)
+        mock_table.scan.assert_called_with(ExclusiveStartKey="1")
+
+    def test_append_move(self, mock_get_connection):
+        """Only the move and the fields a move changes are written."""
+        mock_table = mock_get_connection.return_value.Table.return_value
+        game = {"moves": [[3, "a", 1]], "heights": [0, 0, 1], "turn": "b",
+                "game_status": "playing", "players": ["a", "b"]}
+        DynamoDB("dynamodb").append_move("1", game, [3, "a", 1])
+        _, kwargs = mock_table.update_item.call_args
+        self.assertEqual({"game_id": "1"}, kwargs["Key"])
+        self.assertIn("list_append(moves, :move)",
+                      kwargs["UpdateExpression"])
+        self.assertEqual([[3, "a", 1]],
+                         kwargs["ExpressionAttributeValues"][":move"])
+        self.assertTrue(kwargs["UpdateExpression"].endswith(
+            "REMOVE hint, open_status, open_since ADD #version :one"))
+        self.assertFalse(mock_table.put_item.called)
+
+    def test_get_game_without_decimals(self, mock_get_connection):
+        """Dynamo's Decimals are read as ints (floats if not whole)."""
+        mock_table = mock_get_connection.return_value.Table.return_value
+        mock_table.get_item.return_value = {"Item": {
+            "game_id": "1", "max_players": Decimal("2"),
+            "heights": [Decimal("1"), Decimal("0")],
+            "moves": [[Decimal("1"), "a", Decimal("1")]],
+            "open_since": Decimal("1.5")}}
+        game = DynamoDB("dynamodb").get_game("1")
+        self.assertEqual({"game_id": "1", "max_players": 2, "heights": [1, 0],
+                          "moves": [[1, "a", 1]], "open_since": 1.5}, game)
+        self.assertIs(int, type(game["moves"][0][2]))
+
+    @patch("src.server.db.time.sleep")
+    def test_get_games_unprocessed_keys_retried(self, mock_sleep,
+                                                mock_get_connection):
+        """Results in the order asked for, duplicate keys asked for once."""
+        connection = mock_get_connection.return_value
+        connection.batch_get_item.side_effect = [
+            {"Responses": {"Game": [{"game_id": "2", "turn": "b"}]},
+             "UnprocessedKeys": {"Game": {"Keys": [{"game_id": "1"}]}}},
+            {"Responses": {"Game": [{"game_id": "1", "turn": "a"}]},
+             "UnprocessedKeys": {}},
+        ]
+        games = DynamoDB("dynamodb").get_games(["1", "2", "9", "1"])
+        self.assertListEqual(
+            [{"game_id": "1", "turn": "a"}, {"game_id": "2", "turn": "b"},
+             None, {"game_id": "1", "turn": "a"}], games)
+        (_, kwargs), (_, retry_kwargs) = \
+            connection.batch_get_item.call_args_list
+        self.assertListEqual(
+            [{"game_id": "1"}, {"game_id": "2"}, {"game_id": "9"}],
+            kwargs["RequestItems"]["Game"]["Keys"])
+        self.assertEqual({"Game": {"Keys": [{"game_id": "1"}]}},
+                         retry_kwargs["RequestItems"])
+        mock_sleep.assert_called_once_with(DynamoDB.RETRY_DELAY)
+
+    def test_save_games_updates_versions(self, mock_get_connection):
+        """Games are updated one by one, a batch put would lose versions."""
+        connection = mock_get_connection.return_value
+        mock_table = connection.Table.return_value
+        DynamoDB("dynamodb").save_games(
+            [(str(number), {"game_id": str(number)}) for number in range(3)])
+        self.assertFalse(connection.batch_write_item.called)
+        self.assertFalse(mock_table.put_item.called)
+        self.assertEqual(3, mock_table.update_item.call_count)
+        for _, kwargs in mock_table.update_item.call_args_list:
+            self.assertIn("ADD #version :one", kwargs["UpdateExpression"])
+
+    def test_save_fields_if_version_updates_fields(self,
+                                                   mock_get_connection):
+        """Only the hint is written, a move made meanwhile isn't lost."""
+        mock_table = mock_get_connection.return_value.Table.return_value
+        hint = {"name": "a", "column": 2}
+        self.assertTrue(DynamoDB("dynamodb").save_fields_if_version(
+            "1", {"game_id": "1", "moves": [], "hint": hint}, ["hint"], 3))
+        self.assertFalse(mock_table.put_item.called)
+        mock_table.update_item.assert_called_once_with(
+            Key={"game_id": "1"},
+            UpdateExpression="SET #hint = :hint ADD #version :one",
+            ConditionExpression="#version = :version",
+            ExpressionAttributeNames={"#hint": "hint", "#version": "version"},
+            ExpressionAttributeValues={":hint": hint, ":one": 1,
+                                       ":version": 3})
+
+    def test_save_fields_if_version_moved(self, mock_get_connection):
+        mock_table = mock_get_connection.return_value.Table.return_value
+        mock_table.update_item.side_effect = ClientError(
+            {"Error": {"Code": "ConditionalCheckFailedException"}},
+            "UpdateItem")
+        self.assertFalse(DynamoDB("dynamodb").save_fields_if_version(
+            "1", {"game_id": "1", "moves": []}, ["hint"], 3))
+
+    def test_save_game_adds_to_version(self, mock_get_connection):
+        """The whole game is written, keeping and bumping its version."""
+        mock_table = mock_get_connection.return_value.Table.return_value
+        DynamoDB("dynamodb").save_game(
+            "1", {"game_id": "1", "turn": "a", "game_status": "playing"})
+        _, kwargs = mock_table.update_item.call_args
+        self.assertEqual(
+            "SET #turn = :turn, #game_status = :game_status "
+            "REMOVE #hint, #open_status, #open_since, #expires_at "
+            "ADD #version :one", kwargs["UpdateExpression"])
+        self.assertFalse(mock_table.put_item.called)
+
+    def test_get_versioned_game(self, mock_get_connection):
+        mock_table = mock_get_connection.return_value.Table.return_value
+        mock_table.get_item.return_value = {"Item": {
+            "game_id": "1", "turn": "a", "version": Decimal("4")}}
+        dynamodb = DynamoDB("dynamodb")
+        self.assertEqual((4, {"game_id": "1", "turn": "a"}),
+                         dynamodb.get_versioned_game("1"))
+        self.assertEqual(4, dynamodb.get_version("1"))
+        mock_table.get_item.return_value = {"Item": {"game_id": "1"}}
+        self.assertIsNone(dynamodb.get_version("1"))
+
+    @patch("src.server.db.FINISHED_GAME_TTL", 60)
+    @patch("src.server.db.time.time", return_value=1000)
+    def test_won_game_expires(self, mock_time, mock_get_connection):
+        mock_table = mock_get_connection.return_value.Table.return_value
+        game = {"moves": [[3, "a", 1]], "heights": [0, 0, 1], "turn": "a",
+                "game_status": "won", "players": ["a", "b"]}
+        DynamoDB("dynamodb").append_move("1", game, [3, "a", 1])
+        _, kwargs = mock_table.update_item.call_args
+        self.assertIn("expires_at = :expires_at", kwargs["UpdateExpression"])
+        self.assertEqual(1060,
+                         kwargs["ExpressionAttributeValues"][":expires_at"])
+        self.assertEqual(
+            1060, DynamoDB("dynamodb").encode_game(game)["expires_at"])
+
+    @patch("src.server.db.FINISHED_GAME_TTL", 60)
+    def test_game_being_played_doesnt_expire(self, mock_get_connection):
+        self.assertNotIn("expires_at", DynamoDB("dynamodb").encode_game(
+            {"game_status": "playing", "expires_at": 1060}))
+
+    @patch("src.server.db.FINISHED_GAME_TTL", 60)
+    def test_setup_db_enables_expiry(self, mock_get_connection):
+        client = mock_get_connection.return_value.meta.client
+        client.list_tables.return_value = {"TableNames": []}
+        client.describe_time_to_live.return_value = {
+            "TimeToLiveDescription": {"TimeToLiveStatus": "DISABLED"}}
+        DynamoDB("dynamodb").setup_db()
+        client.update_time_to_live.assert_called_once_with(
+            TableName="Game", TimeToLiveSpecification={
+                "Enabled": True, "AttributeName": "expires_at"})
+
+
+class StoredGamesTests:
+    """Tests of a db storing games for real, for MemoryDB and SQLiteDB."""
+
+    def new_db(self):
+        raise NotImplementedError()
+
+    def setUp(self):
+        super().setUp()
+        self.db = self.new_db()
+
+    def test_save_and_get_game(self):
+        game = {"game_id": "1", "moves": [[1, "a", 1]], "turn": "b",
+                "game_status": "playing"}
+        self.db.save_game("1", game)
+        self.assertDictEqual(game, self.db.get_game("1"))
+        self.assertEqual(1, self.db.get_version("1"))
+
+    def test_append_move(self):
+        self.db.save_game("1", {"moves": [[1, "a", 1]], "turn": "b"})
+        self.db.append_move("1", {"moves": [[1, "a", 1], [2, "b", 2]],
+                                  "turn": "a"}, [2, "b", 2])
+        self.assertEqual(
+            (2, {"moves": [[1, "a", 1], [2, "b", 2]], "turn": "a"}),
+            self.db.get_versioned_game("1"))
+
+    def test_missing_game(self):
+        with self.assertRaises(KeyError):
+            self.db.get_game("1")
+        self.assertIsNone(self.db.get_version("1"))
+
+    def test_open_games_oldest_first(self):
+        for game_id in ("2", "1", "3"):
+            self.db.save_game(game_id, {"moves": [], "game_status": "open"})
+        # saved again, the game keeps its place
+        self.db.save_game("2", {"moves": [], "game_status": "open"})
+        self.db.save_game("1", {"moves": [], "game_status": "playing"})
+        self.assertListEqual(["2", "3"], list(self.db.scan_open_games()))
+        self.assertListEqual(["1", "2", "3"],
+                             sorted(self.db.scan_games()))
+        self.assertEqual(3, len(list(self.db.iter_games())))
+
+    def test_get_and_save_games(self):
+        self.db.save_games([(str(number), {"moves": [], "turn": str(number)})
+                            for number in range(5)], batch_size=2)
+        games = self.db.get_games(["3", "9", "0"], batch_size=2)
+        self.assertListEqual(
+            [{"moves": [], "turn": "3"}, None, {"moves": [], "turn": "0"}],
+            games)
+
+    @patch("src.server.db.VERSION_POLL_INTERVAL", 0.01)
+    def test_wait_for_version(self):
+        """The wait ends when the game is written, not at the timeout."""
+        self.db.save_game("1", {"moves": [], "turn": "a"})
+        writer = threading.Timer(
+            0.05, self.db.save_game, ("1", {"moves": [], "turn": "b"}))
+        writer.start()
+        start = time.monotonic()
+        self.assertEqual(2, self.db.wait_for_version("1", 1, 10))
+        self.assertLess(time.monotonic() - start, 5)
+        writer.join()
+
+    @patch("src.server.db.VERSION_POLL_INTERVAL", 0.01)
+    def test_wait_for_version_timeout(self):
+        self.db.save_game("1", {"moves": [], "turn": "a"})
+        self.assertEqual(1, self.db.wait_for_version("1", 1, 0.05))
+        # already past since, or no version to wait on
+        self.assertEqual(1, self.db.wait_for_version("1", 0, 10))
+        self.assertIsNone(self.db.wait_for_version("2", None, 10))
+
+    def test_transaction_aborted_if_game_changed(self):
+        self.db.save_game("1", {"moves": [], "players": ["a"]})
+        transaction = self.db.begin_transaction("1")
+        game = self.db.get_game_transaction(transaction, "1")
+        self.db.save_game("1", {"moves": [], "players": ["a", "b"]})
+        self.assertFalse(self.db.save_game_transaction(
+            transaction, "1", dict(game, players=["a", "c"])))
+        self.assertListEqual(["a", "b"], self.db.get_game("1")["players"])
+
+    def test_transaction_saved(self):
+        self.db.save_game("1", {"moves": [[1, "a", 1]], "players": ["a"]})
+        transaction = self.db.begin_transaction("1")
+        game = self.db.get_game_transaction(transaction, "1")
+        game["players"].append("b")
+        self.assertTrue(self.db.save_game_transaction(transaction, "1", game))
+        self.assertDictEqual(game, self.db.get_game("1"))
+
+    def test_fields_not_saved_if_version_moved(self):
+        """A move made since the game was read is kept."""
+        self.db.save_game("1", {"moves": [], "turn": "a"})
+        game = self.db.get_game("1")
+        self.db.append_move("1", {"moves": [[1, "a", 1]], "turn": "b"},
+                            [1, "a", 1])
+        self.assertFalse(self.db.save_fields_if_version(
+            "1", dict(game, hint={"name": "a", "column": 2}), ["hint"], 1))
+        self.assertDictEqual({"moves": [[1, "a", 1]], "turn": "b"},
+                             self.db.get_game("1"))
+        game = self.db.get_game("1")
+        game["hint"] = {"name": "b", "column": 2}
+        self.assertTrue(self.db.save_fields_if_version("1", game, ["hint"],
+                                                       2))
+        self.assertDictEqual(game, self.db.get_game("1"))
+
+
+class TestMemoryDB(StoredGamesTests, TestDB):
+
+    def new_db(self):
+        return MemoryDB("memory")
+
+    def test_stored_game_not_shared(self):
+        game = {"moves": [], "players": ["a"]}
+        self.db.save_game("1", game)
+        game["players"].append("b")
+        self.db.get_game("1")["players"].append("c")
+        self.assertListEqual(["a"], self.db.get_game("1")["players"])
+
+
+class TestSQLiteDB(StoredGamesTests, TestDB):
+
+    def new_db(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = patch("src.server.db.SQLiteDB.DB_PATH",
+                        os.path.join(directory.name, "connect5.db"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: DB._connection.close())
+        return SQLiteDB("sqlite")
+
+    def test_wal_mode(self):
+        self.assertEqual("wal", self.db.connection.execute(
+            "PRAGMA journal_mode").fetchone()[0])
+
+    @patch("src.server.db.time.sleep")
+    def test_wait_for_version_polls_slowly(self, mock_sleep):
+        """Without a notifier the version is read every poll interval."""
+        self.db.save_game("1", {"moves": [], "turn": "a"})
+        with patch("src.server.db.time.monotonic",
+                   side_effect=[0, 0, 0, 2, 2, 4, 4, 6]), \
+                patch.object(self.db, "get_version",
+                             return_value=1) as mock_get_version:
+            self.assertEqual(1, self.db.wait_for_version("1", 1, 5))
+        self.assertEqual(4, mock_get_version.call_count)
+        self.assertListEqual([2, 2, 1], [
+            call[0][0] for call in mock_sleep.call_args_list])
+
+    def test_open_games_found_with_status_index(self):
+        plan = " ".join(row[-1] for row in self.db.connection.execute(
+            "EXPLAIN QUERY PLAN " + SQLiteDB.SELECT_OPEN_GAMES, ("open",)))
+        self.assertIn("games_status", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
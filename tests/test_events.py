@@ -0,0 +1,102 @@
+import json
+import threading
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.server import events
+from src.server.calls import run_stream
+from src.server.cache import GameCache
+from src.server.db import DB, MemoryDB
+from src.server.game import Game
+
+
+def new_game(players, max_players=2):
+    return {
+        "game_id": "1", "moves": [], "heights": [0] * 9, "rows": 6,
+        "cols": 9, "winning_count": 5, "players": list(players),
+        "max_players": max_players, "turn": players[0],
+        "game_status": Game.PLAYING if len(players) == max_players
+        else Game.OPEN,
+    }
+
+
+def parse(message):
+    """Return the (event, id, data) of a Server-Sent Events message."""
+    fields = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+    return fields["event"], fields.get("id"), json.loads(fields["data"])
+
+
+class TestEvents(TestCase):
+
+    def setUp(self):
+        DB._connection = None
+        self.db = MemoryDB("memory")
+        for target, value in [("src.server.game.db", self.db),
+                              ("src.server.game.game_cache", GameCache())]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def play(self, *moves):
+        for name, column in moves:
+            game = Game("1")
+            game.load_game()
+            game.play_move(name, column)
+
+    def test_format_event(self):
+        self.assertEqual('event: turn\nid: 3\ndata: {"turn": "a"}\n\n',
+                         events.format_event("turn", {"turn": "a"}, 3))
+        self.assertEqual('event: turn\ndata: {"turn": null}\n\n',
+                         events.format_event("turn", {"turn": None}))
+
+    def test_get_events(self):
+        before = new_game(["a"])
+        game = Game.from_game(dict(
+            new_game(["a", "b"]), moves=[[3, "a", 1]], turn="b"))
+        self.assertListEqual([
+            ("move", {"column": 3, "name": "a", "number": 1, "disc": "x"}),
+            ("players", {"players": ["a", "b"]}),
+            ("turn", {"turn": "b"}),
+            ("status", {"game_status": "playing", "turn": "b"}),
+        ], events.get_events(game, before, None))
+
+    def test_get_events_no_move_log(self):
+        """Games without a move log send their state instead."""
+        before = new_game(["a", "b"])
+        del before["moves"]
+        game = Game.from_game(dict(before, turn="b"))
+        self.assertListEqual(
+            [("state", {"turn": "b"}), ("turn", {"turn": "b"})],
+            events.get_events(game, before, lambda: {"turn": "b"}))
+
+    def test_stream_events(self):
+        """Moves are pushed as they're made, until the game is won."""
+        self.db.save_game("1", new_game(["a", "b"]))
+        stream = run_stream(events.stream_events(
+            "1", lambda game: game.get_state(), keep_alive=0.01))
+        event, event_id, state = parse(next(stream))
+        self.assertEqual(("state", "1"), (event, event_id))
+        self.assertEqual("a", state["turn"])
+        self.assertEqual(": keep-alive\n\n", next(stream))
+
+        player = threading.Thread(target=self.play, args=[
+            ("a", 1), ("b", 1), ("a", 2), ("b", 2), ("a", 3), ("b", 3),
+            ("a", 4), ("b", 4), ("a", 5)])
+        player.start()
+        sent = [parse(message) for message in stream
+                if not message.startswith(":")]
+        player.join()
+        moves = [data for event, _, data in sent if event == "move"]
+        self.assertListEqual(list(range(1, 10)),
+                             [move["number"] for move in moves])
+        self.assertEqual(("status", "10", {"game_status": "won",
+                                           "turn": "a"}), sent[-1])
+
+    def test_stream_events_finished_game(self):
+        self.db.save_game("1", dict(new_game(["a", "b"]),
+                                    game_status=Game.DISCONNECTED))
+        messages = list(run_stream(events.stream_events(
+            "1", lambda game: game.get_state())))
+        self.assertEqual(1, len(messages))
+        self.assertEqual("state", parse(messages[0])[0])
@@ -1,6 +1,12 @@
+import json
+import random
+
+from decimal import Decimal
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
+from src.server.cache import GameCache
+from src.server.db import DB
 from src.server.game import Game
 
 
@@ -210,23 +216,68 @@ class TestGame(TestCase):
         has_won = Game.check_diagonal_2(test_board, Game.Os, 1, 3)
         self.assertFalse(has_won)
 
-    @patch("src.server.game.Game.check_horizontal")
-    @patch("src.server.game.Game.check_vertical", return_value=True)
-    def test_has_won_return_true_on_2nd_check(self, mock_vert, mock_horiz):
-        """Assert if one of the 'check' functions returns True, player wins"""
+    def test_has_won_only_checks_lines_through_move(self):
+        """A winning line elsewhere on the board doesn't win for this move."""
         game = Game("1")
-        game.game = {"board": []}
-        self.assertTrue(game.has_won('x', (0, 1)))
-        mock_vert.assert_called_once_with([], 'x', 0, 1)
-        self.assertFalse(mock_horiz.called)
-
-    @patch("src.server.game.Game.check_has_won_methods",
-           return_value=[False, False])
-    def test_has_won_all_check_methods_return_false(self, mock_check_methods):
-        """Assert if none of the 'check' functions return True game still on"""
-        game = Game("2")
-        game.game = {"board": []}
-        self.assertFalse(game.has_won('x', (0, 1)))
+        board = [[Game.EMPTY] * 6 for _ in range(9)]
+        for column in range(5):
+            board[column][5] = Game.Xs
+        board[7][5] = Game.Xs
+        game.game = {"board": board}
+        self.assertTrue(game.has_won(Game.Xs, (4, 5)))
+        self.assertFalse(game.has_won(Game.Xs, (7, 5)))
+
+    @patch("src.server.game.db")
+    def test_has_won_same_as_check_methods(self, mock_db):
+        """Winning lines agree with the check methods on the default board."""
+        rand = random.Random(5)
+        for _ in range(200):
+            game = Game("1")
+            game.game = {"board": [[Game.EMPTY] * 6 for _ in range(9)],
+                         "heights": [0] * 9}
+            for _ in range(54):
+                disc = rand.choice(Game.player_discs)
+                coordinates = game.make_move(rand.randint(1, 9), disc)
+                if coordinates is None:
+                    continue
+                expected = any(
+                    check(game.game["board"], disc, *coordinates)
+                    for check in game.check_has_won_methods)
+                self.assertEqual(expected, game.has_won(disc, coordinates))
+                if expected:
+                    break
+
+    def test_has_won_custom_geometry(self):
+        """Connect 3 on a 4x4 board, diagonal up to the right."""
+        game = Game("1")
+        board = [[Game.EMPTY] * 4 for _ in range(4)]
+        board[0][3] = board[1][2] = board[2][1] = Game.Os
+        game.game = {"board": board, "rows": 4, "cols": 4,
+                     "winning_count": 3}
+        self.assertTrue(game.has_won(Game.Os, (1, 2)))
+        self.assertFalse(game.has_won(Game.Os, (3, 3)))
+
+    def test_finished_statuses(self):
+        """The db's finished statuses, which can't import Game, are Game's."""
+        self.assertEqual((Game.WON, Game.DISCONNECTED), DB.FINISHED_STATUSES)
+
+    def test_is_valid_geometry(self):
+        self.assertTrue(Game.is_valid_geometry(6, 9, 5))
+        self.assertTrue(Game.is_valid_geometry(15, 15, 5))
+        self.assertFalse(Game.is_valid_geometry(6, 9, 10))
+        self.assertFalse(Game.is_valid_geometry(0, 9, 5))
+        self.assertFalse(Game.is_valid_geometry(6, 100, 5))
+        self.assertFalse(Game.is_valid_geometry("6", 9, 5))
+
+    @patch("src.server.game.db")
+    def test_start_new_game_custom_geometry(self, mock_db):
+        Game.start_new_game("dave", 2, rows=15, cols=15, winning_count=5)
+        _, call_game_state = mock_db.save_game.call_args[0]
+        game = Game.from_game(call_game_state)
+        self.assertEqual(15, len(game.board))
+        self.assertEqual(15, len(game.board[0]))
+        self.assertListEqual([0] * 15, call_game_state["heights"])
+        self.assertEqual(5, call_game_state["winning_count"])
 
     @patch("src.server.game.db")
     def test_start_new_game(self, mock_db):
@@ -235,13 +286,52 @@ class TestGame(TestCase):
         self.assertIsInstance(game_id, str)
         call_game_id, call_game_state = mock_db.save_game.call_args[0]
         self.assertEqual(game_id, call_game_id)
-        self.assertIsInstance(call_game_state["board"], list)
+        self.assertListEqual([], call_game_state["moves"])
+        self.assertNotIn("board", call_game_state)
+        self.assertListEqual([0] * 9, call_game_state["heights"])
+        self.assertEqual(6, call_game_state["rows"])
+        self.assertEqual(9, call_game_state["cols"])
+        self.assertEqual(5, call_game_state["winning_count"])
         self.assertEqual(game_id, call_game_state["game_id"])
         self.assertEqual("dave", call_game_state["turn"])
         self.assertListEqual(["dave"], call_game_state["players"])
         self.assertEqual("open", call_game_state["game_status"])
         self.assertEqual(2, call_game_state["max_players"])
 
+    @patch("src.server.game.db")
+    def test_start_new_game_against_computer(self, mock_db):
+        """Computer is player 2, game ready to play, new player goes first."""
+        Game.start_new_game("dave", 3, opponent="computer")
+        _, call_game_state = mock_db.save_game.call_args[0]
+        self.assertListEqual(["dave", "computer"], call_game_state["players"])
+        self.assertEqual("dave", call_game_state["turn"])
+        self.assertEqual("playing", call_game_state["game_status"])
+        self.assertEqual(2, call_game_state["max_players"])
+        self.assertEqual("computer", call_game_state["opponent"])
+
+    def test_is_computer_turn_not_a_computer_game(self):
+        """A player who happens to be called computer is not searched for."""
+        game = Game("1")
+        game.game = {"opponent": None, "game_status": "playing",
+                     "turn": "computer"}
+        self.assertFalse(game.is_computer_turn())
+
+    @patch("src.server.game.db")
+    def test_play_computer_turn_blocks_win(self, mock_db):
+        """Xs have 4 in a row along the bottom, the computer blocks."""
+        board = [[Game.EMPTY] * 6 for _ in range(9)]
+        for column in range(1, 5):
+            board[column][5] = Game.Xs
+        board[0][5] = board[2][4] = board[3][4] = Game.Os
+        game = Game("1")
+        game.game = {"board": board, "heights": Game.get_heights(board),
+                     "players": ["dave", "computer"], "turn": "computer",
+                     "max_players": 2, "opponent": "computer",
+                     "game_status": "playing"}
+        self.assertFalse(game.play_computer_turn())
+        self.assertEqual(Game.Os, board[5][5])
+        self.assertEqual("dave", game.game["turn"])
+
     def test_get_player_disc_colour_player_1_is_xs_no_player_2(self):
         """Test with one player, 2nd player hasn't joined yet"""
         game = Game("1")
@@ -310,3 +400,205 @@ class TestGame(TestCase):
         game.game_over(won=False)
         mock_db.save_game.assert_called_once_with(
             "1", {"game_status": "disconnected"})
+
+    def test_make_move_lands_on_top_of_column(self):
+        """Disc lands on the row above the column's height, height updated."""
+        game = Game("1")
+        game.game = {
+            "board": [[Game.EMPTY] * 4 + [Game.Os, Game.Xs]] +
+                     [[Game.EMPTY] * 6 for _ in range(8)],
+            "heights": [2, 0, 0, 0, 0, 0, 0, 0, 0],
+        }
+        self.assertEqual((0, 3), game.make_move(1, Game.Xs))
+        self.assertEqual(Game.Xs, game.game["board"][0][3])
+        self.assertEqual(3, game.game["heights"][0])
+
+    def test_make_move_column_full(self):
+        """Column full according to its height, move is invalid."""
+        game = Game("1")
+        game.game = {
+            "board": [[Game.Xs] * 6 for _ in range(9)],
+            "heights": [6] * 9,
+        }
+        self.assertIsNone(game.make_move(9, Game.Os))
+
+    @patch("src.server.game.db")
+    def test_load_game_rebuilds_missing_heights(self, mock_db):
+        """Older games saved without heights get them from the board."""
+        mock_db.get_game.return_value = {
+            "board": [[Game.EMPTY] * 6,
+                      [Game.EMPTY] * 5 + [Game.Xs],
+                      [Game.Os] * 6],
+        }
+        game = Game("1")
+        game.load_game()
+        self.assertListEqual([0, 1, 6], game.game["heights"])
+
+    @patch("src.server.game.db")
+    def test_load_game_heights_converted_to_int(self, mock_db):
+        """DynamoDB returns numbers as decimal, heights are used as indexes."""
+        mock_db.get_game.return_value = {
+            "board": [[Game.EMPTY] * 6], "heights": [Decimal("0")]}
+        game = Game("1")
+        game.load_game()
+        self.assertIs(0, game.game["heights"][0])
+
+    @patch("src.server.game.game_cache", new_callable=GameCache)
+    @patch("src.server.game.db")
+    def test_load_cached_game(self, mock_db, mock_cache):
+        """Game only read again once its version has changed."""
+        mock_db.get_versioned_game.return_value = (3, {
+            "moves": [[1, "a", 1]], "heights": ["1", "0"], "rows": 2,
+            "cols": 2, "players": ["a", "b"]})
+        self.assertEqual(3, Game("1").load_cached_game(3))
+        game = Game("1")
+        self.assertEqual(3, game.load_cached_game(3))
+        self.assertEqual(1, mock_db.get_versioned_game.call_count)
+        self.assertListEqual([1, 0], game.game["heights"])
+        self.assertListEqual([["-", "x"], ["-", "-"]], game.board)
+        Game("1").load_cached_game(4)
+        self.assertEqual(2, mock_db.get_versioned_game.call_count)
+
+    @patch("src.server.game.game_cache", new_callable=GameCache)
+    @patch("src.server.game.db")
+    def test_load_cached_game_no_versions(self, mock_db, mock_cache):
+        """Db keeps no versions, the game is read every time."""
+        mock_db.get_versioned_game.return_value = (None, {
+            "board": [[Game.EMPTY] * 6], "heights": [0]})
+        self.assertIsNone(Game("1").load_cached_game(None))
+        Game("1").load_cached_game(None)
+        self.assertEqual(2, mock_db.get_versioned_game.call_count)
+        self.assertEqual(0, mock_cache.get_stats()["size"])
+
+    @patch("src.server.game.db")
+    def test_move_appended_to_log(self, mock_db):
+        """Only the new move is appended, the board is not saved."""
+        game = Game("1")
+        game.game = {"moves": [[2, "a", 1]], "heights": [0, 1] + [0] * 7,
+                     "players": ["a", "b"], "turn": "b", "max_players": 2}
+        self.assertFalse(game.move("b", 2))
+        self.assertListEqual([[2, "a", 1], [2, "b", 2]], game.game["moves"])
+        self.assertNotIn("board", game.game)
+        self.assertEqual(Game.Os, game.board[1][4])
+        mock_db.append_move.assert_called_once_with("1", game.game,
+                                                    [2, "b", 2])
+        self.assertFalse(mock_db.save_game.called)
+
+    @patch("src.server.game.db")
+    def test_move_off_the_board(self, mock_db):
+        """Invalid, the game isn't changed."""
+        game = Game("1")
+        game.game = {"moves": [], "heights": [0] * 9, "cols": 9,
+                     "players": ["a", "b"], "turn": "a", "max_players": 2}
+        for column in (0, 10, "3"):
+            self.assertIsNone(game.move("a", column))
+        self.assertListEqual([], game.game["moves"])
+        self.assertFalse(mock_db.append_move.called)
+
+    @patch("src.server.game.db")
+    def test_winning_move_appended_to_log(self, mock_db):
+        game = Game("1")
+        moves = [[column, name, number] for number, (column, name) in
+                 enumerate([(1, "a"), (1, "b"), (2, "a"), (2, "b"),
+                            (3, "a"), (3, "b"), (4, "a"), (4, "b")], 1)]
+        game.game = {"moves": moves, "heights": [2] * 4 + [0] * 5,
+                     "players": ["a", "b"], "turn": "a", "max_players": 2,
+                     "game_status": "playing"}
+        self.assertTrue(game.move("a", 5))
+        mock_db.append_move.assert_called_once_with("1", game.game,
+                                                    [5, "a", 9])
+
+    def test_replay_board(self):
+        game = Game.from_game({"players": ["a", "b", "c"], "cols": 3,
+                               "rows": 2})
+        board = game.replay_board([[1, "a", 1], [1, "b", 2], [3, "c", 3]])
+        self.assertListEqual([["o", "x"], ["-", "-"], ["-", "z"]], board)
+
+    def test_replay_board_full_column(self):
+        game = Game.from_game({"players": ["a", "b"], "cols": 3, "rows": 1})
+        with self.assertRaises(ValueError):
+            game.replay_board([[1, "a", 1], [1, "b", 2]])
+
+    def test_get_state_has_board_not_moves(self):
+        game = Game.from_game({"moves": [[1, "a", 1]], "players": ["a"],
+                               "cols": 2, "rows": 2, "turn": "a"})
+        self.assertDictEqual(
+            {"board": [["-", "x"], ["-", "-"]], "cols": 2, "rows": 2,
+             "players": ["a"], "turn": "a"}, game.get_state())
+
+    def test_get_state_compact_board(self):
+        game = Game.from_game({"moves": [[1, "a", 1]], "players": ["a"],
+                               "cols": 2, "rows": 2, "turn": "a"})
+        self.assertDictEqual({"board": "1:2:-x--", "turn": "a"},
+                             game.get_state(["turn", "board"], "compact"))
+
+    @patch("src.server.game.game_cache", new_callable=GameCache)
+    @patch("src.server.game.db")
+    def test_state_body_serialized_once(self, mock_db, mock_cache):
+        """Cached games are serialized once per version and board format."""
+        mock_db.get_versioned_game.return_value = (3, {
+            "moves": [], "heights": [0, 0], "rows": 2, "cols": 2,
+            "players": ["a", "b"], "turn": "a"})
+        serializer = Mock(dumps=Mock(side_effect=json.dumps))
+        serializer.name = "json"
+        for _ in range(2):
+            game = Game("1")
+            game.load_cached_game(3)
+            body = game.get_state_body(serializer, "compact")
+        self.assertEqual("1:2:----", json.loads(body)["board"])
+        self.assertEqual(1, serializer.dumps.call_count)
+        game.get_state_body(serializer)
+        self.assertEqual(2, serializer.dumps.call_count)
+        # unknown formats are the default, not a body each
+        for board_format in ("x0", "x1", None):
+            game.get_state_body(serializer, board_format)
+        self.assertEqual(2, serializer.dumps.call_count)
+        self.assertEqual(2, len(game._state_bodies))
+
+    @patch("src.server.game.db")
+    def test_toggle_turn_saves_turn_only(self, mock_db):
+        game = Game("1")
+        game.game = {"moves": [], "players": ["a", "b"], "turn": "a",
+                     "max_players": 2}
+        game.toggle_turn("a")
+        mock_db.save_fields.assert_called_once_with("1", game.game, ["turn"])
+        self.assertFalse(mock_db.save_game.called)
+
+    @patch("src.server.game.db")
+    def test_load_fields_board(self, mock_db):
+        """Fields the board is replayed from are loaded with the board."""
+        mock_db.get_fields.return_value = {
+            "moves": [[1, "a", 1]], "players": ["a"], "rows": 2, "cols": 2,
+            "turn": "a"}
+        game = Game("1")
+        game.load_fields(["board", "turn"])
+        mock_db.get_fields.assert_called_once_with(
+            "1", ["board", "cols", "moves", "players", "rows", "turn"])
+        self.assertDictEqual({"board": [["-", "x"], ["-", "-"]], "turn": "a"},
+                             game.get_state(["board", "turn"]))
+
+    @patch("src.server.game.db")
+    def test_play_move_atomic(self, mock_db):
+        """Db makes the move, its returned state is used, nothing saved."""
+        state = {"moves": [[1, "a", 1]], "turn": "b", "players": ["a", "b"]}
+        mock_db.ATOMIC_MOVES = True
+        mock_db.atomic_move.return_value = (False, state)
+        game = Game("1")
+        self.assertFalse(game.play_move("a", 1))
+        self.assertIs(state, game.game)
+        mock_db.atomic_move.assert_called_once_with("1", "a", 1)
+        self.assertFalse(mock_db.get_game.called)
+        self.assertFalse(mock_db.append_move.called)
+
+    @patch("src.server.game.db")
+    def test_play_move_atomic_legacy_game(self, mock_db):
+        """Db can't move the game, it's loaded and moved here."""
+        mock_db.ATOMIC_MOVES = True
+        mock_db.atomic_move.return_value = None
+        mock_db.get_game.return_value = {
+            "board": [[Game.EMPTY] * 6 for _ in range(9)],
+            "players": ["a", "b"], "turn": "a", "max_players": 2}
+        game = Game("1")
+        self.assertFalse(game.play_move("a", 1))
+        self.assertEqual("b", game.game["turn"])
+        self.assertTrue(mock_db.save_game.called)
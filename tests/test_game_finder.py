@@ -1,7 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
 from unittest.mock import patch
 
-from src.server.game_finder import RedisGameFinder
+from src.server.db import DB, MemoryDB
+from src.server.game_finder import DynamoGameFinder, RedisGameFinder
 
 
 class TestRedisGameFinder(TestCase):
@@ -11,7 +13,7 @@ class TestRedisGameFinder(TestCase):
            side_effect=[False, True])
     def test_join_existing_game_game_found(self, mock_join, mock_db):
         """Available game with space found, return game_id."""
-        mock_db.scan_games.return_value = ["1", "2", "3"]
+        mock_db.scan_open_games.return_value = ["1", "2", "3"]
         self.assertEqual("2", RedisGameFinder.join_game("foo"))
         self.assertEqual(2, mock_join.call_count)
 
@@ -20,8 +22,10 @@ class TestRedisGameFinder(TestCase):
            return_value=False)
     def test_join_existing_game_no_game_found(self, mock_join, mock_db):
         """No available game with space found, return None."""
-        mock_db.connection.scan_iter.return_value = ["1", "2", "3"]
+        mock_db.scan_open_games.return_value = ["1", "2", "3"]
         self.assertIsNone(RedisGameFinder.join_game("foo"))
+        self.assertEqual(3, mock_join.call_count)
+        self.assertFalse(mock_db.scan_games.called)
 
     @patch("src.server.game_finder.db")
     def test_2nd_player_joins_after_player1_has_moved(self, mock_db):
@@ -74,6 +78,7 @@ class TestRedisGameFinder(TestCase):
         }
         mock_db.get_game_transaction.return_value = test_game_state
         self.assertFalse(RedisGameFinder._join_game("mary", game_id))
+        mock_db.remove_open_game.assert_called_once_with(game_id)
 
     @patch("src.server.game_finder.db")
     def test_new_player_joins_this_game_already_full(self, mock_db):
@@ -102,3 +107,41 @@ class TestRedisGameFinder(TestCase):
         mock_db.get_game_transaction.return_value = test_game_state
         self.assertFalse(RedisGameFinder._join_game("terry", game_id))
         self.assertFalse(mock_db.save_game_transaction.called)
+
+
+class TestDynamoGameFinder(TestCase):
+
+    @patch("src.server.game_finder.db")
+    def test_join_game_queries_open_games(self, mock_db):
+        mock_db.query_open_games.return_value = [
+            {"game_id": "1", "turn": "dom", "players": ["dom"],
+             "game_status": "open", "max_players": 2}]
+        mock_db.save_game_transaction.return_value = True
+        self.assertEqual("1", DynamoGameFinder.join_game("mary"))
+        mock_db.query_open_games.assert_called_once_with("mary")
+        self.assertFalse(mock_db.scan_games.called)
+
+
+class TestMemoryGameFinder(TestCase):
+
+    def setUp(self):
+        DB._connection = None
+        self.db = MemoryDB("memory")
+        patcher = patch("src.server.game_finder.db", self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_joins(self):
+        """Every seat taken once, players racing for one retry the next."""
+        for number in range(20):
+            self.db.save_game(str(number), {
+                "game_id": str(number), "moves": [], "turn": None,
+                "players": [f"p{number}"], "max_players": 2,
+                "game_status": "open"})
+        with ThreadPoolExecutor(8) as executor:
+            joined = list(executor.map(
+                RedisGameFinder.join_game,
+                [f"joiner{number}" for number in range(20)]))
+        self.assertListEqual([str(number) for number in range(20)],
+                             sorted(joined, key=int))
+        self.assertListEqual([], list(self.db.scan_open_games()))
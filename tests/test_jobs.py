@@ -0,0 +1,119 @@
+import json
+import redis
+import time
+
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from src.server import jobs
+from src.server.ai import SearchResult
+from src.server.game import Game
+
+
+def new_game(turn="computer"):
+    game = Game("1")
+    game.game = {
+        "board": [[Game.EMPTY] * 6 for _ in range(9)],
+        "heights": [0] * 9,
+        "players": ["dave", "computer"],
+        "turn": turn,
+        "max_players": 2,
+        "opponent": "computer",
+        "game_status": "playing",
+    }
+    return game
+
+
+class TestFinishJob(TestCase):
+
+    @patch("src.server.game.db")
+    def test_finish_job_computer_turn_played(self, mock_db):
+        game = new_game()
+        job = jobs.new_job(jobs.COMPUTER_TURN, game, "computer")
+        jobs.finish_job(job, SearchResult(4, 0, 1, 1, 0.1), game)
+        self.assertEqual(Game.Os, game.game["board"][4][5])
+        self.assertEqual("dave", game.game["turn"])
+        mock_db.save_game.assert_called_once_with("1", game.game)
+
+    @patch("src.server.game.db")
+    def test_finish_job_game_has_changed(self, mock_db):
+        """A move was made since the job was queued, drop the result."""
+        game = new_game()
+        job = jobs.new_job(jobs.COMPUTER_TURN, game, "computer")
+        game.game["heights"][0] = 1
+        jobs.finish_job(job, SearchResult(4, 0, 1, 1, 0.1), game)
+        self.assertFalse(mock_db.save_game.called)
+
+    @patch("src.server.game.db")
+    def test_finish_job_hint_saved(self, mock_db):
+        game = new_game(turn="dave")
+        job = jobs.new_job(jobs.HINT, game, "dave")
+        jobs.finish_job(job, SearchResult(2, 0, 1, 1, 0.1), game, 3)
+        self.assertEqual({"name": "dave", "column": 3}, game.game["hint"])
+        mock_db.save_fields_if_version.assert_called_once_with(
+            "1", game.game, ["hint"], 3)
+        self.assertFalse(mock_db.save_game.called)
+
+
+class TestProcessPoolJobQueue(TestCase):
+
+    @patch("src.server.jobs.finish_job")
+    def test_submit_searched_in_pool(self, mock_finish):
+        """Search runs in the pool, result written back, stats recorded."""
+        job_queue = jobs.ProcessPoolJobQueue(workers=1)
+        job_queue.submit(jobs.COMPUTER_TURN, new_game(), "computer")
+        deadline = time.time() + 30
+        while job_queue.get_stats()["completed"] == 0:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.05)
+        job_queue.executor.shutdown()
+        job, result = mock_finish.call_args[0]
+        self.assertEqual("computer", job["name"])
+        self.assertIsNotNone(result.column)
+        stats = job_queue.get_stats()
+        self.assertEqual(0, stats["queue_depth"])
+        self.assertEqual(0, stats["failed"])
+        self.assertGreater(stats["max_latency"], 0)
+
+
+class TestRedisJobQueue(TestCase):
+
+    def setUp(self):
+        self.job_queue = jobs.RedisJobQueue()
+        self.job_queue._connection = Mock()
+
+    def test_submit_pushed_on_list(self):
+        self.job_queue.submit(jobs.HINT, new_game(turn="dave"), "dave")
+        key, job = self.job_queue.connection.lpush.call_args[0]
+        self.assertEqual("connect5:jobs", key)
+        self.assertEqual("hint", json.loads(job)["type"])
+
+    @patch("src.server.jobs.run_job")
+    def test_work_runs_popped_job(self, mock_run):
+        job = {"type": "hint", "game_id": "1", "queued_at": time.time()}
+        self.job_queue.connection.brpop.side_effect = [
+            None, ("connect5:jobs", json.dumps(job))]
+        self.job_queue.connection.hget.return_value = None
+        self.job_queue.work(max_jobs=1)
+        mock_run.assert_called_once_with(job)
+        self.job_queue.connection.hset.assert_called_once()
+
+    @patch("src.server.jobs.run_job")
+    def test_work_survives_socket_timeout(self, mock_run):
+        """An empty queue can time out the socket before the BRPOP."""
+        job = {"type": "hint", "game_id": "1", "queued_at": time.time()}
+        self.job_queue.connection.brpop.side_effect = [
+            redis.TimeoutError(), ("connect5:jobs", json.dumps(job))]
+        self.job_queue.connection.hget.return_value = None
+        self.job_queue.work(max_jobs=1)
+        mock_run.assert_called_once_with(job)
+
+    def test_get_stats(self):
+        self.job_queue.connection.hgetall.return_value = {
+            "completed": "4", "failed": "1", "total_latency": "2.0",
+            "max_latency": "1.5"}
+        self.job_queue.connection.llen.return_value = 7
+        self.assertEqual(
+            {"completed": 4, "failed": 1, "average_latency": 0.5,
+             "max_latency": 1.5, "queue_depth": 7},
+            self.job_queue.get_stats())
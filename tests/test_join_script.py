@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from src.server.db import DB, RedisScriptDB
+from src.server.game import Game
+from src.server.game_finder import GameFinder, RedisScriptGameFinder
+from tests.redis_scripts import ScriptRedis, lupa
+
+
+def new_game(game_id, players, max_players=2, turn=None):
+    return {
+        "game_id": game_id, "moves": [], "players": list(players),
+        "max_players": max_players, "turn": turn,
+        "game_status": Game.OPEN,
+    }
+
+
+@skipUnless(lupa, "lupa is needed to run the Lua script")
+class TestJoinScript(TestCase):
+
+    def setUp(self):
+        self.redis = ScriptRedis()
+        DB._connection = None
+        patcher = patch("src.server.db.RedisScriptDB._get_connection",
+                        return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = RedisScriptDB("redis_script")
+        patcher = patch("src.server.game_finder.db", self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def open_games(self):
+        return list(self.redis.sorted_sets.get(self.db.OPEN_GAMES_KEY, {}))
+
+    def test_same_as_add_player(self):
+        """Script changes the game as GameFinder.add_player does."""
+        for game in [new_game("1", ["a"]),
+                     new_game("1", ["a"], turn="a"),
+                     new_game("1", ["a"], max_players=3),
+                     new_game("1", ["a", "b"], max_players=3, turn="a")]:
+            self.redis.save_game(self.db, "1", game)
+            self.assertEqual("1", RedisScriptGameFinder.join_game("z"))
+            expected = GameFinder.add_player(
+                dict(game, players=list(game["players"])), "z")
+            self.assertDictEqual(expected, self.redis.load_game(self.db, "1"))
+            self.assertEqual(expected["game_status"] == Game.OPEN,
+                             "1" in self.open_games())
+
+    def test_oldest_game_not_joined_yet(self):
+        self.redis.save_game(self.db, "1", new_game("1", ["z"]), opened_at=1)
+        self.redis.save_game(self.db, "2", new_game("2", ["a"]), opened_at=2)
+        self.redis.save_game(self.db, "3", new_game("3", ["b"]), opened_at=3)
+        self.assertEqual("2", RedisScriptGameFinder.join_game("z"))
+        self.assertEqual(["1", "3"], self.open_games())
+        self.assertEqual({"connect5:version:2": "1"}, self.redis.strings)
+
+    def test_games_no_longer_open_dropped(self):
+        self.redis.save_game(self.db, "1", new_game("1", ["a"]))
+        self.redis.hashes["1"]["game_status"] = '"disconnected"'
+        self.db.OPEN_GAMES_PAGE_SIZE = 1
+        self.redis.save_game(self.db, "2", new_game("2", ["b"]), opened_at=1)
+        self.assertEqual("2", RedisScriptGameFinder.join_game("z"))
+        self.assertEqual([], self.open_games())
+
+    def test_games_without_status_dropped(self):
+        """A hash missing its status is skipped, the script doesn't fail."""
+        self.redis.save_game(self.db, "1", new_game("1", ["a"]))
+        del self.redis.hashes["1"]["game_status"]
+        self.assertIsNone(RedisScriptGameFinder.join_game("z"))
+        self.assertEqual([], self.open_games())
+
+    def test_no_open_game(self):
+        self.assertIsNone(RedisScriptGameFinder.join_game("z"))
+
+    def test_concurrent_joins(self):
+        """Every joiner gets a seat first time, in O(joiners) commands."""
+        seats = 0
+        for number in range(40):
+            max_players = 2 + number % 2
+            self.redis.save_game(
+                self.db, str(number), new_game(str(number), [f"p{number}"],
+                                               max_players),
+                opened_at=number)
+            seats += max_players - 1
+        names = [f"joiner{number}" for number in range(seats)]
+        with ThreadPoolExecutor(16) as executor:
+            joined = list(executor.map(RedisScriptGameFinder.join_game,
+                                       names))
+
+        self.assertNotIn(None, joined)
+        self.assertEqual([], self.open_games())
+        for number in range(40):
+            game = self.redis.load_game(self.db, str(number))
+            self.assertEqual(game["max_players"], len(game["players"]))
+            self.assertEqual(Game.PLAYING, game["game_status"])
+            for name in game["players"][1:]:
+                self.assertEqual(str(number), joined[names.index(name)])
+        self.assertLessEqual(self.redis.calls, 6 * len(names))
+        # with no seats left, the next joiner is told straight away
+        self.assertIsNone(RedisScriptGameFinder.join_game("late"))
@@ -0,0 +1,27 @@
+from unittest import TestCase
+
+from src.server.lines import get_winning_lines
+
+
+class TestLines(TestCase):
+
+    def test_winning_lines_corner_cell(self):
+        """Top left corner: one vertical, one horizontal, one diagonal."""
+        lines = get_winning_lines(9, 6, 5)
+        self.assertCountEqual(
+            [((0, 0), (0, 1), (0, 2), (0, 3), (0, 4)),
+             ((0, 0), (1, 0), (2, 0), (3, 0), (4, 0)),
+             ((0, 0), (1, 1), (2, 2), (3, 3), (4, 4))],
+            lines[(0, 0)])
+
+    def test_winning_lines_count(self):
+        """Every line is reachable from each of its cells."""
+        lines = get_winning_lines(4, 4, 4)
+        all_lines = {line for cell_lines in lines.values()
+                     for line in cell_lines}
+        # 4 vertical, 4 horizontal and 2 diagonal
+        self.assertEqual(10, len(all_lines))
+
+    def test_winning_lines_memoized(self):
+        self.assertIs(get_winning_lines(15, 15, 5),
+                      get_winning_lines(15, 15, 5))
@@ -0,0 +1,126 @@
+import json
+import random
+
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from src.server.db import DB, RedisScriptDB
+from src.server.game import Game
+from tests.redis_scripts import ScriptRedis, lupa
+
+
+def new_game(players, max_players=None, rows=6, cols=9, winning_count=5):
+    max_players = max_players or len(players)
+    return {
+        "game_id": "1", "moves": [], "heights": [0] * cols, "rows": rows,
+        "cols": cols, "winning_count": winning_count,
+        "players": list(players), "max_players": max_players,
+        "turn": players[0],
+        "game_status": Game.PLAYING if len(players) == max_players
+        else Game.OPEN,
+    }
+
+
+@skipUnless(lupa, "lupa is needed to run the Lua script")
+@patch("src.server.game.db")
+class TestMoveScript(TestCase):
+
+    def setUp(self):
+        self.redis = ScriptRedis()
+        DB._connection = None
+        patcher = patch("src.server.db.RedisScriptDB._get_connection",
+                        return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = RedisScriptDB("redis_script")
+
+    def move(self, name, column):
+        return self.db.atomic_move("1", name, column)
+
+    def play_both(self, game_doc, columns):
+        """Play the columns in turn with the script and with Game.move.
+
+        Check both give the same move results and the same game state.
+        """
+        self.redis.save_game(self.db, "1", game_doc)
+        game = Game.from_game(json.loads(json.dumps(game_doc)))
+        for column in columns:
+            name = game.game["turn"]
+            if name is None or game.game["game_status"] == Game.WON:
+                break
+            outcome, stored = self.move(name, column)
+            self.assertEqual(game.move(name, column), outcome)
+            self.assertDictEqual(game.game, stored)
+        return game
+
+    def test_same_as_game_engine(self, mock_db):
+        """Random games on different board sizes, including full columns."""
+        rand = random.Random(5)
+        for rows, cols, winning_count, num_players in [
+                (6, 9, 5, 2), (6, 9, 5, 3), (4, 4, 3, 2), (5, 7, 4, 2),
+                (3, 3, 3, 3)]:
+            for _ in range(15):
+                players = ["a", "b", "c"][:num_players]
+                columns = [rand.randint(1, cols)
+                           for _ in range(rows * cols * 2)]
+                self.play_both(new_game(players, rows=rows, cols=cols,
+                                        winning_count=winning_count),
+                               columns)
+
+    def test_winning_move(self, mock_db):
+        game = self.play_both(new_game(["a", "b"]),
+                              [1, 1, 2, 2, 3, 3, 4, 4, 5])
+        self.assertEqual(Game.WON, game.game["game_status"])
+
+    @patch("src.server.db.FINISHED_GAME_TTL", 60)
+    def test_won_game_expires(self, mock_db):
+        self.play_both(new_game(["a", "b"]), [1, 1, 2, 2, 3, 3, 4, 4])
+        self.assertDictEqual({}, self.redis.expires)
+        self.move("a", 5)
+        self.assertDictEqual(
+            {"1": 60, "connect5:moves:1": 60, "connect5:version:1": 60},
+            self.redis.expires)
+
+    def test_not_players_turn(self, mock_db):
+        self.redis.save_game(self.db, "1", new_game(["a", "b"]))
+        outcome, stored = self.move("b", 1)
+        self.assertEqual(Game.NOT_TURN, outcome)
+        self.assertEqual([], stored["moves"])
+
+    def test_game_over(self, mock_db):
+        self.redis.save_game(self.db, "1",
+                             dict(new_game(["a", "b"]), game_status="won"))
+        outcome, _ = self.move("a", 1)
+        self.assertEqual(Game.NOT_TURN, outcome)
+
+    def test_next_player_not_joined(self, mock_db):
+        """Open 3 player game, no one's turn until the 3rd player joins."""
+        self.redis.save_game(self.db, "1", new_game(["a", "b"], 3))
+        self.move("a", 1)
+        outcome, stored = self.move("b", 1)
+        self.assertFalse(outcome)
+        self.assertIsNone(stored["turn"])
+        self.assertIn("1", self.redis.sorted_sets[self.db.OPEN_GAMES_KEY])
+
+    def test_hint_removed(self, mock_db):
+        self.redis.save_game(self.db, "1", dict(
+            new_game(["a", "b"]), hint={"name": "a", "column": 3}))
+        _, stored = self.move("a", 3)
+        self.assertNotIn("hint", stored)
+
+    def test_version_bumped(self, mock_db):
+        """Moves increment the version and publish, rejected moves don't."""
+        self.redis.save_game(self.db, "1", new_game(["a", "b"]))
+        self.move("a", 1)
+        self.move("a", 2)
+        self.move("b", 2)
+        self.assertEqual("2", self.redis.strings["connect5:version:1"])
+        self.assertEqual([("connect5:changes", "1")] * 2,
+                         self.redis.published)
+
+    def test_game_before_move_log(self, mock_db):
+        game = new_game(["a", "b"])
+        del game["moves"]
+        game["board"] = [[Game.EMPTY] * 6 for _ in range(9)]
+        self.redis.save_game(self.db, "1", game)
+        self.assertIsNone(self.move("a", 1))
@@ -0,0 +1,79 @@
+from unittest import TestCase
+
+from src.server import replay
+from src.server.game import Game
+
+# a plays columns 1 to 5 along the bottom row, b plays on top of a
+WINNING_MOVES = [(1, "a"), (1, "b"), (2, "a"), (2, "b"), (3, "a"), (3, "b"),
+                 (4, "a"), (4, "b"), (5, "a")]
+
+
+def new_game(moves, game_status="won", turn="a", heights=None):
+    return {
+        "game_id": "1", "players": ["a", "b"], "max_players": 2,
+        "moves": [[column, name, number]
+                  for number, (column, name) in enumerate(moves, 1)],
+        "heights": heights or [2, 2, 2, 2, 1, 0, 0, 0, 0],
+        "game_status": game_status, "turn": turn,
+    }
+
+
+class TestReplay(TestCase):
+
+    def test_won_game_matches(self):
+        result = replay.replay_game(new_game(WINNING_MOVES))
+        self.assertEqual("a", result["winner"])
+        self.assertEqual(9, result["moves"])
+        self.assertEqual([], result["problems"])
+
+    def test_playing_game_matches(self):
+        result = replay.replay_game(new_game(
+            WINNING_MOVES[:2], Game.PLAYING, heights=[2] + [0] * 8))
+        self.assertIsNone(result["winner"])
+        self.assertEqual([], result["problems"])
+
+    def test_winning_move_but_not_won(self):
+        result = replay.replay_game(new_game(WINNING_MOVES, Game.PLAYING))
+        self.assertEqual([replay.NOT_WON], result["problems"])
+
+    def test_won_without_winning_move(self):
+        result = replay.replay_game(new_game(
+            WINNING_MOVES[:2], heights=[2] + [0] * 8))
+        self.assertEqual([replay.NO_WINNING_MOVE], result["problems"])
+
+    def test_wrong_winner(self):
+        result = replay.replay_game(new_game(WINNING_MOVES, turn="b"))
+        self.assertEqual([replay.WRONG_WINNER], result["problems"])
+
+    def test_heights_mismatch(self):
+        result = replay.replay_game(new_game(WINNING_MOVES,
+                                             heights=[0] * 9))
+        self.assertEqual([replay.HEIGHTS_MISMATCH], result["problems"])
+
+    def test_move_out_of_turn(self):
+        result = replay.replay_game(new_game([(1, "a"), (2, "a")]))
+        self.assertEqual([replay.MOVE_OUT_OF_TURN], result["problems"])
+
+    def test_move_into_full_column(self):
+        moves = [(1, "a" if number % 2 else "b") for number in range(1, 8)]
+        result = replay.replay_game(new_game(moves))
+        self.assertEqual([replay.ILLEGAL_MOVE], result["problems"])
+
+    def test_move_after_win(self):
+        result = replay.replay_game(new_game(WINNING_MOVES + [(6, "b")]))
+        self.assertEqual([replay.MOVE_AFTER_WIN], result["problems"])
+
+    def test_no_move_log(self):
+        game = new_game([])
+        del game["moves"]
+        result = replay.replay_game(game)
+        self.assertEqual([replay.NO_MOVE_LOG], result["problems"])
+
+    def test_replay_games_in_order(self):
+        games = [dict(new_game(WINNING_MOVES), game_id=str(number))
+                 for number in range(7)]
+        results = list(replay.replay_games(iter(games), processes=2,
+                                           chunk_size=2))
+        self.assertEqual([str(number) for number in range(7)],
+                         [result["game_id"] for result in results])
+        self.assertTrue(all(result["winner"] == "a" for result in results))
@@ -0,0 +1,34 @@
+import json
+import os
+
+from decimal import Decimal
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from src.server import serializers
+
+
+class TestSerializers(TestCase):
+
+    def test_json_default(self):
+        with patch.dict(os.environ, clear=True):
+            serializer = serializers.get_serializer()
+        self.assertEqual("json", serializer.name)
+        self.assertEqual('{"turn": "a", "heights": [1, 2]}',
+                         serializer.dumps({"turn": "a", "heights": [1, 2]}))
+        self.assertEqual('{"rows": 6}',
+                         serializer.dumps({"rows": Decimal("6")}))
+
+    @skipUnless(serializers.orjson, "orjson is not installed")
+    def test_orjson_same_json(self):
+        with patch.dict(os.environ, {"CONNECT_5_SERIALIZER": "orjson"}):
+            serializer = serializers.get_serializer()
+        state = {"board": "1:2:-x--", "heights": [1, 0], "turn": None,
+                 "players": ["a", "b"], "rows": Decimal("2")}
+        self.assertEqual(json.loads(json.dumps(dict(state, rows=2))),
+                         json.loads(serializer.dumps(state)))
+
+    @patch("src.server.serializers.orjson", None)
+    def test_orjson_not_installed(self):
+        with self.assertRaises(ImportError):
+            serializers.ORJSONSerializer()
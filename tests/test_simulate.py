@@ -0,0 +1,54 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.server import simulate
+from src.server.game import Game
+
+
+class TestSimulate(TestCase):
+
+    @patch("src.server.game.db")
+    def _replay_through_game(self, num_players, policy, mock_db):
+        """Simulated games have the same outcome when played through Game."""
+        result = simulate.simulate(300, num_players, policy=policy, seed=7,
+                                   batch_size=128, record_moves=True)
+        players = [str(num) for num in range(num_players)]
+        for winner, length, moves in zip(*result[:3]):
+            game = Game("1")
+            game.game = {
+                "board": [[Game.EMPTY] * 6 for _ in range(9)],
+                "heights": [0] * 9, "players": list(players),
+                "turn": players[0], "max_players": num_players,
+            }
+            for move_number, column in enumerate(moves[:length], 1):
+                turn = game.game["turn"]
+                move_result = game.move(turn, int(column) + 1)
+                self.assertIsNotNone(move_result)
+                if move_result is True:
+                    break
+            self.assertEqual(length, move_number)
+            if winner:
+                self.assertTrue(move_result)
+                self.assertEqual(players[winner - 1], game.game["turn"])
+            else:
+                self.assertFalse(move_result)
+                self.assertEqual(54, length)
+            self.assertTrue((moves[length:] == -1).all())
+
+    def test_same_rules_as_game_2_players(self):
+        self._replay_through_game(2, simulate.RANDOM_POLICY)
+
+    def test_same_rules_as_game_3_players(self):
+        self._replay_through_game(3, simulate.CENTRE_POLICY)
+
+    def test_simulate_outcomes(self):
+        result = simulate.simulate(1000, seed=1, batch_size=300)
+        self.assertEqual(1000, len(result.winners))
+        self.assertIsNone(result.moves)
+        self.assertTrue(((result.winners >= 0) & (result.winners <= 2)).all())
+        self.assertTrue((result.lengths >= 9).all())
+
+    def test_simulate_seeded(self):
+        first = simulate.simulate(100, seed=3, record_moves=True)
+        second = simulate.simulate(100, seed=3, record_moves=True)
+        self.assertTrue((first.moves == second.moves).all())
@@ -3,7 +3,8 @@ import json
 from unittest import TestCase
 from decimal import Decimal
 
-from src.server.utils import DecimalEncoder
+from src.server.utils import (
+    DecimalEncoder, encode_board, decode_board, replace_decimals)
 
 
 class TestUtils(TestCase):
@@ -19,3 +20,24 @@ class TestUtils(TestCase):
         expected_dumped = '{"max_players": 2, "game_id": "1234"}'
         self.assertEqual(dumped, expected_dumped)
         self.assertIs(json.loads(dumped)["max_players"], 2)
+
+    def test_replace_decimals(self):
+        item = {"heights": [Decimal("0"), Decimal("2")],
+                "moves": [[Decimal("3"), "a", Decimal("1")]],
+                "rate": Decimal("0.5"), "name": "a"}
+        self.assertEqual({"heights": [0, 2], "moves": [[3, "a", 1]],
+                          "rate": 0.5, "name": "a"}, replace_decimals(item))
+        self.assertIs(int, type(item["heights"][1]))
+
+    def test_encode_board_compact(self):
+        """Board encoded as version, rows and cells column by column."""
+        board = [["-", "-", "x"], ["-", "o", "x"]]
+        self.assertEqual("1:3:--x-ox", encode_board(board))
+
+    def test_decode_board_round_trip(self):
+        board = [["-"] * 5 + ["x"] for _ in range(8)] + [["o"] * 6]
+        self.assertListEqual(board, decode_board(encode_board(board)))
+
+    def test_decode_board_unknown_version(self):
+        with self.assertRaises(ValueError):
+            decode_board("9:3:--x-ox")
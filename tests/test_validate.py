@@ -0,0 +1,129 @@
+from unittest import TestCase
+
+from src.server import validate
+from src.server.game import Game
+
+
+def new_game(game_id, board, game_status="playing", max_players=2):
+    return {"game_id": game_id, "board": board, "game_status": game_status,
+            "max_players": max_players}
+
+
+def empty_board():
+    return [[Game.EMPTY] * 6 for _ in range(9)]
+
+
+class TestValidate(TestCase):
+
+    def validate(self, *games):
+        return list(validate.validate_games(games, chunk_size=2))
+
+    def test_won_game(self):
+        board = empty_board()
+        for column in range(5):
+            board[column][5] = Game.Xs
+        for column in range(4):
+            board[column][4] = Game.Os
+        result, = self.validate(new_game("1", board, "won"))
+        self.assertEqual(["x"], result["winners"])
+        self.assertEqual([], result["problems"])
+        self.assertFalse(result["full"])
+
+    def test_winning_line_but_not_won(self):
+        board = empty_board()
+        for column in range(5):
+            board[column][5] = Game.Xs
+        for column in range(4):
+            board[column][4] = Game.Os
+        result, = self.validate(new_game("1", board))
+        self.assertEqual([validate.NOT_WON], result["problems"])
+
+    def test_floating_disc(self):
+        board = empty_board()
+        board[2][3] = Game.Xs
+        result, = self.validate(new_game("1", board))
+        self.assertEqual([validate.FLOATING_DISCS], result["problems"])
+
+    def test_impossible_disc_counts(self):
+        """Os have more discs than Xs, who always go first."""
+        board = empty_board()
+        board[0][5] = board[1][5] = Game.Os
+        board[2][5] = Game.Xs
+        result, = self.validate(new_game("1", board))
+        self.assertEqual([validate.BAD_DISC_COUNTS], result["problems"])
+
+    def test_third_players_disc_in_two_player_game(self):
+        board = empty_board()
+        board[0][5] = Game.Xs
+        board[1][5] = Game.Zs
+        result, = self.validate(new_game("1", board))
+        self.assertEqual([validate.BAD_DISC_COUNTS], result["problems"])
+
+    def test_three_player_counts(self):
+        board = empty_board()
+        board[0][5], board[1][5], board[2][5] = Game.Xs, Game.Os, Game.Zs
+        board[3][5] = Game.Xs
+        result, = self.validate(new_game("1", board, max_players=3))
+        self.assertEqual([], result["problems"])
+
+    def test_full_board_draw(self):
+        board = [[Game.Xs, Game.Xs, Game.Os, Game.Os, Game.Xs, Game.Xs]
+                 if column % 2 else
+                 [Game.Os, Game.Os, Game.Xs, Game.Xs, Game.Os, Game.Os]
+                 for column in range(9)]
+        result, = self.validate(new_game("1", board))
+        self.assertTrue(result["full"])
+        self.assertEqual([], result["winners"])
+
+    def test_malformed_board(self):
+        board = empty_board()
+        board[3] = board[3][:2]
+        result, = self.validate(new_game("1", board))
+        self.assertEqual([validate.MALFORMED_BOARD], result["problems"])
+
+    def test_malformed_cells_and_sizes_reported(self):
+        """One bad game is reported, the others still checked."""
+        board = empty_board()
+        board[2][5] = "xx"
+        no_max_players = new_game("4", empty_board())
+        del no_max_players["max_players"]
+        games = [new_game("1", empty_board()), new_game("2", board),
+                 dict(new_game("3", empty_board()), max_players=None),
+                 no_max_players]
+        results = self.validate(*games)
+        self.assertEqual([], results[0]["problems"])
+        for result in results[1:]:
+            self.assertEqual([validate.MALFORMED_BOARD], result["problems"])
+
+    def test_mixed_board_sizes_keep_order(self):
+        small = [[Game.EMPTY] * 4 for _ in range(4)]
+        small[0][3] = small[1][3] = small[2][3] = Game.Os
+        small[0][2] = small[1][2] = small[2][2] = small[3][3] = Game.Xs
+        games = [new_game("1", empty_board()),
+                 dict(new_game("2", small, "won"), winning_count=3),
+                 new_game("3", empty_board())]
+        results = self.validate(*games)
+        self.assertEqual(["1", "2", "3"],
+                         [result["game_id"] for result in results])
+        small_result = results[1]
+        self.assertEqual(["x", "o"], small_result["winners"])
+        self.assertIn(validate.SEVERAL_WINNERS, small_result["problems"])
+
+    def test_move_log_replayed(self):
+        moves = [[column, name, number] for number, (column, name) in
+                 enumerate([(1, "a"), (1, "b"), (2, "a"), (2, "b"),
+                            (3, "a"), (3, "b"), (4, "a"), (4, "b"),
+                            (5, "a")], 1)]
+        game = {"game_id": "1", "moves": moves, "players": ["a", "b"],
+                "game_status": "won", "max_players": 2}
+        result, = self.validate(game)
+        self.assertEqual(["x"], result["winners"])
+        self.assertEqual([], result["problems"])
+
+    def test_move_log_into_full_column(self):
+        moves = [[1, "a" if number % 2 else "b", number]
+                 for number in range(1, 8)]
+        game = {"game_id": "1", "moves": moves, "players": ["a", "b"],
+                "game_status": "playing", "max_players": 2}
+        result, = self.validate(game)
+        self.assertEqual([validate.MALFORMED_BOARD], result["problems"])